@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from core_users.models import CustomUser, UserProfile
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from core_permissions.utils import PermissionCache
 
 class CustomUserSerializer(serializers.ModelSerializer):
     """Serializer para el modelo CustomUser"""
@@ -23,6 +24,10 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         token['user_id'] = user.id
         token['is_verified'] = user.is_verified
         
+        # 🔥 PERMISOS EFECTIVOS COMO VECTOR DE BITS (con sello de versión)
+        for claim, value in PermissionCache.get_user_permission_vector(user.id).to_claims().items():
+            token[claim] = value
+        
         return token
 
 class UserProfileSerializer(serializers.ModelSerializer):
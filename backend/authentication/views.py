@@ -12,6 +12,7 @@ from rest_framework_simplejwt.exceptions import TokenError
 
 # MODELOS DEL CORE
 from core_users.models import CustomUser, UserProfile
+from core_permissions.utils import PermissionCache
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
@@ -168,6 +169,10 @@ def create_or_get_user(google_data: dict):
         refresh['email'] = user.email
         refresh['user_id'] = user.id
         
+        # 🔥 PERMISOS EFECTIVOS COMO VECTOR DE BITS (con sello de versión)
+        for claim, value in PermissionCache.get_user_permission_vector(user.id).to_claims().items():
+            refresh[claim] = value
+        
         print(f"✅ [BACKEND] Login JWT exitoso para: {email}")
         
         return Response({
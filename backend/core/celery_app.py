@@ -36,6 +36,30 @@ app.conf.beat_schedule = {
         'task': 'notifications.tasks.retry_failed_notifications',
         'schedule': crontab(minute=0),  # Cada hora en el minuto 0
     },
+    
+    # Pre-crear particiones futuras de auditoría cada día a las 1:00 AM
+    'ensure-audit-log-partitions-daily': {
+        'task': 'core_audit.tasks.ensure_audit_log_partitions',
+        'schedule': crontab(hour=1, minute=0),
+    },
+    
+    # Agregar rollups de auditoría cada 15 minutos
+    'refresh-audit-rollups': {
+        'task': 'core_audit.tasks.refresh_audit_rollups',
+        'schedule': crontab(minute='*/15'),
+    },
+    
+    # Archivar/eliminar particiones de auditoría antiguas cada día a las 3:00 AM
+    'apply-audit-retention-daily': {
+        'task': 'core_audit.tasks.apply_audit_retention',
+        'schedule': crontab(hour=3, minute=0),
+    },
+    
+    # Aplicar vencimientos/activaciones de roles y permisos temporales cada 5 minutos
+    'sweep-assignment-expiry': {
+        'task': 'core_permissions.tasks.sweep_assignment_expiry',
+        'schedule': crontab(minute='*/5'),
+    },
 }
 
 # Auto-descubrir tasks en todas las apps de Django
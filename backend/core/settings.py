@@ -75,6 +75,9 @@ EMAIL_HOST_USER = 'your-email@gmail.com'
 EMAIL_HOST_PASSWORD = 'your-app-password'
 DEFAULT_FROM_EMAIL = 'noreply@yourapp.com'
 
+# Redis (en docker-compose el host es 'redis'); cada uso elige su base
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379')
+
 # Configuración Celery (opcional, para procesamiento en background)
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
 CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
@@ -236,15 +239,113 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
+# Con REDIS_URL (o CACHE_REDIS_URL) el caché es Redis y lo comparten todos
+# los procesos (web y Celery): las invalidaciones por versión de permisos y
+# el ETag del árbol de departamentos se ven en todos. Sin Redis se usa
+# LocMemCache, que es por proceso.
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL') or (f'{REDIS_URL}/2' if os.getenv('REDIS_URL') else None)
+
+if CACHE_REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+            'OPTIONS': {
+                'socket_timeout': 0.5,
+                'socket_connect_timeout': 0.5,
+            },
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'unique-snowflake',
+        }
     }
-}
 
 # Tiempo de caché para permisos (segundos)
 PERMISSION_CACHE_TIMEOUT = 300  # 5 minutos
+PERMISSION_CACHE_ALIAS = 'default'  # Alias de CACHES (compartido entre procesos solo si es Redis)
+PERMISSION_CACHE_RETRY_BACKOFF = 5  # Segundos en el caché local tras un error del backend (se duplica hasta 300)
+PERMISSION_BATCH_CHECK_MAX_SIZE = 5000  # Máximo de usuarios × permisos por verificación en lote
+
+# Barrido de vigencias de roles/permisos temporales (core_permissions.expiry)
+PERMISSION_EXPIRY = {
+    'INITIAL_LOOKBACK_HOURS': 24,
+    'SYNC_AUTH_PERMISSIONS': True,
+}
+
+# Escritura de logs de auditoría en lotes (core_audit.writer)
+AUDIT_LOG_WRITER = {
+    'MODE': 'async',          # 'sync' escribe cada log inmediatamente (tests)
+    'BATCH_SIZE': 200,        # Registros por bulk_create
+    'FLUSH_INTERVAL': 2.0,    # Segundos máximos que un log espera en cola
+    'MAX_QUEUE_SIZE': 10000,  # Cola acotada (backpressure)
+    'ENQUEUE_TIMEOUT': 0.5,   # Espera con la cola llena antes de escribir en línea
+}
+
+# Particionado mensual de core_audit_logs (core_audit.partitions, solo PostgreSQL)
+AUDIT_LOG_PARTITIONING = {
+    'MONTHS_AHEAD': 3,                      # Particiones futuras a pre-crear
+    'ARCHIVE_MODE': 'file',                 # 'file' (COPY a .csv.gz) o 'tablespace'
+    'ARCHIVE_TABLESPACE': None,             # Tablespace comprimido para modo 'tablespace'
+    'ARCHIVE_DIR': BASE_DIR / 'audit_archive',
+}
+
+# Rollups horarios/diarios de auditoría (core_audit.rollups)
+AUDIT_ROLLUPS = {
+    'GRACE_SECONDS': 300,           # Espera tras el cierre de cada hora antes de agregarla
+    'MAX_HOURS_PER_RUN': 24 * 31,   # Horas agregadas como máximo por ejecución
+}
+
+# Contador de logins fallidos por ventana deslizante (core_audit.detectors)
+AUDIT_FAILED_LOGIN_COUNTER = {
+    'BACKEND': 'redis',                     # 'redis' (compartido) o 'memory' (por proceso)
+    'REDIS_URL': os.getenv('AUDIT_FAILED_LOGIN_REDIS_URL', f'{REDIS_URL}/1'),
+    'KEY_PREFIX': 'core_audit:failed_login',
+    'SOCKET_TIMEOUT': 0.5,                  # Segundos por operación/conexión con Redis
+    'RETRY_BACKOFF': 5,                     # Espera inicial antes de reintentar Redis tras un error
+    'RETRY_BACKOFF_MAX': 300,               # Espera máxima (el backoff se duplica en cada fallo)
+}
+
+# Reglas de seguridad adicionales (core_audit.rules). Se suman a
+# DEFAULT_SECURITY_RULES; el mismo 'name' reemplaza una regla por defecto.
+# Ejemplo:
+#   {'name': 'bulk_delete_burst', 'action_types': ['bulk_delete'],
+#    'rate': {'threshold': 3, 'window_minutes': 10, 'per': ['user']},
+#    'event_type': 'suspicious_activity', 'severity': 'high'}
+AUDIT_SECURITY_RULES = []
+
+# Deduplicación de SecurityEvent automáticos por (event_type, usuario, bucket)
+AUDIT_SECURITY_EVENT_DEDUP = {
+    'BUCKET_MINUTES': 60,       # Tamaño del bucket de tiempo de la clave
+    'MAX_RELATED_LOGS': 100,    # Logs enlazados por evento (el resto solo cuenta)
+}
+
+# Modelos auditados (core_audit.registry). Los no listados no generan auditoría.
+# Opciones: 'fields', 'exclude', 'severity', 'delete_severity', 'diff'
+AUDIT_REGISTRY = {
+    'auth.Group': {},
+    'core_users.CustomUser': {'exclude': ['password', 'last_login']},
+    'core_users.UserProfile': {},
+    'core_organization.Location': {},
+    'core_organization.Department': {},
+    'core_organization.JobPosition': {},
+    'core_organization.WorkSchedule': {},
+    'core_organization.OrganizationalAssignment': {},
+    'core_permissions.PermissionModule': {},
+    'core_permissions.GranularPermission': {},
+    'core_permissions.Role': {},
+    'core_permissions.RolePermission': {},
+    'core_permissions.UserRole': {},
+    'core_permissions.RoleTemplate': {},
+    'core_permissions.TemplateRole': {},
+    'notifications.NotificationChannel': {},
+    'notifications.NotificationTemplate': {},
+    'dashboard.DashboardWidget': {},
+    'dashboard.DashboardPreset': {},
+}
 
 # Configuración de Email para Desarrollo
 #EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'  # Emails en consola
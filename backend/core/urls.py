@@ -28,6 +28,7 @@ urlpatterns = [
     path('api/users/', include('core_users.urls')),  # 🔥 NUEVO
     path('api/permissions/', include('core_permissions.urls')),  # 🔥 NUEVO
     path('api/organization/', include('core_organization.urls')),  # 🔥 NUEVO
+    path('api/audit/', include('core_audit.urls')),
     path('notifications/', include('notifications.urls')),
     path('dashboard/', include('dashboard.urls')),
 ]
@@ -5,4 +5,7 @@ class CoreAuditConfig(AppConfig):
     name = 'core_audit'
     
     def ready(self):
-        import core_audit.signals
\ No newline at end of file
+        import core_audit.signals
+        from core_audit.registry import audit_registry
+        audit_registry.load_from_settings()
+        audit_registry.connect()
\ No newline at end of file
@@ -0,0 +1,321 @@
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FAILED_LOGIN_SETTINGS = {
+    'BACKEND': 'memory',                    # 'memory' (por proceso) o 'redis'
+    'REDIS_URL': 'redis://localhost:6379/1',
+    'KEY_PREFIX': 'core_audit:failed_login',
+    'SOCKET_TIMEOUT': 0.5,
+    'RETRY_BACKOFF': 5,
+    'RETRY_BACKOFF_MAX': 300,
+}
+
+
+def get_failed_login_settings():
+    """Configuración efectiva (settings.AUDIT_FAILED_LOGIN_COUNTER + defaults)"""
+    return {**DEFAULT_FAILED_LOGIN_SETTINGS, **getattr(settings, 'AUDIT_FAILED_LOGIN_COUNTER', {})}
+
+
+class InMemorySlidingWindowBackend:
+    """
+    Contador de ventana deslizante en memoria del proceso (deque de timestamps
+    por clave). Las claves vencidas se purgan cada SWEEP_EVERY registros.
+    """
+    SWEEP_EVERY = 1000
+
+    def __init__(self):
+        self._events = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+
+    def hit(self, key, window_seconds, now=None):
+        """Registrar un evento y devolver cuántos hay en la ventana"""
+        now = time.time() if now is None else now
+        with self._lock:
+            events = self._events.setdefault(key, deque())
+            events.append(now)
+            self._trim(events, now - window_seconds)
+            count = len(events)
+
+            self._hits += 1
+            if self._hits % self.SWEEP_EVERY == 0:
+                self._sweep(now - window_seconds)
+            return count
+
+    def count(self, key, window_seconds, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            events = self._events.get(key)
+            if not events:
+                return 0
+            self._trim(events, now - window_seconds)
+            return len(events)
+
+    def reset(self, key):
+        with self._lock:
+            self._events.pop(key, None)
+
+    @staticmethod
+    def _trim(events, cutoff):
+        while events and events[0] <= cutoff:
+            events.popleft()
+
+    def _sweep(self, cutoff):
+        for key in [key for key, events in self._events.items() if not events or events[-1] <= cutoff]:
+            del self._events[key]
+
+
+class RedisSlidingWindowBackend:
+    """
+    Contador de ventana deslizante en Redis (un sorted set por clave con el
+    timestamp como score), compartido entre procesos y workers.
+
+    Cada registro es un único round-trip: ZADD + ZREMRANGEBYSCORE + ZCARD +
+    EXPIRE en un pipeline transaccional.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def hit(self, key, window_seconds, now=None):
+        now = time.time() if now is None else now
+        pipe = self.client.pipeline()
+        pipe.zadd(key, {f'{now}:{uuid.uuid4().hex}': now})
+        pipe.zremrangebyscore(key, '-inf', now - window_seconds)
+        pipe.zcard(key)
+        pipe.expire(key, int(window_seconds) + 1)
+        return pipe.execute()[2]
+
+    def count(self, key, window_seconds, now=None):
+        now = time.time() if now is None else now
+        pipe = self.client.pipeline()
+        pipe.zremrangebyscore(key, '-inf', now - window_seconds)
+        pipe.zcard(key)
+        return pipe.execute()[1]
+
+    def reset(self, key):
+        self.client.delete(key)
+
+
+class FakeRedis:
+    """
+    Sustituto en memoria del subconjunto de redis-py que usa
+    RedisSlidingWindowBackend (sorted sets, expire, delete y pipeline).
+    Pensado para tests; los TTL se evalúan con time.time().
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._expires = {}
+        self._lock = threading.RLock()
+
+    def pipeline(self, transaction=True):
+        return FakeRedisPipeline(self)
+
+    def zadd(self, key, mapping):
+        with self._lock:
+            zset = self._get(key, create=True)
+            added = len([member for member in mapping if member not in zset])
+            zset.update(mapping)
+            return added
+
+    def zremrangebyscore(self, key, minimum, maximum):
+        with self._lock:
+            zset = self._get(key)
+            if zset is None:
+                return 0
+            low, high = float(minimum), float(maximum)
+            removed = [member for member, score in zset.items() if low <= score <= high]
+            for member in removed:
+                del zset[member]
+            return len(removed)
+
+    def zcard(self, key):
+        with self._lock:
+            zset = self._get(key)
+            return len(zset) if zset else 0
+
+    def expire(self, key, seconds):
+        with self._lock:
+            if self._get(key) is None:
+                return False
+            self._expires[key] = time.time() + seconds
+            return True
+
+    def delete(self, *keys):
+        with self._lock:
+            deleted = 0
+            for key in keys:
+                self._expires.pop(key, None)
+                if self._data.pop(key, None) is not None:
+                    deleted += 1
+            return deleted
+
+    def flushall(self):
+        with self._lock:
+            self._data.clear()
+            self._expires.clear()
+
+    def _get(self, key, create=False):
+        expires_at = self._expires.get(key)
+        if expires_at is not None and expires_at <= time.time():
+            self.delete(key)
+        if create:
+            return self._data.setdefault(key, {})
+        return self._data.get(key)
+
+
+class FakeRedisPipeline:
+    """Pipeline de FakeRedis: encola las llamadas y las ejecuta bajo un mismo lock"""
+
+    def __init__(self, client):
+        self._client = client
+        self._commands = []
+
+    def __getattr__(self, name):
+        method = getattr(self._client, name)
+
+        def queue_command(*args, **kwargs):
+            self._commands.append((method, args, kwargs))
+            return self
+        return queue_command
+
+    def execute(self):
+        with self._client._lock:
+            results = [method(*args, **kwargs) for method, args, kwargs in self._commands]
+        self._commands = []
+        return results
+
+
+class SlidingWindowCounter:
+    """
+    Contador de ventana deslizante sobre el backend configurado en
+    AUDIT_FAILED_LOGIN_COUNTER (creado en el primer uso).
+
+    Si el backend falla (Redis caído) la llamada se cuenta en un backend en
+    memoria del proceso y Redis no se vuelve a intentar hasta pasado
+    RETRY_BACKOFF segundos (duplicándose en cada fallo hasta
+    RETRY_BACKOFF_MAX); el primer éxito restablece el backoff.
+    """
+
+    def __init__(self, backend=None):
+        self._backend = backend
+        self._fallback = InMemorySlidingWindowBackend()
+        self._lock = threading.Lock()
+        self._retry_at = 0.0
+        self._backoff = 0.0
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    self._backend = self._build_backend()
+        return self._backend
+
+    def set_backend(self, backend):
+        """Reemplazar el backend (tests: InMemorySlidingWindowBackend o FakeRedis)"""
+        self._backend = backend
+        self._retry_at = self._backoff = 0.0
+
+    def hit(self, key, window_seconds, now=None):
+        if time.monotonic() < self._retry_at:
+            return self._fallback.hit(key, window_seconds, now)
+        try:
+            count = self.backend.hit(key, window_seconds, now)
+        except Exception as e:
+            self._backend_failed(e)
+            return self._fallback.hit(key, window_seconds, now)
+        self._backoff = 0.0
+        return count
+
+    def reset(self, key):
+        self._fallback.reset(key)
+        if time.monotonic() < self._retry_at:
+            return
+        try:
+            self.backend.reset(key)
+        except Exception as e:
+            self._backend_failed(e)
+
+    def _backend_failed(self, error):
+        options = get_failed_login_settings()
+        with self._lock:
+            self._backoff = min(
+                max(self._backoff * 2, options['RETRY_BACKOFF']),
+                options['RETRY_BACKOFF_MAX']
+            )
+            self._retry_at = time.monotonic() + self._backoff
+        logger.warning(
+            "Sliding window counter backend error, counting in memory for %ss: %s",
+            self._backoff, error
+        )
+
+    @staticmethod
+    def _build_backend():
+        options = get_failed_login_settings()
+        if options['BACKEND'] == 'redis':
+            import redis
+            return RedisSlidingWindowBackend(redis.Redis.from_url(
+                options['REDIS_URL'],
+                socket_timeout=options['SOCKET_TIMEOUT'],
+                socket_connect_timeout=options['SOCKET_TIMEOUT']
+            ))
+        return InMemorySlidingWindowBackend()
+
+
+class FailedLoginDetector:
+    """
+    Detección de intentos fallidos de login por ventana deslizante.
+
+    Cada login_failed incrementa dos contadores (usuario e IP); al alcanzar
+    AuditConfiguration.failed_login_threshold dentro de
+    failed_login_timeframe_minutes se informa el alcance superado. No se
+    consulta la tabla de auditoría.
+    """
+
+    def __init__(self, counter):
+        self.counter = counter
+
+    def record(self, audit_log, config):
+        """
+        Registrar un login fallido. Devuelve una lista de dicts
+        {'scope', 'value', 'count'} con los contadores que superan el umbral.
+        """
+        window = config.failed_login_timeframe_minutes * 60
+        now = audit_log.timestamp.timestamp()
+        exceeded = []
+
+        for scope, value in self._scopes(audit_log):
+            count = self.counter.hit(self._key(scope, value), window, now)
+            if count >= config.failed_login_threshold:
+                exceeded.append({'scope': scope, 'value': value, 'count': count})
+        return exceeded
+
+    def reset(self, user=None, ip_address=None):
+        """Reiniciar contadores (p.ej. tras un login correcto o un desbloqueo)"""
+        if user is not None:
+            self.counter.reset(self._key('user', getattr(user, 'pk', user)))
+        if ip_address:
+            self.counter.reset(self._key('ip', ip_address))
+
+    @staticmethod
+    def _scopes(audit_log):
+        if audit_log.user_id:
+            yield 'user', audit_log.user_id
+        if audit_log.ip_address:
+            yield 'ip', audit_log.ip_address
+
+    @staticmethod
+    def _key(scope, value):
+        return f"{get_failed_login_settings()['KEY_PREFIX']}:{scope}:{value}"
+
+
+sliding_window_counter = SlidingWindowCounter()
+failed_login_detector = FailedLoginDetector(sliding_window_counter)
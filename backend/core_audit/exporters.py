@@ -0,0 +1,216 @@
+import csv
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from core_organization.models import Department
+from .models import AuditLog
+
+# (columna exportada, lookup en AuditLog.values_list)
+EXPORT_COLUMNS = [
+    ('id', 'id'),
+    ('timestamp', 'timestamp'),
+    ('correlation_id', 'correlation_id'),
+    ('user_id', 'user_id'),
+    ('user_email', 'user__email'),
+    ('department_id', 'user_department_id'),
+    ('department_code', 'user_department__code'),
+    ('action_category', 'action_category'),
+    ('action_type', 'action_type'),
+    ('severity', 'severity'),
+    ('is_success', 'is_success'),
+    ('description', 'description'),
+    ('ip_address', 'ip_address'),
+    ('user_agent', 'user_agent'),
+    ('content_type', 'content_type__model'),
+    ('object_id', 'object_id'),
+    ('old_values', 'old_values'),
+    ('new_values', 'new_values'),
+    ('changed_fields', 'changed_fields'),
+    ('request_path', 'request_path'),
+    ('request_method', 'request_method'),
+    ('error_message', 'error_message'),
+    ('session_key', 'session_key'),
+    ('duration_ms', 'duration_ms'),
+    ('is_archived', 'is_archived'),
+]
+
+JSON_COLUMNS = {'old_values', 'new_values', 'changed_fields'}
+
+
+class _Echo:
+    """Buffer de escritura que devuelve la línea en lugar de guardarla (csv en streaming)"""
+    def write(self, value):
+        return value
+
+
+class AuditLogExporter:
+    """
+    Exportación de AuditLog en streaming.
+
+    Lee con values_list().iterator(chunk_size), que en PostgreSQL usa un cursor
+    del lado del servidor: la memoria es constante sin importar cuántas filas
+    se exporten. Las filas salen en orden (timestamp, id).
+
+    Formatos: CSV y NDJSON como generadores de líneas (StreamingHttpResponse o
+    archivo) y Parquet a archivo (requiere pyarrow, escrito por row groups).
+    """
+    DEFAULT_CHUNK_SIZE = 2000
+    CONTENT_TYPES = {
+        'csv': 'text/csv; charset=utf-8',
+        'ndjson': 'application/x-ndjson',
+    }
+
+    def __init__(self, action_category=None, action_type=None, date_from=None,
+                 date_to=None, user=None, department=None,
+                 include_subdepartments=False, chunk_size=None):
+        self.action_category = action_category
+        self.action_type = action_type
+        self.date_from = date_from
+        self.date_to = date_to
+        self.user = user
+        self.department = department
+        self.include_subdepartments = include_subdepartments
+        self.chunk_size = chunk_size or self.DEFAULT_CHUNK_SIZE
+
+    @property
+    def columns(self):
+        return [column for column, _ in EXPORT_COLUMNS]
+
+    def get_queryset(self):
+        queryset = AuditLog.objects.all()
+
+        if self.action_category:
+            queryset = queryset.filter(action_category=self.action_category)
+        if self.action_type:
+            queryset = queryset.filter(action_type=self.action_type)
+        if self.date_from:
+            queryset = queryset.filter(timestamp__gte=self.date_from)
+        if self.date_to:
+            queryset = queryset.filter(timestamp__lt=self.date_to)
+        if self.user:
+            queryset = queryset.filter(user_id=getattr(self.user, 'pk', self.user))
+        if self.department:
+            if self.include_subdepartments:
+                department = self.department
+                if not isinstance(department, Department):
+                    department = Department.objects.get(pk=department)
+                queryset = queryset.filter(
+                    user_department__in=department.get_descendants(include_self=True)
+                )
+            else:
+                queryset = queryset.filter(
+                    user_department_id=getattr(self.department, 'pk', self.department)
+                )
+
+        return queryset.order_by('timestamp', 'id').values_list(
+            *[lookup for _, lookup in EXPORT_COLUMNS]
+        )
+
+    def iter_rows(self):
+        """Tuplas de valores en el orden de EXPORT_COLUMNS"""
+        return self.get_queryset().iterator(chunk_size=self.chunk_size)
+
+    def iter_dicts(self):
+        columns = self.columns
+        for row in self.iter_rows():
+            yield dict(zip(columns, row))
+
+    def stream(self, export_format):
+        if export_format == 'csv':
+            return self.stream_csv()
+        if export_format == 'ndjson':
+            return self.stream_ndjson()
+        raise ValueError(f"Formato de exportación no soportado: {export_format}")
+
+    def stream_csv(self):
+        """Líneas CSV (cabecera incluida)"""
+        writer = csv.writer(_Echo())
+        yield writer.writerow(self.columns)
+        json_indexes = self._json_indexes()
+        for row in self.iter_rows():
+            yield writer.writerow([
+                self._dump_json(value) if index in json_indexes else value
+                for index, value in enumerate(row)
+            ])
+
+    def stream_ndjson(self):
+        """Un objeto JSON por línea"""
+        encoder = DjangoJSONEncoder()
+        for record in self.iter_dicts():
+            yield encoder.encode(record) + '\n'
+
+    def write_parquet(self, path):
+        """
+        Escribir la exportación en un archivo Parquet, un row group por chunk.
+        Devuelve el número de filas escritas.
+        """
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("La exportación a Parquet requiere pyarrow (pip install pyarrow)")
+
+        schema = pa.schema([
+            ('id', pa.string()),
+            ('timestamp', pa.timestamp('us', tz='UTC')),
+            ('correlation_id', pa.string()),
+            ('user_id', pa.int64()),
+            ('user_email', pa.string()),
+            ('department_id', pa.int64()),
+            ('department_code', pa.string()),
+            ('action_category', pa.string()),
+            ('action_type', pa.string()),
+            ('severity', pa.string()),
+            ('is_success', pa.bool_()),
+            ('description', pa.string()),
+            ('ip_address', pa.string()),
+            ('user_agent', pa.string()),
+            ('content_type', pa.string()),
+            ('object_id', pa.string()),
+            ('old_values', pa.string()),
+            ('new_values', pa.string()),
+            ('changed_fields', pa.string()),
+            ('request_path', pa.string()),
+            ('request_method', pa.string()),
+            ('error_message', pa.string()),
+            ('session_key', pa.string()),
+            ('duration_ms', pa.int64()),
+            ('is_archived', pa.bool_()),
+        ])
+        columns = self.columns
+        json_indexes = self._json_indexes()
+        string_indexes = {columns.index(column) for column in ('id', 'correlation_id', 'ip_address')}
+
+        total = 0
+        with pq.ParquetWriter(str(path), schema, compression='snappy') as writer:
+            batch = []
+            for row in self.iter_rows():
+                batch.append([
+                    self._dump_json(value) if index in json_indexes
+                    else (str(value) if index in string_indexes and value is not None else value)
+                    for index, value in enumerate(row)
+                ])
+                if len(batch) >= self.chunk_size:
+                    writer.write_table(self._to_table(pa, schema, batch))
+                    total += len(batch)
+                    batch = []
+            if batch:
+                writer.write_table(self._to_table(pa, schema, batch))
+                total += len(batch)
+        return total
+
+    @staticmethod
+    def _to_table(pa, schema, batch):
+        columns = list(zip(*batch))
+        return pa.Table.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+            schema=schema
+        )
+
+    def _json_indexes(self):
+        return {index for index, column in enumerate(self.columns) if column in JSON_COLUMNS}
+
+    @staticmethod
+    def _dump_json(value):
+        if value is None:
+            return None
+        return json.dumps(value, cls=DjangoJSONEncoder, ensure_ascii=False)
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from core_audit.partitions import AuditLogPartitionManager
+
+class Command(BaseCommand):
+    help = 'Gestiona las particiones mensuales de core_audit_logs'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months-ahead',
+            type=int,
+            default=None,
+            help='Meses futuros a pre-crear (por defecto AUDIT_LOG_PARTITIONING["MONTHS_AHEAD"])'
+        )
+        parser.add_argument(
+            '--list',
+            action='store_true',
+            help='Solo listar las particiones existentes'
+        )
+    
+    def handle(self, *args, **options):
+        if not AuditLogPartitionManager.is_partitioned():
+            raise CommandError('core_audit_logs no está particionada (requiere PostgreSQL y la migración 0003)')
+        
+        if not options['list']:
+            created = AuditLogPartitionManager.ensure_partitions(options['months_ahead'])
+            for name in created:
+                self.stdout.write(self.style.SUCCESS(f'✅ Partición creada: {name}'))
+            if not created:
+                self.stdout.write('Las particiones ya existen')
+        
+        for partition in AuditLogPartitionManager.list_partitions():
+            tablespace = partition['tablespace'] or 'default'
+            self.stdout.write(
+                f"{partition['name']}: {partition['start']:%Y-%m-%d} → {partition['end']:%Y-%m-%d} ({tablespace})"
+            )
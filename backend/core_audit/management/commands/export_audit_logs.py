@@ -0,0 +1,89 @@
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from core_audit.exporters import AuditLogExporter
+
+class Command(BaseCommand):
+    help = 'Exporta registros de auditoría en streaming (CSV, NDJSON o Parquet)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'ndjson', 'parquet'],
+            default='ndjson',
+            help='Formato de salida'
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            help='Archivo de salida (por defecto stdout; obligatorio para parquet)'
+        )
+        parser.add_argument('--category', type=str, help='Filtrar por action_category')
+        parser.add_argument('--action-type', type=str, help='Filtrar por action_type')
+        parser.add_argument('--from', dest='date_from', type=str, help='Desde (YYYY-MM-DD o ISO 8601)')
+        parser.add_argument('--to', dest='date_to', type=str, help='Hasta, excluido (YYYY-MM-DD o ISO 8601)')
+        parser.add_argument('--user', type=int, help='ID de usuario')
+        parser.add_argument('--department', type=int, help='ID de departamento')
+        parser.add_argument(
+            '--include-subdepartments',
+            action='store_true',
+            help='Incluir los subdepartamentos de --department'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=AuditLogExporter.DEFAULT_CHUNK_SIZE,
+            help='Filas leídas por viaje al cursor'
+        )
+    
+    def handle(self, *args, **options):
+        exporter = AuditLogExporter(
+            action_category=options['category'],
+            action_type=options['action_type'],
+            date_from=self._parse_date(options['date_from']),
+            date_to=self._parse_date(options['date_to']),
+            user=options['user'],
+            department=options['department'],
+            include_subdepartments=options['include_subdepartments'],
+            chunk_size=options['chunk_size'],
+        )
+        export_format = options['format']
+        output = options['output']
+        
+        if export_format == 'parquet':
+            if not output:
+                raise CommandError('--output es obligatorio para parquet')
+            try:
+                total = exporter.write_parquet(output)
+            except ImportError as e:
+                raise CommandError(str(e))
+            self.stderr.write(self.style.SUCCESS(f'✅ {total} registros exportados a {output}'))
+            return
+        
+        if not output:
+            for line in exporter.stream(export_format):
+                self.stdout.write(line, ending='')
+            return
+        
+        total = 0
+        with open(output, 'w', encoding='utf-8', newline='') as handle:
+            for line in exporter.stream(export_format):
+                handle.write(line)
+                total += 1
+        if export_format == 'csv':
+            total -= 1  # cabecera
+        self.stderr.write(self.style.SUCCESS(f'✅ {total} registros exportados a {output}'))
+    
+    def _parse_date(self, value):
+        if not value:
+            return None
+        parsed = parse_datetime(value)
+        if parsed is None:
+            try:
+                parsed = datetime.strptime(value, '%Y-%m-%d')
+            except ValueError:
+                raise CommandError(f'Fecha inválida: {value}')
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
@@ -0,0 +1,89 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:29
+
+from datetime import datetime, timezone as dt_timezone
+from dateutil.relativedelta import relativedelta
+from django.db import migrations, models
+
+TABLE = 'core_audit_logs'
+LEGACY_TABLE = 'core_audit_logs_legacy'
+MONTHS_AHEAD = 3
+
+
+def partition_audit_logs(apps, schema_editor):
+    """
+    Reconstruir core_audit_logs como tabla particionada por mes (RANGE timestamp).
+    La PK pasa a ser (id, timestamp) porque PostgreSQL exige la clave de
+    partición en las restricciones únicas.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+            "WHERE c.relname = %s AND pg_table_is_visible(c.oid)",
+            [TABLE]
+        )
+        if cursor.fetchone():
+            return
+
+        # Índices (salvo la PK) y FKs actuales, para recrearlos en la tabla nueva
+        cursor.execute(
+            "SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname NOT IN ("
+            "SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p')",
+            [TABLE, TABLE]
+        )
+        index_definitions = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype = 'f'",
+            [TABLE]
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(f"SELECT min(timestamp) FROM {TABLE}")
+        oldest = cursor.fetchone()[0]
+
+        cursor.execute(f"ALTER TABLE {TABLE} RENAME TO {LEGACY_TABLE}")
+        cursor.execute(
+            f"CREATE TABLE {TABLE} (LIKE {LEGACY_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+            f"PARTITION BY RANGE (timestamp)"
+        )
+        cursor.execute(f"CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT")
+
+        now = datetime.now(dt_timezone.utc)
+        start = (oldest or now).astimezone(dt_timezone.utc)
+        start = datetime(start.year, start.month, 1, tzinfo=dt_timezone.utc)
+        last = datetime(now.year, now.month, 1, tzinfo=dt_timezone.utc) + relativedelta(months=MONTHS_AHEAD)
+        while start <= last:
+            end = start + relativedelta(months=1)
+            cursor.execute(
+                f"CREATE TABLE {TABLE}_p{start:%Y_%m} PARTITION OF {TABLE} "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            )
+            start = end
+
+        cursor.execute(f"INSERT INTO {TABLE} SELECT * FROM {LEGACY_TABLE}")
+        cursor.execute(f"DROP TABLE {LEGACY_TABLE}")
+
+        cursor.execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY (id, timestamp)")
+        for definition in index_definitions:
+            cursor.execute(definition)
+        for name, definition in foreign_keys:
+            cursor.execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {name} {definition}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_audit', '0002_auditlog_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='securityevent',
+            name='related_audit_logs',
+            field=models.ManyToManyField(blank=True, db_constraint=False, related_name='security_events', to='core_audit.auditlog'),
+        ),
+        # La tabla particionada sigue siendo compatible con el modelo: no se revierte
+        migrations.RunPython(partition_audit_logs, migrations.RunPython.noop),
+    ]
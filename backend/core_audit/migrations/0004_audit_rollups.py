@@ -0,0 +1,73 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:35
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_audit', '0003_partition_audit_logs'),
+        ('core_organization', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditRollupState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='name')),
+                ('high_water_mark', models.DateTimeField(blank=True, null=True, verbose_name='high water mark')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='updated at')),
+            ],
+            options={
+                'verbose_name': 'audit rollup state',
+                'verbose_name_plural': 'audit rollup states',
+                'db_table': 'core_audit_rollup_state',
+            },
+        ),
+        migrations.CreateModel(
+            name='AuditLogDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField(db_index=True, verbose_name='bucket')),
+                ('action_category', models.CharField(choices=[('authentication', 'Authentication'), ('user_management', 'User Management'), ('permission_management', 'Permission Management'), ('data_access', 'Data Access'), ('data_modification', 'Data Modification'), ('system_config', 'System Configuration'), ('security', 'Security'), ('business', 'Business Process'), ('api', 'API Access')], max_length=50, verbose_name='action category')),
+                ('action_type', models.CharField(choices=[('login_success', 'Login Successful'), ('login_failed', 'Login Failed'), ('logout', 'Logout'), ('session_timeout', 'Session Timeout'), ('password_change', 'Password Changed'), ('password_reset', 'Password Reset'), ('2fa_enabled', '2FA Enabled'), ('2fa_disabled', '2FA Disabled'), ('2fa_verified', '2FA Verified'), ('user_created', 'User Created'), ('user_updated', 'User Updated'), ('user_deleted', 'User Deleted'), ('user_activated', 'User Activated'), ('user_deactivated', 'User Deactivated'), ('profile_updated', 'Profile Updated'), ('role_created', 'Role Created'), ('role_updated', 'Role Updated'), ('role_deleted', 'Role Deleted'), ('permission_assigned', 'Permission Assigned'), ('permission_revoked', 'Permission Revoked'), ('user_role_assigned', 'User Role Assigned'), ('user_role_removed', 'User Role Removed'), ('permission_escalation', 'Permission Escalation'), ('data_viewed', 'Data Viewed'), ('data_exported', 'Data Exported'), ('data_imported', 'Data Imported'), ('sensitive_data_accessed', 'Sensitive Data Accessed'), ('bulk_data_accessed', 'Bulk Data Accessed'), ('record_created', 'Record Created'), ('record_updated', 'Record Updated'), ('record_deleted', 'Record Deleted'), ('bulk_update', 'Bulk Update'), ('bulk_delete', 'Bulk Delete'), ('config_changed', 'Configuration Changed'), ('system_backup', 'System Backup'), ('system_restore', 'System Restore'), ('maintenance_mode', 'Maintenance Mode'), ('api_call', 'API Call'), ('api_rate_limit', 'API Rate Limit Exceeded'), ('api_authentication_failed', 'API Authentication Failed')], max_length=50, verbose_name='action type')),
+                ('severity', models.CharField(choices=[('debug', 'Debug'), ('info', 'Info'), ('low', 'Low'), ('medium', 'Medium'), ('high', 'High'), ('critical', 'Critical')], max_length=20, verbose_name='severity level')),
+                ('is_success', models.BooleanField(verbose_name='successful')),
+                ('ip_address', models.GenericIPAddressField(blank=True, null=True, verbose_name='IP address')),
+                ('count', models.PositiveIntegerField(verbose_name='count')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='user')),
+                ('user_department', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core_organization.department', verbose_name='user department')),
+            ],
+            options={
+                'verbose_name': 'audit log daily rollup',
+                'verbose_name_plural': 'audit log daily rollups',
+                'db_table': 'core_audit_rollups_daily',
+                'indexes': [models.Index(fields=['bucket', 'action_category'], name='core_audit__bucket_c1b2b3_idx'), models.Index(fields=['user', 'bucket'], name='core_audit__user_id_f07511_idx'), models.Index(fields=['action_type', 'bucket'], name='core_audit__action__87a5a2_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='AuditLogHourlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField(db_index=True, verbose_name='bucket')),
+                ('action_category', models.CharField(choices=[('authentication', 'Authentication'), ('user_management', 'User Management'), ('permission_management', 'Permission Management'), ('data_access', 'Data Access'), ('data_modification', 'Data Modification'), ('system_config', 'System Configuration'), ('security', 'Security'), ('business', 'Business Process'), ('api', 'API Access')], max_length=50, verbose_name='action category')),
+                ('action_type', models.CharField(choices=[('login_success', 'Login Successful'), ('login_failed', 'Login Failed'), ('logout', 'Logout'), ('session_timeout', 'Session Timeout'), ('password_change', 'Password Changed'), ('password_reset', 'Password Reset'), ('2fa_enabled', '2FA Enabled'), ('2fa_disabled', '2FA Disabled'), ('2fa_verified', '2FA Verified'), ('user_created', 'User Created'), ('user_updated', 'User Updated'), ('user_deleted', 'User Deleted'), ('user_activated', 'User Activated'), ('user_deactivated', 'User Deactivated'), ('profile_updated', 'Profile Updated'), ('role_created', 'Role Created'), ('role_updated', 'Role Updated'), ('role_deleted', 'Role Deleted'), ('permission_assigned', 'Permission Assigned'), ('permission_revoked', 'Permission Revoked'), ('user_role_assigned', 'User Role Assigned'), ('user_role_removed', 'User Role Removed'), ('permission_escalation', 'Permission Escalation'), ('data_viewed', 'Data Viewed'), ('data_exported', 'Data Exported'), ('data_imported', 'Data Imported'), ('sensitive_data_accessed', 'Sensitive Data Accessed'), ('bulk_data_accessed', 'Bulk Data Accessed'), ('record_created', 'Record Created'), ('record_updated', 'Record Updated'), ('record_deleted', 'Record Deleted'), ('bulk_update', 'Bulk Update'), ('bulk_delete', 'Bulk Delete'), ('config_changed', 'Configuration Changed'), ('system_backup', 'System Backup'), ('system_restore', 'System Restore'), ('maintenance_mode', 'Maintenance Mode'), ('api_call', 'API Call'), ('api_rate_limit', 'API Rate Limit Exceeded'), ('api_authentication_failed', 'API Authentication Failed')], max_length=50, verbose_name='action type')),
+                ('severity', models.CharField(choices=[('debug', 'Debug'), ('info', 'Info'), ('low', 'Low'), ('medium', 'Medium'), ('high', 'High'), ('critical', 'Critical')], max_length=20, verbose_name='severity level')),
+                ('is_success', models.BooleanField(verbose_name='successful')),
+                ('ip_address', models.GenericIPAddressField(blank=True, null=True, verbose_name='IP address')),
+                ('count', models.PositiveIntegerField(verbose_name='count')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='user')),
+                ('user_department', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core_organization.department', verbose_name='user department')),
+            ],
+            options={
+                'verbose_name': 'audit log hourly rollup',
+                'verbose_name_plural': 'audit log hourly rollups',
+                'db_table': 'core_audit_rollups_hourly',
+                'indexes': [models.Index(fields=['bucket', 'action_category'], name='core_audit__bucket_87b749_idx'), models.Index(fields=['user', 'bucket'], name='core_audit__user_id_d20f14_idx'), models.Index(fields=['action_type', 'bucket'], name='core_audit__action__9fa2a0_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_audit', '0004_audit_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='securityevent',
+            name='dedup_key',
+            field=models.CharField(blank=True, editable=False, max_length=150, null=True, unique=True, verbose_name='deduplication key'),
+        ),
+    ]
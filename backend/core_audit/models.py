@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth import get_user_model
 from django.contrib.contenttypes.models import ContentType
@@ -197,7 +198,9 @@ class AuditLog(BaseAuditModel):
     session_key = models.CharField(_('session key'), max_length=40, blank=True, db_index=True)
     
     # Tiempo y performance
-    timestamp = models.DateTimeField(_('timestamp'), auto_now_add=True, db_index=True)
+    # Se fija al construir la instancia (no al escribir) para conservar el
+    # orden real de los eventos cuando se persisten en lote
+    timestamp = models.DateTimeField(_('timestamp'), default=timezone.now, editable=False, db_index=True)
     duration_ms = models.PositiveIntegerField(_('duration milliseconds'), null=True, blank=True)
     
     # Retención
@@ -205,6 +208,8 @@ class AuditLog(BaseAuditModel):
     archive_date = models.DateTimeField(_('archive date'), null=True, blank=True)
 
     class Meta:
+        # En PostgreSQL la tabla está particionada por mes sobre timestamp
+        # (migración 0003, ver partitions.py)
         db_table = 'core_audit_logs'
         verbose_name = _('audit log')
         verbose_name_plural = _('audit logs')
@@ -289,6 +294,17 @@ class SecurityEvent(BaseAuditModel):
         choices=EVENT_TYPES,
         db_index=True
     )
+    # (event_type, usuario, bucket de tiempo) de los eventos automáticos. Si el
+    # evento ya no está abierto y se repite, la clave se libera (NULL) y se
+    # abre un evento nuevo
+    dedup_key = models.CharField(
+        _('deduplication key'),
+        max_length=150,
+        null=True,
+        blank=True,
+        unique=True,
+        editable=False
+    )
     
     # Usuario y contexto
     user = models.ForeignKey(
@@ -326,10 +342,12 @@ class SecurityEvent(BaseAuditModel):
     )
     
     # Evidencia
+    # Sin FK en BD: core_audit_logs está particionada y su PK es (id, timestamp)
     related_audit_logs = models.ManyToManyField(
         AuditLog,
         related_name='security_events',
-        blank=True
+        blank=True,
+        db_constraint=False
     )
     evidence_data = CustomJSONField(_('evidence data'), default=dict)
     ip_addresses = CustomJSONField(_('IP addresses'), default=list)
@@ -596,4 +614,80 @@ class AuditConfiguration(BaseAuditModel):
         if not self.pk and AuditConfiguration.objects.filter(is_active=True).exists():
             # Si ya existe una configuración activa, desactivarla
             AuditConfiguration.objects.filter(is_active=True).update(is_active=False)
-        return super().save(*args, **kwargs)
\ No newline at end of file
+        return super().save(*args, **kwargs)
+
+class AuditLogRollup(models.Model):
+    """
+    Agregado de AuditLog por bucket de tiempo (base de los rollups horario y diario)
+    """
+    bucket = models.DateTimeField(_('bucket'), db_index=True)
+    action_category = models.CharField(_('action category'), max_length=50, choices=AuditLog.ACTION_CATEGORIES)
+    action_type = models.CharField(_('action type'), max_length=50, choices=AuditLog.ACTION_TYPES)
+    severity = models.CharField(_('severity level'), max_length=20, choices=AuditLog.SEVERITY_LEVELS)
+    is_success = models.BooleanField(_('successful'))
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name=_('user')
+    )
+    user_department = models.ForeignKey(
+        Department,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name=_('user department')
+    )
+    ip_address = models.GenericIPAddressField(_('IP address'), null=True, blank=True)
+    count = models.PositiveIntegerField(_('count'))
+
+    class Meta:
+        abstract = True
+
+    def __str__(self):
+        return f"{self.bucket} - {self.action_type} - {self.count}"
+
+
+class AuditLogHourlyRollup(AuditLogRollup):
+    class Meta:
+        db_table = 'core_audit_rollups_hourly'
+        verbose_name = _('audit log hourly rollup')
+        verbose_name_plural = _('audit log hourly rollups')
+        indexes = [
+            models.Index(fields=['bucket', 'action_category']),
+            models.Index(fields=['user', 'bucket']),
+            models.Index(fields=['action_type', 'bucket']),
+        ]
+
+
+class AuditLogDailyRollup(AuditLogRollup):
+    class Meta:
+        db_table = 'core_audit_rollups_daily'
+        verbose_name = _('audit log daily rollup')
+        verbose_name_plural = _('audit log daily rollups')
+        indexes = [
+            models.Index(fields=['bucket', 'action_category']),
+            models.Index(fields=['user', 'bucket']),
+            models.Index(fields=['action_type', 'bucket']),
+        ]
+
+
+class AuditRollupState(models.Model):
+    """
+    Marca de agua de los rollups: todo AuditLog con timestamp < high_water_mark
+    ya está agregado en AuditLogHourlyRollup/AuditLogDailyRollup
+    """
+    name = models.CharField(_('name'), max_length=50, unique=True)
+    high_water_mark = models.DateTimeField(_('high water mark'), null=True, blank=True)
+    updated_at = models.DateTimeField(_('updated at'), auto_now=True)
+
+    class Meta:
+        db_table = 'core_audit_rollup_state'
+        verbose_name = _('audit rollup state')
+        verbose_name_plural = _('audit rollup states')
+
+    def __str__(self):
+        return f"{self.name}: {self.high_water_mark}"
@@ -0,0 +1,249 @@
+import gzip
+import os
+from datetime import datetime, timezone as dt_timezone
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from .models import AuditLog, SecurityEvent
+
+DEFAULT_PARTITIONING_SETTINGS = {
+    'MONTHS_AHEAD': 3,
+    'ARCHIVE_MODE': 'file',
+    'ARCHIVE_TABLESPACE': None,
+    'ARCHIVE_DIR': os.path.join(settings.BASE_DIR, 'audit_archive'),
+}
+
+
+def get_partitioning_settings():
+    """Configuración efectiva (settings.AUDIT_LOG_PARTITIONING + defaults)"""
+    return {**DEFAULT_PARTITIONING_SETTINGS, **getattr(settings, 'AUDIT_LOG_PARTITIONING', {})}
+
+
+def month_start(value):
+    """Primer instante (UTC) del mes de value"""
+    value = timezone.localtime(value, dt_timezone.utc) if timezone.is_aware(value) else value
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+class AuditLogPartitionManager:
+    """
+    Gestión de las particiones mensuales (RANGE sobre timestamp) de core_audit_logs.
+
+    Cada mes vive en core_audit_logs_pYYYY_MM; core_audit_logs_default recibe
+    cualquier fila fuera de los rangos creados para que un insert nunca falle.
+    Esas filas se reparten en su partición mensual (split_default_partition)
+    al pre-crear particiones y antes de cada retención/archivado, de modo que
+    la partición por defecto queda vacía y nada escapa a la retención.
+    La retención y el archivado operan sobre particiones completas (DETACH +
+    DROP / SET TABLESPACE / COPY a archivo) en lugar de fila por fila.
+
+    Solo PostgreSQL; en otros motores is_partitioned() es False y
+    DataRetentionManager usa el ORM.
+    """
+    TABLE = AuditLog._meta.db_table
+    DEFAULT_PARTITION = f'{TABLE}_default'
+    M2M_TABLE = SecurityEvent.related_audit_logs.through._meta.db_table
+
+    @classmethod
+    def is_partitioned(cls):
+        if connection.vendor != 'postgresql':
+            return False
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM pg_partitioned_table pt "
+                "JOIN pg_class c ON c.oid = pt.partrelid "
+                "WHERE c.relname = %s AND pg_table_is_visible(c.oid)",
+                [cls.TABLE]
+            )
+            return cursor.fetchone() is not None
+
+    @classmethod
+    def partition_name(cls, start):
+        return f'{cls.TABLE}_p{start:%Y_%m}'
+
+    @classmethod
+    def list_partitions(cls):
+        """
+        Particiones mensuales adjuntas: lista de dicts {name, start, end, tablespace}
+        ordenada por fecha
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT child.relname, COALESCE(ts.spcname, '') "
+                "FROM pg_inherits i "
+                "JOIN pg_class parent ON parent.oid = i.inhparent "
+                "JOIN pg_class child ON child.oid = i.inhrelid "
+                "LEFT JOIN pg_tablespace ts ON ts.oid = child.reltablespace "
+                "WHERE parent.relname = %s AND pg_table_is_visible(parent.oid)",
+                [cls.TABLE]
+            )
+            rows = cursor.fetchall()
+
+        prefix = f'{cls.TABLE}_p'
+        partitions = []
+        for name, tablespace in rows:
+            if not name.startswith(prefix):
+                continue
+            start = datetime.strptime(name[len(prefix):], '%Y_%m').replace(tzinfo=dt_timezone.utc)
+            partitions.append({
+                'name': name,
+                'start': start,
+                'end': start + relativedelta(months=1),
+                'tablespace': tablespace or None,
+            })
+        return sorted(partitions, key=lambda p: p['start'])
+
+    @classmethod
+    def ensure_partitions(cls, months_ahead=None, since=None):
+        """
+        Crear las particiones desde el mes de `since` (por defecto el actual)
+        hasta `months_ahead` meses en el futuro. Devuelve las creadas.
+        """
+        if months_ahead is None:
+            months_ahead = get_partitioning_settings()['MONTHS_AHEAD']
+        start = month_start(since or timezone.now())
+        last = month_start(timezone.now()) + relativedelta(months=months_ahead)
+
+        existing = {p['name'] for p in cls.list_partitions()}
+        created = cls.split_default_partition()
+        while start <= last:
+            name = cls.partition_name(start)
+            if name not in existing and name not in created:
+                cls._create_partition(name, start, start + relativedelta(months=1))
+                created.append(name)
+            start += relativedelta(months=1)
+        return created
+
+    @classmethod
+    def split_default_partition(cls, before=None):
+        """
+        Mover las filas de core_audit_logs_default (solo las anteriores a
+        `before`, si se indica) a sus particiones mensuales, creándolas.
+        Devuelve las particiones creadas.
+        """
+        query = (
+            f"SELECT DISTINCT date_trunc('month', timestamp AT TIME ZONE 'UTC') "
+            f"FROM {cls._qn(cls.DEFAULT_PARTITION)}"
+        )
+        params = []
+        if before is not None:
+            query += " WHERE timestamp < %s"
+            params.append(before)
+        with connection.cursor() as cursor:
+            cursor.execute(query, params)
+            months = sorted(row[0].replace(tzinfo=dt_timezone.utc) for row in cursor.fetchall())
+
+        created = []
+        for start in months:
+            # Ninguna partición cubre estas filas (si no, no estarían en default)
+            name = cls.partition_name(start)
+            cls._create_partition(name, start, start + relativedelta(months=1))
+            created.append(name)
+        return created
+
+    @classmethod
+    def drop_partitions_before(cls, cutoff):
+        """
+        Retención: DETACH + DROP de las particiones cuyo rango termina antes de
+        cutoff. Devuelve {nombre: filas eliminadas}
+        """
+        cls.split_default_partition(before=cutoff)
+        dropped = {}
+        for partition in cls.list_partitions():
+            if partition['end'] > cutoff:
+                continue
+            dropped[partition['name']] = cls._drop_partition(partition['name'])
+        return dropped
+
+    @classmethod
+    def archive_partitions_before(cls, cutoff, mode=None):
+        """
+        Archivar particiones completas anteriores a cutoff.
+
+        mode='tablespace': ALTER TABLE ... SET TABLESPACE (la partición sigue
+        consultable desde el tablespace de archivo).
+        mode='file': COPY a un .csv.gz en ARCHIVE_DIR y DETACH + DROP.
+        """
+        options = get_partitioning_settings()
+        mode = mode or options['ARCHIVE_MODE']
+        cls.split_default_partition(before=cutoff)
+        archived = {}
+
+        for partition in cls.list_partitions():
+            if partition['end'] > cutoff:
+                continue
+            if mode == 'tablespace':
+                tablespace = options['ARCHIVE_TABLESPACE']
+                if not tablespace:
+                    raise ValueError('AUDIT_LOG_PARTITIONING["ARCHIVE_TABLESPACE"] no está configurado')
+                if partition['tablespace'] == tablespace:
+                    continue
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f'ALTER TABLE {cls._qn(partition["name"])} '
+                        f'SET TABLESPACE {cls._qn(tablespace)}'
+                    )
+                archived[partition['name']] = tablespace
+            elif mode == 'file':
+                path = cls._export_partition(partition['name'], options['ARCHIVE_DIR'])
+                cls._drop_partition(partition['name'])
+                archived[partition['name']] = path
+            else:
+                raise ValueError(f"Modo de archivado no soportado: {mode}")
+        return archived
+
+    @classmethod
+    def _create_partition(cls, name, start, end):
+        table, partition, default = cls._qn(cls.TABLE), cls._qn(name), cls._qn(cls.DEFAULT_PARTITION)
+        bounds = f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT 1 FROM {default} WHERE timestamp >= %s AND timestamp < %s LIMIT 1",
+                [start, end]
+            )
+            if cursor.fetchone() is None:
+                cursor.execute(f"CREATE TABLE {partition} PARTITION OF {table} {bounds}")
+                return
+
+            # Hay filas del rango en la partición por defecto: moverlas antes de adjuntar
+            cursor.execute(
+                f"CREATE TABLE {partition} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+            )
+            cursor.execute(
+                f"WITH moved AS (DELETE FROM {default} WHERE timestamp >= %s AND timestamp < %s RETURNING *) "
+                f"INSERT INTO {partition} SELECT * FROM moved",
+                [start, end]
+            )
+            cursor.execute(f"ALTER TABLE {table} ATTACH PARTITION {partition} {bounds}")
+
+    @classmethod
+    def _drop_partition(cls, name):
+        table, partition = cls._qn(cls.TABLE), cls._qn(name)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {partition}")
+            # La tabla M2M no tiene FK hacia la tabla particionada: limpiar en bloque
+            cursor.execute(
+                f"DELETE FROM {cls._qn(cls.M2M_TABLE)} m USING {partition} p WHERE m.auditlog_id = p.id"
+            )
+            cursor.execute(f"SELECT count(*) FROM {partition}")
+            rows = cursor.fetchone()[0]
+            cursor.execute(f"DROP TABLE {partition}")
+        return rows
+
+    @classmethod
+    def _export_partition(cls, name, archive_dir):
+        os.makedirs(archive_dir, exist_ok=True)
+        path = os.path.join(str(archive_dir), f'{name}.csv.gz')
+        with connection.cursor() as cursor, gzip.open(path, 'wb') as archive:
+            # copy_expert es de psycopg2 (el cursor de Django lo envuelve)
+            cursor.cursor.copy_expert(
+                f"COPY {cls._qn(name)} TO STDOUT WITH (FORMAT csv, HEADER true)",
+                archive
+            )
+        return path
+
+    @staticmethod
+    def _qn(name):
+        return connection.ops.quote_name(name)
@@ -0,0 +1,107 @@
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models.signals import pre_save, post_save, post_delete
+
+# Modelos propios de auditoría: nunca se registran
+AUDIT_MODELS = ['AuditLog', 'SecurityEvent', 'SystemChange', 'AuditConfiguration']
+
+
+class AuditOptions:
+    """
+    Opciones de auditoría de un modelo registrado
+    """
+    def __init__(self, fields=None, exclude=None, severity='info',
+                 delete_severity='medium', diff=True):
+        self.fields = list(fields) if fields is not None else None
+        self.exclude = list(exclude or [])
+        self.severity = severity
+        self.delete_severity = delete_severity
+        self.diff = diff
+
+
+class AuditRegistry:
+    """
+    Registro declarativo de los modelos auditados.
+
+    Los receptores pre_save/post_save/post_delete de auditoría se conectan solo
+    a los modelos registrados; cualquier otro modelo (sesiones, notificaciones,
+    tablas internas) no ejecuta código de auditoría al guardarse.
+
+    Registro por settings:
+        AUDIT_REGISTRY = {'app_label.Model': {'fields': [...], 'severity': 'medium'}}
+
+    Registro por decorador:
+        @audit_registry.register(exclude=['password'])
+        class MyModel(models.Model): ...
+    """
+
+    def __init__(self):
+        self._registry = {}
+        self._connected = False
+
+    def register(self, model=None, **options):
+        """Registrar un modelo. Usable como función o como decorador"""
+        if model is None:
+            return lambda model_class: self.register(model_class, **options)
+
+        if model.__name__ in AUDIT_MODELS:
+            raise ImproperlyConfigured(f"{model.__name__} no puede auditarse a sí mismo")
+
+        self._registry[model] = AuditOptions(**options)
+        if self._connected:
+            self._connect_model(model)
+        return model
+
+    def unregister(self, model):
+        """Quitar un modelo del registro y desconectar sus receptores"""
+        self._registry.pop(model, None)
+        self._disconnect_model(model)
+
+    def get_options(self, model):
+        """Opciones del modelo (o de su modelo concreto si es proxy), o None"""
+        options = self._registry.get(model)
+        if options is None and model._meta.proxy:
+            options = self._registry.get(model._meta.concrete_model)
+        return options
+
+    def is_registered(self, model):
+        return self.get_options(model) is not None
+
+    def load_from_settings(self):
+        """Registrar los modelos declarados en settings.AUDIT_REGISTRY"""
+        for label, options in getattr(settings, 'AUDIT_REGISTRY', {}).items():
+            try:
+                model = apps.get_model(label)
+            except LookupError:
+                raise ImproperlyConfigured(f"AUDIT_REGISTRY: modelo '{label}' no encontrado")
+            self.register(model, **(options or {}))
+
+    def connect(self):
+        """Conectar receptores a todos los modelos registrados (y sus proxies)"""
+        for model in apps.get_models():
+            if self.is_registered(model):
+                self._connect_model(model)
+        self._connected = True
+
+    def _connect_model(self, model):
+        from .signals import log_model_changes, log_model_save, log_model_delete
+        from .tracking import change_tracker
+
+        uid = model._meta.label_lower
+        pre_save.connect(log_model_changes, sender=model, dispatch_uid=f'audit_pre_save_{uid}')
+        post_save.connect(log_model_save, sender=model, dispatch_uid=f'audit_post_save_{uid}')
+        post_delete.connect(log_model_delete, sender=model, dispatch_uid=f'audit_post_delete_{uid}')
+        change_tracker.connect_model(model)
+
+    def _disconnect_model(self, model):
+        from .tracking import change_tracker
+
+        uid = model._meta.label_lower
+        pre_save.disconnect(sender=model, dispatch_uid=f'audit_pre_save_{uid}')
+        post_save.disconnect(sender=model, dispatch_uid=f'audit_post_save_{uid}')
+        post_delete.disconnect(sender=model, dispatch_uid=f'audit_post_delete_{uid}')
+        change_tracker.disconnect_model(model)
+
+
+audit_registry = AuditRegistry()
@@ -0,0 +1,213 @@
+from collections import Counter
+from datetime import timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+from .models import AuditLog, AuditLogHourlyRollup, AuditLogDailyRollup, AuditRollupState
+
+# Dimensiones de los rollups (mismos nombres que en AuditLog)
+ROLLUP_DIMENSIONS = [
+    'action_category', 'action_type', 'severity', 'is_success',
+    'user', 'user_department', 'ip_address',
+]
+
+DEFAULT_ROLLUP_SETTINGS = {
+    'GRACE_SECONDS': 300,       # Margen tras el cierre de una hora (escritor en lotes)
+    'MAX_HOURS_PER_RUN': 24 * 31,
+}
+
+
+def get_rollup_settings():
+    """Configuración efectiva (settings.AUDIT_ROLLUPS + defaults)"""
+    return {**DEFAULT_ROLLUP_SETTINGS, **getattr(settings, 'AUDIT_ROLLUPS', {})}
+
+
+def floor_hour(value):
+    value = timezone.localtime(value, dt_timezone.utc)
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def floor_day(value):
+    return floor_hour(value).replace(hour=0)
+
+
+def ceil_hour(value):
+    floored = floor_hour(value)
+    return floored if floored == value else floored + timedelta(hours=1)
+
+
+def ceil_day(value):
+    floored = floor_day(value)
+    return floored if floored == value else floored + timedelta(days=1)
+
+
+class AuditRollupManager:
+    """
+    Rollups horarios y diarios de AuditLog mantenidos de forma incremental.
+
+    refresh() agrega las horas cerradas (más GRACE_SECONDS) posteriores a la
+    marca de agua, reemplaza sus filas horarias, recalcula los días tocados a
+    partir de las horas y avanza la marca. Cada hora se agrega una sola vez.
+
+    aggregate() responde conteos para un rango arbitrario combinando días
+    completos (rollup diario), horas sueltas (rollup horario) y solo el tramo
+    posterior a la marca de agua (y la fracción de hora inicial) desde AuditLog.
+    """
+    STATE_NAME = 'audit_log'
+
+    @classmethod
+    def get_high_water_mark(cls):
+        state = AuditRollupState.objects.filter(name=cls.STATE_NAME).first()
+        return state.high_water_mark if state else None
+
+    @classmethod
+    def refresh(cls, max_hours=None):
+        """
+        Agregar las horas pendientes. Devuelve {'hours', 'rows', 'high_water_mark'}
+        """
+        options = get_rollup_settings()
+        max_hours = max_hours or options['MAX_HOURS_PER_RUN']
+        limit = floor_hour(timezone.now() - timedelta(seconds=options['GRACE_SECONDS']))
+
+        with transaction.atomic():
+            state, _ = AuditRollupState.objects.select_for_update().get_or_create(name=cls.STATE_NAME)
+
+            start = state.high_water_mark
+            if start is None:
+                oldest = AuditLog.objects.order_by('timestamp').values_list('timestamp', flat=True).first()
+                if oldest is None:
+                    return {'hours': 0, 'rows': 0, 'high_water_mark': None}
+                start = floor_hour(oldest)
+
+            end = min(limit, start + timedelta(hours=max_hours))
+            if end <= start:
+                return {'hours': 0, 'rows': 0, 'high_water_mark': state.high_water_mark}
+
+            rows = cls._rebuild_hourly(start, end)
+            cls._rebuild_daily(floor_day(start), ceil_day(end))
+
+            state.high_water_mark = end
+            state.save(update_fields=['high_water_mark', 'updated_at'])
+
+        return {
+            'hours': int((end - start).total_seconds() // 3600),
+            'rows': rows,
+            'high_water_mark': end,
+        }
+
+    @classmethod
+    def prune(cls, cutoff):
+        """Eliminar rollups anteriores a cutoff (retención)"""
+        hourly = AuditLogHourlyRollup.objects.filter(bucket__lt=cutoff).delete()[0]
+        daily = AuditLogDailyRollup.objects.filter(bucket__lt=floor_day(cutoff)).delete()[0]
+        return hourly + daily
+
+    @classmethod
+    def aggregate(cls, start, end=None, group_by=(), **filters):
+        """
+        Conteos de AuditLog en [start, end) agrupados por group_by.
+
+        group_by y filters usan los nombres de campo de AuditLog restringidos a
+        ROLLUP_DIMENSIONS (se permiten lookups como 'user__email').
+        Devuelve una lista de dicts con las claves de group_by y 'count'.
+        """
+        end = end or timezone.now()
+        group_by = list(group_by)
+        totals = Counter()
+
+        for model, segment_start, segment_end in cls._segments(start, end):
+            queryset = model.objects.filter(**filters)
+            if model is AuditLog:
+                queryset = queryset.filter(timestamp__gte=segment_start, timestamp__lt=segment_end)
+                count = Count('id')
+            else:
+                queryset = queryset.filter(bucket__gte=segment_start, bucket__lt=segment_end)
+                count = Sum('count')
+
+            for row in queryset.order_by().values(*group_by).annotate(total=count):
+                totals[tuple(row[field] for field in group_by)] += row['total'] or 0
+
+        return [
+            {**dict(zip(group_by, key)), 'count': total}
+            for key, total in totals.most_common()
+            if total
+        ]
+
+    @classmethod
+    def _segments(cls, start, end):
+        """Tramos (modelo, inicio, fin) que cubren [start, end) sin solaparse"""
+        high_water_mark = cls.get_high_water_mark()
+        if high_water_mark is None or high_water_mark <= start:
+            return [(AuditLog, start, end)]
+
+        covered_end = min(high_water_mark, end)
+        first_hour = min(ceil_hour(start), covered_end)
+        segments = []
+
+        if start < first_hour:
+            segments.append((AuditLog, start, first_hour))
+
+        first_day, last_day = ceil_day(first_hour), floor_day(covered_end)
+        if first_day < last_day:
+            segments.append((AuditLogHourlyRollup, first_hour, first_day))
+            segments.append((AuditLogDailyRollup, first_day, last_day))
+            segments.append((AuditLogHourlyRollup, last_day, covered_end))
+        else:
+            segments.append((AuditLogHourlyRollup, first_hour, covered_end))
+
+        if covered_end < end:
+            segments.append((AuditLog, covered_end, end))
+
+        return [segment for segment in segments if segment[1] < segment[2]]
+
+    @staticmethod
+    def _rebuild_hourly(start, end):
+        AuditLogHourlyRollup.objects.filter(bucket__gte=start, bucket__lt=end).delete()
+        rows = AuditLog.objects.filter(
+            timestamp__gte=start, timestamp__lt=end
+        ).order_by().annotate(
+            bucket=TruncHour('timestamp', tzinfo=dt_timezone.utc)
+        ).values('bucket', *ROLLUP_DIMENSIONS).annotate(total=Count('id'))
+
+        rollups = [
+            AuditLogHourlyRollup(
+                bucket=row['bucket'],
+                action_category=row['action_category'],
+                action_type=row['action_type'],
+                severity=row['severity'],
+                is_success=row['is_success'],
+                user_id=row['user'],
+                user_department_id=row['user_department'],
+                ip_address=row['ip_address'],
+                count=row['total'],
+            )
+            for row in rows.iterator(chunk_size=2000)
+        ]
+        AuditLogHourlyRollup.objects.bulk_create(rollups, batch_size=1000)
+        return len(rollups)
+
+    @staticmethod
+    def _rebuild_daily(start, end):
+        AuditLogDailyRollup.objects.filter(bucket__gte=start, bucket__lt=end).delete()
+        rows = AuditLogHourlyRollup.objects.filter(
+            bucket__gte=start, bucket__lt=end
+        ).order_by().annotate(
+            day=TruncDay('bucket', tzinfo=dt_timezone.utc)
+        ).values('day', *ROLLUP_DIMENSIONS).annotate(total=Sum('count'))
+
+        AuditLogDailyRollup.objects.bulk_create([
+            AuditLogDailyRollup(
+                bucket=row['day'],
+                action_category=row['action_category'],
+                action_type=row['action_type'],
+                severity=row['severity'],
+                is_success=row['is_success'],
+                user_id=row['user'],
+                user_department_id=row['user_department'],
+                ip_address=row['ip_address'],
+                count=row['total'],
+            )
+            for row in rows.iterator(chunk_size=2000)
+        ], batch_size=1000)
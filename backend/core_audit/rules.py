@@ -0,0 +1,341 @@
+import ipaddress
+import logging
+import threading
+import time
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from .detectors import failed_login_detector, sliding_window_counter
+from .models import AuditLog
+
+logger = logging.getLogger(__name__)
+
+SEVERITY_ORDER = {level: index for index, (level, _) in enumerate(AuditLog.SEVERITY_LEVELS)}
+
+# Reglas por defecto (equivalentes a las que check_security_event tenía en código)
+DEFAULT_SECURITY_RULES = [
+    {
+        'name': 'multiple_failed_logins',
+        'action_types': ['login_failed'],
+        'conditions': {'config_flag': 'enable_security_alerts'},
+        'check': 'failed_logins',
+        'event_type': 'multiple_failed_logins',
+        'severity': 'high',
+    },
+    {
+        'name': 'unauthorized_access',
+        'action_types': ['unauthorized_access', 'permission_escalation'],
+        'conditions': {'is_success': False},
+        'event_type': 'unauthorized_access',
+        'severity': 'high',
+    },
+    {
+        'name': 'suspicious_activity',
+        'conditions': {
+            'severity_in': ['high', 'critical'],
+            'config_flag': 'enable_security_alerts',
+        },
+        'event_type': 'suspicious_activity',
+        'severity': 'inherit',
+    },
+]
+
+
+def _networks(values):
+    return tuple(ipaddress.ip_network(value, strict=False) for value in values)
+
+
+def _ip_in(networks, ip_address):
+    if not ip_address:
+        return False
+    try:
+        address = ipaddress.ip_address(ip_address)
+    except ValueError:
+        return False
+    return any(address in network for network in networks)
+
+
+def _config_value(config, value):
+    """Un entero o el nombre de un atributo de AuditConfiguration"""
+    return getattr(config, value) if isinstance(value, str) else value
+
+
+# Compiladores de condiciones: valor declarado -> predicado(audit_log, config)
+CONDITION_COMPILERS = {
+    'is_success': lambda expected: (
+        lambda log, config: log.is_success == expected
+    ),
+    'categories': lambda values: (
+        lambda log, config, values=frozenset(values): log.action_category in values
+    ),
+    'severity_in': lambda values: (
+        lambda log, config, values=frozenset(values): log.severity in values
+    ),
+    'min_severity': lambda level: (
+        lambda log, config, minimum=SEVERITY_ORDER[level]: SEVERITY_ORDER.get(log.severity, -1) >= minimum
+    ),
+    'user_required': lambda required: (
+        lambda log, config: bool(log.user_id) == required
+    ),
+    'user_in': lambda values: (
+        lambda log, config, values=frozenset(values): log.user_id in values
+    ),
+    'user_not_in': lambda values: (
+        lambda log, config, values=frozenset(values): log.user_id not in values
+    ),
+    'ip_in': lambda values: (
+        lambda log, config, networks=_networks(values): _ip_in(networks, log.ip_address)
+    ),
+    'ip_not_in': lambda values: (
+        lambda log, config, networks=_networks(values): not _ip_in(networks, log.ip_address)
+    ),
+    'config_flag': lambda flag: (
+        lambda log, config: bool(getattr(config, flag, False))
+    ),
+}
+
+
+def failed_logins_check(rule, audit_log, config):
+    """Contador de logins fallidos por usuario e IP (detectors.FailedLoginDetector)"""
+    exceeded = failed_login_detector.record(audit_log, config)
+    if not exceeded:
+        return None
+    return {
+        'failed_attempts': max(item['count'] for item in exceeded),
+        'timeframe_minutes': config.failed_login_timeframe_minutes,
+        'exceeded_by': [
+            {'scope': item['scope'], 'value': str(item['value']), 'count': item['count']}
+            for item in exceeded
+        ],
+    }
+
+
+class CompiledRule:
+    """
+    Regla lista para evaluar: predicados ya construidos, condición de tasa y
+    check opcional. evaluate() devuelve los datos de evidencia (dict) si la
+    regla se dispara, o None.
+    """
+
+    def __init__(self, name, event_type, severity, predicates, rate=None, check=None):
+        self.name = name
+        self.event_type = event_type
+        self.severity = severity
+        self.predicates = tuple(predicates)
+        self.rate = rate
+        self.check = check
+
+    def evaluate(self, audit_log, config):
+        for predicate in self.predicates:
+            if not predicate(audit_log, config):
+                return None
+
+        evidence = {}
+        if self.rate is not None:
+            rate_evidence = self._evaluate_rate(audit_log, config)
+            if rate_evidence is None:
+                return None
+            evidence.update(rate_evidence)
+
+        if self.check is not None:
+            check_evidence = self.check(self, audit_log, config)
+            if check_evidence is None:
+                return None
+            evidence.update(check_evidence)
+
+        return evidence
+
+    def get_severity(self, audit_log):
+        return audit_log.severity if self.severity == 'inherit' else self.severity
+
+    def _evaluate_rate(self, audit_log, config):
+        threshold = _config_value(config, self.rate['threshold'])
+        window_minutes = _config_value(config, self.rate['window_minutes'])
+        now = audit_log.timestamp.timestamp()
+        exceeded = []
+
+        for scope in self.rate['per']:
+            value = audit_log.user_id if scope == 'user' else audit_log.ip_address
+            if not value:
+                continue
+            count = sliding_window_counter.hit(
+                f'core_audit:rule:{self.name}:{scope}:{value}', window_minutes * 60, now
+            )
+            if count >= threshold:
+                exceeded.append({'scope': scope, 'value': str(value), 'count': count})
+
+        if not exceeded:
+            return None
+        return {
+            'rate_threshold': threshold,
+            'rate_window_minutes': window_minutes,
+            'exceeded_by': exceeded,
+        }
+
+
+class SecurityRuleEngine:
+    """
+    Motor de reglas de seguridad definidas como datos.
+
+    Cada regla es un dict:
+        {
+            'name': 'admin_logins_outside_vpn',
+            'action_types': ['login_success'],      # omitido = cualquier acción
+            'conditions': {'ip_not_in': ['10.0.0.0/8'], 'user_in': [1]},
+            'rate': {'threshold': 5, 'window_minutes': 10, 'per': ['user', 'ip']},
+            'check': 'failed_logins',               # check registrado (opcional)
+            'event_type': 'suspicious_activity',
+            'severity': 'high',                     # o 'inherit'
+        }
+
+    Las reglas se compilan una sola vez (DEFAULT_SECURITY_RULES más
+    settings.AUDIT_SECURITY_RULES; una regla con el mismo 'name' reemplaza a
+    la por defecto y 'enabled': False la desactiva) en un índice por
+    action_type: cada evento solo se evalúa contra las reglas que pueden
+    coincidir. El motor lleva sus propias métricas (get_metrics()).
+    """
+
+    def __init__(self):
+        self._checks = {'failed_logins': failed_logins_check}
+        self._index = None
+        self._wildcard = ()
+        self._lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self.reset_metrics()
+
+    def register_check(self, name, function):
+        """Registrar un check: function(rule, audit_log, config) -> dict de evidencia o None"""
+        self._checks[name] = function
+        self._index = None
+
+    def get_rule_definitions(self):
+        definitions = {rule['name']: rule for rule in DEFAULT_SECURITY_RULES}
+        for rule in getattr(settings, 'AUDIT_SECURITY_RULES', []):
+            definitions[rule['name']] = rule
+        return [rule for rule in definitions.values() if rule.get('enabled', True)]
+
+    def compile(self, definitions=None):
+        """Compilar las reglas y reconstruir el índice por action_type"""
+        definitions = self.get_rule_definitions() if definitions is None else definitions
+        by_action = {}
+        wildcard = []
+
+        for definition in definitions:
+            rule = self._compile_rule(definition)
+            action_types = definition.get('action_types')
+            if action_types:
+                for action_type in action_types:
+                    by_action.setdefault(action_type, []).append(rule)
+            else:
+                wildcard.append(rule)
+
+        self._wildcard = tuple(wildcard)
+        self._index = {
+            action_type: tuple(rules) + self._wildcard
+            for action_type, rules in by_action.items()
+        }
+        return self._index
+
+    def rules_for(self, action_type):
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self.compile()
+        return self._index.get(action_type, self._wildcard)
+
+    def evaluate(self, audit_log, config):
+        """
+        Evaluar un log contra sus reglas. Devuelve [(regla, evidencia)] de las
+        reglas disparadas
+        """
+        started = time.perf_counter()
+        fired = []
+        errors = []
+        rules = self.rules_for(audit_log.action_type)
+
+        for rule in rules:
+            try:
+                evidence = rule.evaluate(audit_log, config)
+            except Exception:
+                errors.append(rule.name)
+                logger.exception(
+                    "Error evaluating security rule %s (action_type=%s)", rule.name, audit_log.action_type
+                )
+                continue
+            if evidence is not None:
+                fired.append((rule, evidence))
+
+        self._record_metrics(rules, fired, errors, time.perf_counter() - started)
+        return fired
+
+    def get_metrics(self):
+        with self._metrics_lock:
+            return {
+                'events_evaluated': self._metrics['events_evaluated'],
+                'rules_evaluated': self._metrics['rules_evaluated'],
+                'rule_errors': self._metrics['rule_errors'],
+                'evaluation_seconds': round(self._metrics['evaluation_seconds'], 6),
+                'rules': {name: dict(values) for name, values in self._metrics['rules'].items()},
+            }
+
+    def reset_metrics(self):
+        with self._metrics_lock:
+            self._metrics = {
+                'events_evaluated': 0,
+                'rules_evaluated': 0,
+                'rule_errors': 0,
+                'evaluation_seconds': 0.0,
+                'rules': {},
+            }
+
+    def _record_metrics(self, rules, fired, errors, elapsed):
+        fired_names = {rule.name for rule, _ in fired}
+        with self._metrics_lock:
+            self._metrics['events_evaluated'] += 1
+            self._metrics['rules_evaluated'] += len(rules)
+            self._metrics['rule_errors'] += len(errors)
+            self._metrics['evaluation_seconds'] += elapsed
+            for rule in rules:
+                counters = self._metrics['rules'].setdefault(
+                    rule.name, {'evaluated': 0, 'fired': 0, 'errors': 0}
+                )
+                counters['evaluated'] += 1
+                if rule.name in fired_names:
+                    counters['fired'] += 1
+                if rule.name in errors:
+                    counters['errors'] += 1
+
+    def _compile_rule(self, definition):
+        name = definition.get('name')
+        if not name or not definition.get('event_type'):
+            raise ImproperlyConfigured(f"AUDIT_SECURITY_RULES: regla sin 'name' o 'event_type': {definition}")
+
+        predicates = []
+        for key, value in (definition.get('conditions') or {}).items():
+            compiler = CONDITION_COMPILERS.get(key)
+            if compiler is None:
+                raise ImproperlyConfigured(f"Regla '{name}': condición desconocida '{key}'")
+            predicates.append(compiler(value))
+
+        rate = definition.get('rate')
+        if rate is not None:
+            rate = {'per': ['user'], **rate}
+            if 'threshold' not in rate or 'window_minutes' not in rate:
+                raise ImproperlyConfigured(f"Regla '{name}': 'rate' requiere 'threshold' y 'window_minutes'")
+
+        check = None
+        if definition.get('check'):
+            check = self._checks.get(definition['check'])
+            if check is None:
+                raise ImproperlyConfigured(f"Regla '{name}': check desconocido '{definition['check']}'")
+
+        return CompiledRule(
+            name=name,
+            event_type=definition['event_type'],
+            severity=definition.get('severity', 'medium'),
+            predicates=predicates,
+            rate=rate,
+            check=check,
+        )
+
+
+security_rule_engine = SecurityRuleEngine()
@@ -0,0 +1,22 @@
+from rest_framework import serializers
+from core_users.models import CustomUser
+from core_organization.models import Department
+from .models import AuditLog
+
+
+class AuditLogExportSerializer(serializers.Serializer):
+    """Filtros y formato de la exportación de auditoría"""
+    # 'format' lo reserva DRF para la negociación de contenido
+    export_format = serializers.ChoiceField(choices=['csv', 'ndjson'], default='ndjson')
+    action_category = serializers.ChoiceField(choices=AuditLog.ACTION_CATEGORIES, required=False)
+    action_type = serializers.ChoiceField(choices=AuditLog.ACTION_TYPES, required=False)
+    date_from = serializers.DateTimeField(input_formats=['iso-8601', '%Y-%m-%d'], required=False)
+    date_to = serializers.DateTimeField(input_formats=['iso-8601', '%Y-%m-%d'], required=False)
+    user_id = serializers.PrimaryKeyRelatedField(queryset=CustomUser.objects.all(), required=False)
+    department_id = serializers.PrimaryKeyRelatedField(queryset=Department.objects.all(), required=False)
+    include_subdepartments = serializers.BooleanField(default=False)
+
+    def validate(self, data):
+        if data.get('date_from') and data.get('date_to') and data['date_from'] >= data['date_to']:
+            raise serializers.ValidationError('date_from debe ser anterior a date_to')
+        return data
@@ -1,10 +1,21 @@
 import threading  # 🔥 IMPORTAR THREADING
-from django.db.models.signals import post_save, post_delete, pre_save, m2m_changed
+from contextlib import contextmanager
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
 from django.contrib.auth.signals import user_logged_in, user_logged_out, user_login_failed
 from django.utils import timezone
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
 from .models import AuditLog, SecurityEvent, AuditConfiguration
+from .writer import audit_log_writer
+from .utils import AuditConfigurationCache
+from .tracking import change_tracker
+from .registry import audit_registry
+from .rules import security_rule_engine
 from core_users.models import CustomUser
 from core_permissions.models import Role, UserRole
 import uuid
@@ -53,6 +64,19 @@ def clear_audit_context():
     if hasattr(_audit_context, 'current'):
         del _audit_context.current
 
+@contextmanager
+def model_audit_suppressed():
+    """
+    Omitir los logs por fila de los modelos registrados (post_save/post_delete)
+    durante una operación en lote que registra su propio log agregado
+    """
+    previous = getattr(_audit_context, 'model_audit_suppressed', False)
+    _audit_context.model_audit_suppressed = True
+    try:
+        yield
+    finally:
+        _audit_context.model_audit_suppressed = previous
+
 def get_client_ip(request):
     """Obtener IP real del cliente"""
     x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
@@ -65,15 +89,19 @@ def get_client_ip(request):
 def create_audit_log(action_type, action_category, description, 
                     old_values=None, new_values=None, changed_fields=None,
                     content_object=None, is_success=True, error_message='',
-                    duration_ms=None, severity='info'):
+                    duration_ms=None, severity='info', sync=False):
     """
-    Función helper para crear registros de auditoría
+    Función helper para crear registros de auditoría.
+
+    Por defecto el log se encola al confirmar la transacción actual y se
+    devuelve sin persistir; sync=True lo guarda de inmediato y devuelve la
+    fila ya guardada
     """
     context = get_audit_context()
     
     try:
-        # Obtener configuración de auditoría
-        config = AuditConfiguration.objects.filter(is_active=True).first()
+        # Obtener configuración de auditoría (snapshot en caché)
+        config = AuditConfigurationCache.get()
         if not config:
             return None
         
@@ -93,13 +121,13 @@ def create_audit_log(action_type, action_category, description,
         audit_data = {
             'user': context.user if context.user and context.user.is_authenticated else None,
             'user_department': getattr(context.user, 'department', None) if context.user else None,
-            'correlation_id': context.correlation_id,
+            'correlation_id': context.correlation_id or uuid.uuid4(),
             'action_category': action_category,
             'action_type': action_type,
             'severity': severity,
             'description': description,
             'ip_address': context.ip_address,
-            'user_agent': context.user_agent,
+            'user_agent': context.user_agent or '',
             'old_values': old_values,
             'new_values': new_values,
             'changed_fields': changed_fields,
@@ -108,22 +136,22 @@ def create_audit_log(action_type, action_category, description,
             'duration_ms': duration_ms,
         }
         
-        # Agregar objeto relacionado si existe
+        # Agregar objeto relacionado si existe. Se guardan tipo e id ya: el
+        # escritor persiste en lote y para entonces un objeto eliminado ya no
+        # tiene pk
         if content_object:
-            audit_data['content_object'] = content_object
+            audit_data['content_type'] = ContentType.objects.get_for_model(content_object)
+            audit_data['object_id'] = str(content_object.pk)
         
         # Agregar información de request si está disponible
         if context.request:
             audit_data['request_path'] = context.request.path
             audit_data['request_method'] = context.request.method
         
-        # Crear el log de auditoría
-        audit_log = AuditLog.objects.create(**audit_data)
-        
-        # Verificar si necesita crear un evento de seguridad
-        check_security_event(audit_log, config)
-        
-        return audit_log
+        # Encolar el log de auditoría; los eventos de seguridad se evalúan
+        # cuando el escritor lo persiste
+        audit_log = AuditLog(**audit_data)
+        return audit_log_writer.write(audit_log, config, sync=sync)
         
     except Exception as e:
         # Fallback silencioso para evitar que la auditoría rompa la aplicación
@@ -133,133 +161,110 @@ def create_audit_log(action_type, action_category, description,
 def check_security_event(audit_log, config):
     """
     Verificar si un log de auditoría requiere un evento de seguridad
+    (reglas compiladas de rules.SecurityRuleEngine)
     """
     try:
-        # Reglas para eventos de seguridad
-        security_rules = [
-            # Múltiples intentos fallidos de login
-            {
-                'condition': (
-                    audit_log.action_type == 'login_failed' and 
-                    config.enable_security_alerts
-                ),
-                'check_function': check_failed_logins
-            },
-            # Acceso no autorizado
-            {
-                'condition': (
-                    audit_log.action_type in ['unauthorized_access', 'permission_escalation'] and
-                    not audit_log.is_success
-                ),
-                'event_type': 'unauthorized_access',
-                'severity': 'high'
-            },
-            # Actividad sospechosa
-            {
-                'condition': (
-                    audit_log.severity in ['high', 'critical'] and
-                    config.enable_security_alerts
-                ),
-                'event_type': 'suspicious_activity',
-                'severity': audit_log.severity
-            },
-        ]
-        
-        for rule in security_rules:
-            if rule.get('condition', False):
-                if 'check_function' in rule:
-                    rule['check_function'](audit_log, config)
-                else:
-                    create_security_event(
-                        rule['event_type'],
-                        audit_log,
-                        rule['severity']
-                    )
+        for rule, evidence in security_rule_engine.evaluate(audit_log, config):
+            create_security_event(
+                rule.event_type,
+                audit_log,
+                rule.get_severity(audit_log),
+                additional_data=evidence or None
+            )
                     
     except Exception as e:
         print(f"⚠️ Error checking security event: {e}")
 
-def check_failed_logins(audit_log, config):
+OPEN_SECURITY_EVENT_STATUSES = ['new', 'open', 'investigating']
+
+DEFAULT_SECURITY_EVENT_DEDUP = {
+    'BUCKET_MINUTES': 60,
+    'MAX_RELATED_LOGS': 100,
+}
+
+
+def get_security_event_dedup_settings():
+    """Configuración efectiva (settings.AUDIT_SECURITY_EVENT_DEDUP + defaults)"""
+    return {**DEFAULT_SECURITY_EVENT_DEDUP, **getattr(settings, 'AUDIT_SECURITY_EVENT_DEDUP', {})}
+
+
+def security_event_dedup_key(event_type, user_id, timestamp, bucket_minutes):
+    """Clave (event_type, usuario, inicio del bucket de tiempo)"""
+    bucket_seconds = bucket_minutes * 60
+    bucket = int(timestamp.timestamp()) // bucket_seconds * bucket_seconds
+    return f"{event_type}:{user_id or 'anonymous'}:{bucket}"
+
+
+def create_security_event(event_type, audit_log, severity, additional_data=None):
     """
-    Verificar múltiples intentos fallidos de login
+    Crear un evento de seguridad o sumar una ocurrencia al evento abierto con
+    la misma clave (event_type, usuario, bucket de tiempo).
+
+    La ocurrencia se suma con un UPDATE atómico (F()), sin leer ni reescribir
+    evidence_data; el log se enlaza en related_audit_logs solo para las
+    primeras MAX_RELATED_LOGS ocurrencias.
     """
     try:
-        if not audit_log.user:
-            return
-            
-        # Contar intentos fallidos recientes
-        time_threshold = timezone.now() - timezone.timedelta(
-            minutes=config.failed_login_timeframe_minutes
+        options = get_security_event_dedup_settings()
+        dedup_key = security_event_dedup_key(
+            event_type, audit_log.user_id, audit_log.timestamp, options['BUCKET_MINUTES']
         )
         
-        failed_count = AuditLog.objects.filter(
-            user=audit_log.user,
-            action_type='login_failed',
-            timestamp__gte=time_threshold,
-            is_success=False
-        ).count()
-        
-        if failed_count >= config.failed_login_threshold:
-            create_security_event(
-                'multiple_failed_logins',
-                audit_log,
-                'high',
-                additional_data={
-                    'failed_attempts': failed_count,
-                    'timeframe_minutes': config.failed_login_timeframe_minutes
-                }
+        for _attempt in range(2):
+            # Evento abierto existente: sumar la ocurrencia
+            updated = SecurityEvent.objects.filter(
+                dedup_key=dedup_key,
+                status__in=OPEN_SECURITY_EVENT_STATUSES
+            ).update(
+                occurrence_count=F('occurrence_count') + 1,
+                last_occurrence=Greatest('last_occurrence', Value(audit_log.timestamp)),
+                updated_at=timezone.now()
             )
+            if updated:
+                security_event = SecurityEvent.objects.only(
+                    'id', 'occurrence_count'
+                ).get(dedup_key=dedup_key)
+                if security_event.occurrence_count <= options['MAX_RELATED_LOGS']:
+                    link_related_audit_logs(security_event, [audit_log])
+                return security_event
             
-    except Exception as e:
-        print(f"⚠️ Error checking failed logins: {e}")
-
-def create_security_event(event_type, audit_log, severity, additional_data=None):
-    """
-    Crear un evento de seguridad
-    """
-    try:
-        # Verificar si ya existe un evento similar reciente
-        recent_threshold = timezone.now() - timezone.timedelta(hours=1)
-        existing_event = SecurityEvent.objects.filter(
-            event_type=event_type,
-            user=audit_log.user,
-            detected_at__gte=recent_threshold,
-            status__in=['new', 'open', 'investigating']
-        ).first()
-        
-        if existing_event:
-            # Actualizar evento existente
-            existing_event.occurrence_count += 1
-            existing_event.last_occurrence = timezone.now()
-            if 'related_logs' not in existing_event.evidence_data:
-                existing_event.evidence_data['related_logs'] = []
-            existing_event.evidence_data['related_logs'].append(str(audit_log.id))
-            existing_event.save()
-            return existing_event
-        
-        # Crear nuevo evento
-        event_data = {
-            'event_type': event_type,
-            'user': audit_log.user,
-            'user_department': audit_log.user_department,
-            'title': f"{audit_log.get_action_type_display()} - Security Alert",
-            'description': f"Security event detected: {audit_log.description}",
-            'severity': severity,
-            'first_occurrence': audit_log.timestamp,
-            'last_occurrence': audit_log.timestamp,
-        }
-        
-        if additional_data:
-            event_data['evidence_data'] = additional_data
+            # Crear nuevo evento
+            try:
+                with transaction.atomic():
+                    security_event = SecurityEvent.objects.create(
+                        event_type=event_type,
+                        dedup_key=dedup_key,
+                        user_id=audit_log.user_id,
+                        user_department_id=audit_log.user_department_id,
+                        title=f"{audit_log.get_action_type_display()} - Security Alert",
+                        description=f"Security event detected: {audit_log.description}",
+                        severity=severity,
+                        first_occurrence=audit_log.timestamp,
+                        last_occurrence=audit_log.timestamp,
+                        evidence_data=additional_data or {},
+                    )
+            except IntegrityError:
+                # Otro proceso lo creó, o la clave pertenece a un evento ya
+                # cerrado: liberarla y reintentar una vez
+                SecurityEvent.objects.filter(dedup_key=dedup_key).exclude(
+                    status__in=OPEN_SECURITY_EVENT_STATUSES
+                ).update(dedup_key=None)
+                continue
             
-        security_event = SecurityEvent.objects.create(**event_data)
-        security_event.related_audit_logs.add(audit_log)
-        
-        return security_event
+            link_related_audit_logs(security_event, [audit_log])
+            return security_event
         
     except Exception as e:
         print(f"⚠️ Error creating security event: {e}")
 
+def link_related_audit_logs(security_event, audit_logs):
+    """Enlazar logs al evento con un único INSERT (ignora duplicados)"""
+    through = SecurityEvent.related_audit_logs.through
+    through.objects.bulk_create(
+        [through(securityevent_id=security_event.pk, auditlog_id=audit_log.pk) for audit_log in audit_logs],
+        ignore_conflicts=True
+    )
+
 # ========== SIGNALS DE AUTENTICACIÓN ==========
 
 @receiver(user_logged_in)
@@ -297,57 +302,42 @@ def log_user_logout(sender, request, user, **kwargs):
         severity='info'
     )
 
+# ========== SIGNALS DE CONFIGURACIÓN ==========
+
+@receiver(post_save, sender=AuditConfiguration)
+@receiver(post_delete, sender=AuditConfiguration)
+def invalidate_audit_configuration(sender, instance, **kwargs):
+    """Invalidar el snapshot de configuración en todos los procesos"""
+    AuditConfigurationCache.invalidate()
+    # Repetir al confirmar para que ningún proceso cachee el estado previo al commit
+    transaction.on_commit(AuditConfigurationCache.invalidate)
+
 # ========== SIGNALS DE MODELOS CORE ==========
+# Se conectan solo a los modelos del audit_registry (ver registry.py)
 
-@receiver(pre_save)
 def log_model_changes(sender, instance, **kwargs):
     """Registrar cambios en modelos antes de guardar"""
-    # Evitar registrar cambios en modelos de auditoría
-    if sender.__name__ in ['AuditLog', 'SecurityEvent', 'SystemChange', 'AuditConfiguration']:
-        return
-        
     try:
-        if instance.pk:
-            # Es una actualización, obtener valores antiguos
-            old_instance = sender.objects.get(pk=instance.pk)
-            old_values = {}
-            new_values = {}
-            changed_fields = []
-            
-            for field in instance._meta.fields:
-                field_name = field.name
-                old_value = getattr(old_instance, field_name, None)
-                new_value = getattr(instance, field_name, None)
-                
-                if old_value != new_value:
-                    old_values[field_name] = str(old_value)
-                    new_values[field_name] = str(new_value)
-                    changed_fields.append(field_name)
-            
-            if changed_fields:
+        if instance.pk and not instance._state.adding:
+            # Es una actualización: comparar contra los valores cargados en memoria
+            changes = change_tracker.get_changes(instance)
+            if changes:
                 # Guardar en el contexto para usar en post_save
                 context = get_audit_context()
                 context.changed_data = {
-                    'old_values': old_values,
-                    'new_values': new_values,
-                    'changed_fields': changed_fields,
+                    **changes,
                     'instance': instance
                 }
                 
-    except sender.DoesNotExist:
-        # Es una nueva instancia
-        pass
     except Exception as e:
         print(f"⚠️ Error in pre_save audit: {e}")
 
-@receiver(post_save)
 def log_model_save(sender, instance, created, **kwargs):
     """Registrar creación/actualización de modelos"""
-    # Evitar registrar cambios en modelos de auditoría
-    if sender.__name__ in ['AuditLog', 'SecurityEvent', 'SystemChange', 'AuditConfiguration']:
+    if getattr(_audit_context, 'model_audit_suppressed', False):
         return
-        
     try:
+        options = audit_registry.get_options(sender)
         context = get_audit_context()
         action_type = 'record_created' if created else 'record_updated'
         action_category = 'data_modification'
@@ -358,13 +348,14 @@ def log_model_save(sender, instance, created, **kwargs):
         new_values = None
         changed_fields = None
         
-        if not created and hasattr(context, 'changed_data'):
-            old_values = context.changed_data.get('old_values')
-            new_values = context.changed_data.get('new_values')
-            changed_fields = context.changed_data.get('changed_fields')
+        changed_data = getattr(context, 'changed_data', None)
+        if changed_data is not None and changed_data.get('instance') is instance:
             # Limpiar datos temporales
-            if hasattr(context, 'changed_data'):
-                delattr(context, 'changed_data')
+            delattr(context, 'changed_data')
+            if not created:
+                old_values = changed_data.get('old_values')
+                new_values = changed_data.get('new_values')
+                changed_fields = changed_data.get('changed_fields')
         
         create_audit_log(
             action_type=action_type,
@@ -374,26 +365,24 @@ def log_model_save(sender, instance, created, **kwargs):
             new_values=new_values,
             changed_fields=changed_fields,
             content_object=instance,
-            severity='info'
+            severity=options.severity if options else 'info'
         )
         
     except Exception as e:
         print(f"⚠️ Error in post_save audit: {e}")
 
-@receiver(post_delete)
 def log_model_delete(sender, instance, **kwargs):
     """Registrar eliminación de modelos"""
-    # Evitar registrar cambios en modelos de auditoría
-    if sender.__name__ in ['AuditLog', 'SecurityEvent', 'SystemChange', 'AuditConfiguration']:
+    if getattr(_audit_context, 'model_audit_suppressed', False):
         return
-        
     try:
+        options = audit_registry.get_options(sender)
         create_audit_log(
             action_type='record_deleted',
             action_category='data_modification',
             description=f"{sender.__name__} deleted: {str(instance)}",
             content_object=instance,
-            severity='medium'
+            severity=options.delete_severity if options else 'medium'
         )
     except Exception as e:
         print(f"⚠️ Error in post_delete audit: {e}")
@@ -466,4 +455,7 @@ class AuditMiddleware:
         # Limpiar contexto al final de la request
         clear_audit_context()
         
+        # Despertar al escritor para persistir los logs de esta request
+        audit_log_writer.flush(wait=False)
+        
         return response
\ No newline at end of file
@@ -0,0 +1,51 @@
+import logging
+from celery import shared_task
+
+logger = logging.getLogger(__name__)
+
+@shared_task
+def ensure_audit_log_partitions(months_ahead=None):
+    """Pre-crea las particiones mensuales futuras de core_audit_logs"""
+    try:
+        from .partitions import AuditLogPartitionManager
+        
+        if not AuditLogPartitionManager.is_partitioned():
+            return "core_audit_logs no está particionada"
+        
+        created = AuditLogPartitionManager.ensure_partitions(months_ahead)
+        logger.info(f"Particiones de auditoría creadas: {created}")
+        return f"Creadas {len(created)} particiones"
+        
+    except Exception as e:
+        logger.error(f"Error creando particiones de auditoría: {str(e)}")
+        return f"Error: {str(e)}"
+
+@shared_task
+def apply_audit_retention():
+    """Archiva y elimina datos de auditoría según AuditConfiguration"""
+    try:
+        from .utils import DataRetentionManager
+        
+        archived = DataRetentionManager.archive_old_records()
+        cleaned = DataRetentionManager.cleanup_old_records()
+        
+        logger.info(f"Retención de auditoría aplicada: archivado={archived} limpieza={cleaned}")
+        return f"Archivado: {archived} - Limpieza: {cleaned}"
+        
+    except Exception as e:
+        logger.error(f"Error aplicando retención de auditoría: {str(e)}")
+        return f"Error: {str(e)}"
+
+@shared_task
+def refresh_audit_rollups():
+    """Agrega en los rollups horarios/diarios las horas cerradas desde la marca de agua"""
+    try:
+        from .rollups import AuditRollupManager
+        
+        result = AuditRollupManager.refresh()
+        logger.info(f"Rollups de auditoría actualizados: {result}")
+        return f"Agregadas {result['hours']} horas ({result['rows']} filas) hasta {result['high_water_mark']}"
+        
+    except Exception as e:
+        logger.error(f"Error actualizando rollups de auditoría: {str(e)}")
+        return f"Error: {str(e)}"
@@ -1,3 +1,569 @@
-from django.test import TestCase
+import os
+import queue
+import tempfile
+from datetime import datetime, timezone as dt_timezone
+from types import SimpleNamespace
+from unittest import mock
+from django.core.cache import cache
+from django.db.models import QuerySet
+from django.test import SimpleTestCase, TestCase, override_settings
+from dashboard.models import DashboardWidget
+from .detectors import (
+    FailedLoginDetector, FakeRedis, InMemorySlidingWindowBackend, RedisSlidingWindowBackend, SlidingWindowCounter
+)
+from .models import AuditConfiguration, AuditLog, AuditLogHourlyRollup, SecurityEvent
+from .partitions import AuditLogPartitionManager
+from .rollups import AuditRollupManager
+from .rules import SecurityRuleEngine
+from .signals import create_security_event, security_event_dedup_key
+from .tracking import change_tracker
+from .utils import AuditConfigurationCache
+from .writer import DEFAULT_WRITER_SETTINGS, AuditLogWriter
 
-# Create your tests here.
+
+class ChangeTrackerTests(TestCase):
+    """Diff de campos a partir del snapshot en memoria (post_init/post_save)"""
+
+    def setUp(self):
+        self.widget = DashboardWidget.objects.create(
+            name='Actividad', code='activity', widget_type='recent_activity',
+            component_name='ActivityWidget', data_endpoint='/api/activity/',
+            default_config={'limit': 10, 'filters': ['login']}
+        )
+
+    def test_in_place_json_edit_is_detected(self):
+        self.widget.default_config['limit'] = 20
+        self.widget.default_config['filters'].append('logout')
+
+        changes = change_tracker.get_changes(self.widget)
+
+        self.assertEqual(changes['changed_fields'], ['default_config'])
+        self.assertIn("'limit': 10", changes['old_values']['default_config'])
+        self.assertIn("'limit': 20", changes['new_values']['default_config'])
+
+    def test_loaded_instance_detects_in_place_edit(self):
+        widget = DashboardWidget.objects.get(pk=self.widget.pk)
+        widget.default_config['filters'].append('logout')
+
+        self.assertEqual(change_tracker.get_changes(widget)['changed_fields'], ['default_config'])
+
+    def test_save_resets_reference(self):
+        self.widget.default_config['limit'] = 20
+        self.widget.save()
+
+        self.assertIsNone(change_tracker.get_changes(self.widget))
+
+    def test_refresh_from_db_resets_reference(self):
+        DashboardWidget.objects.filter(pk=self.widget.pk).update(name='Actividad reciente')
+        self.widget.refresh_from_db()
+
+        self.assertIsNone(change_tracker.get_changes(self.widget))
+
+    def test_partial_refresh_keeps_pending_changes(self):
+        self.widget.default_config['limit'] = 20
+        DashboardWidget.objects.filter(pk=self.widget.pk).update(name='Actividad reciente')
+
+        self.widget.refresh_from_db(fields=['name'])
+
+        self.assertEqual(change_tracker.get_changes(self.widget)['changed_fields'], ['default_config'])
+
+
+class UnavailableBackend:
+    """Backend que falla como un Redis caído"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def hit(self, key, window_seconds, now=None):
+        self.calls += 1
+        raise ConnectionError('redis unavailable')
+
+    def reset(self, key):
+        self.calls += 1
+        raise ConnectionError('redis unavailable')
+
+
+class SlidingWindowCounterTests(SimpleTestCase):
+    """Contadores de ventana deslizante (Redis sobre FakeRedis y memoria)"""
+
+    def test_redis_backend_drops_events_outside_window(self):
+        backend = RedisSlidingWindowBackend(FakeRedis())
+
+        self.assertEqual(backend.hit('k', 60, now=1000), 1)
+        self.assertEqual(backend.hit('k', 60, now=1030), 2)
+        self.assertEqual(backend.hit('k', 60, now=1060), 2)  # el de 1000 queda en el borde: vence
+        self.assertEqual(backend.count('k', 60, now=1100), 1)
+        self.assertEqual(backend.count('k', 60, now=1200), 0)
+
+    def test_redis_and_memory_backends_agree(self):
+        redis_backend = RedisSlidingWindowBackend(FakeRedis())
+        memory_backend = InMemorySlidingWindowBackend()
+
+        for now in (0, 10, 20, 65, 70, 200):
+            self.assertEqual(redis_backend.hit('k', 60, now=now), memory_backend.hit('k', 60, now=now), now)
+
+    def test_reset_clears_key(self):
+        backend = RedisSlidingWindowBackend(FakeRedis())
+        backend.hit('k', 60, now=1000)
+
+        backend.reset('k')
+
+        self.assertEqual(backend.count('k', 60, now=1000), 0)
+
+    def test_falls_back_to_memory_while_backend_is_down(self):
+        backend = UnavailableBackend()
+        counter = SlidingWindowCounter(backend)
+
+        with self.assertLogs('core_audit.detectors', 'WARNING'):
+            self.assertEqual(counter.hit('k', 60, now=1000), 1)
+        # En backoff no se reintenta el backend
+        self.assertEqual(counter.hit('k', 60, now=1001), 2)
+        self.assertEqual(backend.calls, 1)
+
+    def test_backend_is_retried_after_backoff(self):
+        backend = UnavailableBackend()
+        counter = SlidingWindowCounter(backend)
+        with self.assertLogs('core_audit.detectors', 'WARNING'):
+            counter.hit('k', 60, now=1000)
+
+        with mock.patch('core_audit.detectors.time.monotonic', return_value=counter._retry_at + 1):
+            with self.assertLogs('core_audit.detectors', 'WARNING'):
+                counter.hit('k', 60, now=1001)
+
+        self.assertEqual(backend.calls, 2)
+        self.assertEqual(counter._backoff, 10)  # se duplica en cada fallo
+
+    def test_recovered_backend_resets_backoff(self):
+        backend = mock.Mock()
+        backend.hit.side_effect = [ConnectionError('redis unavailable'), 5]
+        counter = SlidingWindowCounter(backend)
+        with self.assertLogs('core_audit.detectors', 'WARNING'):
+            counter.hit('k', 60, now=1000)
+
+        with mock.patch('core_audit.detectors.time.monotonic', return_value=counter._retry_at + 1):
+            self.assertEqual(counter.hit('k', 60, now=1001), 5)
+
+        self.assertEqual(counter._backoff, 0)
+
+
+class FailedLoginDetectorTests(SimpleTestCase):
+    """Umbral de logins fallidos por usuario e IP"""
+
+    def setUp(self):
+        self.detector = FailedLoginDetector(SlidingWindowCounter(RedisSlidingWindowBackend(FakeRedis())))
+        self.config = SimpleNamespace(failed_login_threshold=3, failed_login_timeframe_minutes=10)
+
+    def failed_login(self, minute, user_id=7, ip_address='10.0.0.1'):
+        timestamp = datetime(2026, 1, 1, 8, minute, tzinfo=dt_timezone.utc)
+        audit_log = SimpleNamespace(user_id=user_id, ip_address=ip_address, timestamp=timestamp)
+        return self.detector.record(audit_log, self.config)
+
+    def test_threshold_is_reported_per_scope(self):
+        self.assertEqual(self.failed_login(0), [])
+        self.assertEqual(self.failed_login(1), [])
+
+        exceeded = self.failed_login(2)
+
+        self.assertEqual(
+            exceeded, [{'scope': 'user', 'value': 7, 'count': 3}, {'scope': 'ip', 'value': '10.0.0.1', 'count': 3}]
+        )
+
+    def test_attempts_outside_timeframe_do_not_count(self):
+        self.failed_login(0)
+        self.failed_login(1)
+
+        self.assertEqual(self.failed_login(12), [])
+
+    def test_ip_counter_spans_users(self):
+        self.failed_login(0, user_id=1)
+        self.failed_login(1, user_id=2)
+
+        self.assertEqual(self.failed_login(2, user_id=3), [{'scope': 'ip', 'value': '10.0.0.1', 'count': 3}])
+
+    def test_reset_after_successful_login(self):
+        self.failed_login(0)
+        self.failed_login(1)
+
+        self.detector.reset(user=7, ip_address='10.0.0.1')
+
+        self.assertEqual(self.failed_login(2), [])
+
+
+@override_settings(AUDIT_LOG_WRITER={
+    **DEFAULT_WRITER_SETTINGS, 'MODE': 'async', 'BATCH_SIZE': 2, 'MAX_QUEUE_SIZE': 100, 'ENQUEUE_TIMEOUT': 0
+})
+class AuditLogWriterTests(TestCase):
+    """Escritura en lotes: diferida al commit, orden FIFO y fallback por fila"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.config = AuditConfiguration.objects.create()
+
+    def setUp(self):
+        # Sin hilo de fondo: flush() escribe en la conexión (y transacción) del test
+        self.writer = AuditLogWriter()
+        patcher = mock.patch.object(self.writer, '_ensure_started', side_effect=self.start_without_thread)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def start_without_thread(self, options):
+        if self.writer._queue is None:
+            self.writer._queue = queue.Queue(maxsize=options['MAX_QUEUE_SIZE'])
+            self.writer._pid = os.getpid()
+
+    def audit_log(self, description, action_type='record_updated'):
+        return AuditLog(
+            action_category='data_modification', action_type=action_type,
+            severity='info', description=description
+        )
+
+    def written(self):
+        return list(AuditLog.objects.filter(description__startswith='log-').values_list('description', flat=True))
+
+    def test_write_waits_for_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.writer.write(self.audit_log('log-1'), self.config)
+        self.assertEqual(self.writer.pending_count(), 0)
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.writer.pending_count(), 1)
+        self.assertEqual(self.written(), [])
+
+        self.writer.flush()
+        self.assertEqual(self.written(), ['log-1'])
+
+    def test_sync_write_persists_immediately(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            audit_log = self.writer.write(self.audit_log('log-1'), self.config, sync=True)
+
+        self.assertEqual(callbacks, [])
+        self.assertTrue(AuditLog.objects.filter(pk=audit_log.pk).exists())
+
+    def test_flush_writes_queue_in_batches(self):
+        with mock.patch.object(self.writer, '_write_batch', wraps=self.writer._write_batch) as write_batch:
+            with self.captureOnCommitCallbacks(execute=True):
+                for i in range(5):
+                    self.writer.write(self.audit_log(f'log-{i}'), self.config)
+            self.writer.flush()
+
+        self.assertEqual([len(call.args[0]) for call in write_batch.call_args_list], [2, 2, 1])
+        self.assertEqual(sorted(self.written()), [f'log-{i}' for i in range(5)])
+
+    @override_settings(AUDIT_LOG_WRITER={
+        **DEFAULT_WRITER_SETTINGS, 'MODE': 'async', 'BATCH_SIZE': 10, 'MAX_QUEUE_SIZE': 2, 'ENQUEUE_TIMEOUT': 0
+    })
+    def test_full_queue_does_not_overtake_queued_logs(self):
+        with mock.patch.object(self.writer, '_write_batch', wraps=self.writer._write_batch) as write_batch:
+            with self.captureOnCommitCallbacks(execute=True):
+                for i in range(3):
+                    self.writer.write(self.audit_log(f'log-{i}'), self.config)
+
+        order = [audit_log.description for call in write_batch.call_args_list for audit_log, _ in call.args[0]]
+        self.assertEqual(order, ['log-0', 'log-1', 'log-2'])
+        self.assertEqual(self.writer.pending_count(), 0)
+        self.assertEqual(len(self.written()), 3)
+
+    def test_failed_bulk_create_falls_back_to_single_rows(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.writer.write(self.audit_log('log-ok'), self.config)
+            self.writer.write(self.audit_log('log-bad', action_type=None), self.config)
+
+        with self.assertLogs('core_audit.writer', 'WARNING') as logs:
+            self.writer.flush()
+
+        self.assertEqual(self.written(), ['log-ok'])
+        self.assertTrue(any('Audit log dropped' in line for line in logs.output))
+
+
+class AuditConfigurationCacheTests(TestCase):
+    """Snapshot de la configuración activa invalidado por versión"""
+
+    def setUp(self):
+        AuditConfigurationCache.invalidate()
+
+    def test_snapshot_is_reused_without_queries(self):
+        config = AuditConfiguration.objects.create(failed_login_threshold=4)
+
+        self.assertEqual(AuditConfigurationCache.get().pk, config.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(AuditConfigurationCache.get().failed_login_threshold, 4)
+
+    def test_save_invalidates_snapshot(self):
+        config = AuditConfiguration.objects.create(failed_login_threshold=4)
+        AuditConfigurationCache.get()
+
+        config.failed_login_threshold = 8
+        config.save()
+
+        self.assertEqual(AuditConfigurationCache.get().failed_login_threshold, 8)
+
+    def test_version_bump_from_another_process_reloads(self):
+        config = AuditConfiguration.objects.create(failed_login_threshold=4)
+        AuditConfigurationCache.get()
+        # Cambio sin señales: el snapshot sigue vigente hasta que cambie la versión
+        AuditConfiguration.objects.filter(pk=config.pk).update(failed_login_threshold=8)
+        self.assertEqual(AuditConfigurationCache.get().failed_login_threshold, 4)
+
+        cache.incr(AuditConfigurationCache.VERSION_KEY)
+
+        self.assertEqual(AuditConfigurationCache.get().failed_login_threshold, 8)
+
+    def test_missing_configuration_is_cached(self):
+        self.assertIsNone(AuditConfigurationCache.get())
+        with self.assertNumQueries(0):
+            self.assertIsNone(AuditConfigurationCache.get())
+
+    def test_deactivated_configuration_is_dropped(self):
+        config = AuditConfiguration.objects.create()
+        AuditConfigurationCache.get()
+
+        config.is_active = False
+        config.save()
+
+        self.assertIsNone(AuditConfigurationCache.get())
+
+
+@override_settings(AUDIT_ROLLUPS={'GRACE_SECONDS': 300, 'MAX_HOURS_PER_RUN': 24 * 31})
+class AuditRollupTests(TestCase):
+    """Rollups incrementales: marca de agua, margen de gracia y agregados combinados"""
+
+    def at(self, hour, minute=0, day=1):
+        return datetime(2026, 1, day, hour, minute, tzinfo=dt_timezone.utc)
+
+    def log(self, timestamp, action_type='record_updated'):
+        return AuditLog.objects.create(
+            action_category='data_modification', action_type=action_type,
+            severity='info', description='rollup', timestamp=timestamp
+        )
+
+    def refresh(self, now):
+        with mock.patch('core_audit.rollups.timezone.now', return_value=now):
+            return AuditRollupManager.refresh()
+
+    def hourly_counts(self):
+        return {
+            bucket: total for bucket, total in
+            AuditLogHourlyRollup.objects.order_by('bucket').values_list('bucket', 'count')
+        }
+
+    def test_grace_period_delays_closed_hour(self):
+        self.log(self.at(8, 10))
+        self.log(self.at(8, 50))
+        self.log(self.at(9, 30))
+
+        # 10:03 - 5 min de gracia = 09:58: la hora 09:00 aún no se agrega
+        result = self.refresh(self.at(10, 3))
+
+        self.assertEqual(result['high_water_mark'], self.at(9))
+        self.assertEqual(self.hourly_counts(), {self.at(8): 2})
+
+        result = self.refresh(self.at(10, 6))
+
+        self.assertEqual(result['high_water_mark'], self.at(10))
+        self.assertEqual(self.hourly_counts(), {self.at(8): 2, self.at(9): 1})
+
+    def test_hours_are_aggregated_once(self):
+        self.log(self.at(8, 10))
+        self.refresh(self.at(10, 6))
+
+        result = self.refresh(self.at(10, 30))
+
+        self.assertEqual((result['hours'], result['rows']), (0, 0))
+        self.assertEqual(AuditRollupManager.get_high_water_mark(), self.at(10))
+
+    def test_max_hours_per_run_advances_in_steps(self):
+        self.log(self.at(1, 10))
+        self.log(self.at(5, 10))
+
+        with mock.patch('core_audit.rollups.timezone.now', return_value=self.at(10, 6)):
+            first = AuditRollupManager.refresh(max_hours=2)
+            second = AuditRollupManager.refresh(max_hours=2)
+
+        self.assertEqual(first['high_water_mark'], self.at(3))
+        self.assertEqual(second['high_water_mark'], self.at(5))
+        self.assertEqual(self.hourly_counts(), {self.at(1): 1})
+
+    def test_aggregate_matches_raw_counts(self):
+        for timestamp in (self.at(22, 15, day=1), self.at(3, 0, day=2), self.at(14, 45, day=2),
+                          self.at(2, 20, day=3), self.at(9, 40, day=3)):
+            self.log(timestamp)
+        self.log(self.at(9, 50, day=3), action_type='record_deleted')
+        self.refresh(self.at(8, 6, day=3))
+
+        start, end = self.at(22, 30, day=1), self.at(10, 0, day=3)
+        expected = AuditLog.objects.filter(timestamp__gte=start, timestamp__lt=end).count()
+
+        with mock.patch('core_audit.rollups.timezone.now', return_value=self.at(10, 0, day=3)):
+            totals = AuditRollupManager.aggregate(start, end, group_by=['action_type'])
+
+        self.assertEqual(
+            {row['action_type']: row['count'] for row in totals}, {'record_updated': 4, 'record_deleted': 1}
+        )
+        self.assertEqual(sum(row['count'] for row in totals), expected)
+
+
+class AuditLogPartitionTests(TestCase):
+    """Las filas que caen en la partición por defecto no escapan a la retención"""
+
+    def log(self, timestamp):
+        return AuditLog.objects.create(
+            action_category='data_modification', action_type='record_updated',
+            severity='info', description='partition', timestamp=timestamp
+        )
+
+    def default_rows(self):
+        return list(AuditLog.objects.raw(
+            f'SELECT * FROM {AuditLogPartitionManager._qn(AuditLogPartitionManager.DEFAULT_PARTITION)}'
+        ))
+
+    def partition_names(self):
+        return {p['name'] for p in AuditLogPartitionManager.list_partitions()}
+
+    def test_drop_includes_default_partition_rows(self):
+        old = self.log(datetime(2001, 3, 15, tzinfo=dt_timezone.utc))
+        recent = self.log(datetime(2001, 6, 15, tzinfo=dt_timezone.utc))
+        self.assertEqual(len(self.default_rows()), 2)
+
+        dropped = AuditLogPartitionManager.drop_partitions_before(datetime(2001, 5, 1, tzinfo=dt_timezone.utc))
+
+        self.assertEqual(dropped, {'core_audit_logs_p2001_03': 1})
+        self.assertFalse(AuditLog.objects.filter(pk=old.pk).exists())
+        # La fila posterior al corte no se toca
+        self.assertEqual([row.pk for row in self.default_rows()], [recent.pk])
+        self.assertNotIn('core_audit_logs_p2001_03', self.partition_names())
+
+    def test_archive_includes_default_partition_rows(self):
+        old = self.log(datetime(2001, 3, 15, tzinfo=dt_timezone.utc))
+
+        with tempfile.TemporaryDirectory() as archive_dir:
+            with override_settings(AUDIT_LOG_PARTITIONING={'ARCHIVE_DIR': archive_dir}):
+                archived = AuditLogPartitionManager.archive_partitions_before(
+                    datetime(2001, 5, 1, tzinfo=dt_timezone.utc), mode='file'
+                )
+            self.assertEqual(list(archived), ['core_audit_logs_p2001_03'])
+            self.assertTrue(os.path.exists(archived['core_audit_logs_p2001_03']))
+
+        self.assertFalse(AuditLog.objects.filter(pk=old.pk).exists())
+        self.assertEqual(self.default_rows(), [])
+
+    def test_ensure_partitions_empties_default_partition(self):
+        self.log(datetime(2001, 3, 15, tzinfo=dt_timezone.utc))
+
+        created = AuditLogPartitionManager.ensure_partitions(months_ahead=1)
+
+        self.assertIn('core_audit_logs_p2001_03', created)
+        self.assertEqual(self.default_rows(), [])
+        self.assertEqual(AuditLog.objects.filter(timestamp__year=2001).count(), 1)
+
+
+@override_settings(AUDIT_SECURITY_EVENT_DEDUP={'BUCKET_MINUTES': 60, 'MAX_RELATED_LOGS': 2})
+class SecurityEventDedupTests(TestCase):
+    """Un evento abierto por (event_type, usuario, bucket): las repeticiones suman ocurrencias"""
+
+    def log(self, minute, hour=8):
+        return AuditLog(
+            action_category='authentication', action_type='login_failed', severity='low',
+            description='Failed login', ip_address='10.0.0.1',
+            timestamp=datetime(2026, 1, 1, hour, minute, tzinfo=dt_timezone.utc)
+        )
+
+    def event(self, audit_log):
+        return create_security_event('multiple_failed_logins', audit_log, 'high')
+
+    def test_repeated_event_increments_open_event(self):
+        first = self.event(self.log(5))
+        second = self.event(self.log(40))
+
+        self.assertEqual(first.pk, second.pk)
+        event = SecurityEvent.objects.get()
+        self.assertEqual(event.occurrence_count, 2)
+        self.assertEqual(event.first_occurrence, self.log(5).timestamp)
+        self.assertEqual(event.last_occurrence, self.log(40).timestamp)
+
+    def test_related_logs_are_capped(self):
+        for minute in (1, 2, 3):
+            self.event(self.log(minute))
+
+        event = SecurityEvent.objects.get()
+        self.assertEqual(event.occurrence_count, 3)
+        self.assertEqual(SecurityEvent.related_audit_logs.through.objects.filter(securityevent=event).count(), 2)
+
+    def test_next_bucket_opens_new_event(self):
+        self.event(self.log(50, hour=8))
+        self.event(self.log(10, hour=9))
+
+        self.assertEqual(SecurityEvent.objects.count(), 2)
+
+    def test_closed_event_releases_key(self):
+        closed = self.event(self.log(5))
+        SecurityEvent.objects.filter(pk=closed.pk).update(status='resolved')
+
+        reopened = self.event(self.log(20))
+
+        self.assertNotEqual(reopened.pk, closed.pk)
+        self.assertIsNone(SecurityEvent.objects.get(pk=closed.pk).dedup_key)
+        self.assertEqual(SecurityEvent.objects.get(pk=reopened.pk).occurrence_count, 1)
+
+    def test_concurrent_create_retries_as_increment(self):
+        self.event(self.log(5))
+        real_update = QuerySet.update
+        calls = []
+
+        def update(queryset, **kwargs):
+            # La primera suma no ve el evento: otro proceso lo está creando
+            calls.append(kwargs)
+            return 0 if len(calls) == 1 else real_update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', autospec=True, side_effect=update):
+            event = self.event(self.log(6))
+
+        # Suma fallida, INSERT con IntegrityError, liberar claves cerradas y suma
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(SecurityEvent.objects.count(), 1)
+        self.assertEqual(SecurityEvent.objects.get(pk=event.pk).occurrence_count, 2)
+
+    def test_dedup_key_buckets(self):
+        timestamp = self.log(59).timestamp
+        self.assertEqual(
+            security_event_dedup_key('brute_force_attempt', 7, timestamp, 60),
+            f"brute_force_attempt:7:{int(datetime(2026, 1, 1, 8, tzinfo=dt_timezone.utc).timestamp())}"
+        )
+        self.assertTrue(security_event_dedup_key('brute_force_attempt', None, timestamp, 60).startswith(
+            'brute_force_attempt:anonymous:'
+        ))
+
+
+class SecurityRuleEngineTests(SimpleTestCase):
+    """Una regla que falla se registra y cuenta sin impedir las demás"""
+
+    def setUp(self):
+        self.engine = SecurityRuleEngine()
+
+        def broken_check(rule, audit_log, config):
+            raise RuntimeError('broken check')
+
+        self.engine.register_check('broken', broken_check)
+        self.engine.compile([
+            {'name': 'broken_rule', 'action_types': ['api_call'], 'check': 'broken',
+             'event_type': 'suspicious_activity', 'severity': 'high'},
+            {'name': 'failed_api_call', 'action_types': ['api_call'], 'conditions': {'is_success': False},
+             'event_type': 'unauthorized_access', 'severity': 'medium'},
+        ])
+        self.audit_log = AuditLog(
+            action_category='api', action_type='api_call', severity='info',
+            description='API call', is_success=False
+        )
+
+    def test_failing_rule_is_logged_and_counted(self):
+        with self.assertLogs('core_audit.rules', 'ERROR') as logs:
+            fired = self.engine.evaluate(self.audit_log, AuditConfiguration())
+
+        self.assertEqual([rule.name for rule, _ in fired], ['failed_api_call'])
+        self.assertIn('broken_rule', logs.output[0])
+        self.assertIn('RuntimeError: broken check', logs.output[0])
+
+        metrics = self.engine.get_metrics()
+        self.assertEqual(metrics['rule_errors'], 1)
+        self.assertEqual(metrics['rules']['broken_rule'], {'evaluated': 1, 'fired': 0, 'errors': 1})
+        self.assertEqual(metrics['rules']['failed_api_call'], {'evaluated': 1, 'fired': 1, 'errors': 0})
@@ -0,0 +1,163 @@
+import copy
+import functools
+from django.db.models import DEFERRED
+from django.db.models.signals import post_init, post_save
+from .registry import audit_registry
+
+
+class ChangeTracker:
+    """
+    Rastreo de cambios a partir de los valores cargados en memoria.
+
+    Al inicializar una instancia de un modelo rastreado (post_init) se guarda
+    una tupla con los valores de sus campos rastreados; en pre_save se compara
+    contra los valores actuales, así que calcular changed_fields/old_values no
+    requiere volver a leer la fila. Las señales solo se conectan a los modelos
+    rastreados, el resto no paga ningún costo.
+
+    Se rastrean los modelos del audit_registry con diff=True, limitados a sus
+    opciones 'fields'/'exclude'. Los valores mutables (JSONField, ArrayField)
+    se copian en el snapshot para detectar también las ediciones in situ, y
+    refresh_from_db vuelve a tomar el snapshot de los campos releídos.
+    """
+    SNAPSHOT_ATTR = '_audit_snapshot'
+
+    def __init__(self):
+        self._fields_cache = {}
+
+    def get_tracked_fields(self, model):
+        """
+        Tupla de (name, attname) rastreados para el modelo, o None si no se rastrea
+        """
+        if model not in self._fields_cache:
+            self._fields_cache[model] = self._resolve_fields(model)
+        return self._fields_cache[model]
+
+    def is_tracked(self, model):
+        return self.get_tracked_fields(model) is not None
+
+    def connect_model(self, model):
+        """Conectar post_init/post_save al modelo si debe rastrearse"""
+        self.disconnect_model(model)
+        if not self.is_tracked(model):
+            return
+        uid = model._meta.label_lower
+        post_init.connect(self._on_post_init, sender=model, weak=False,
+                          dispatch_uid=f'audit_snapshot_init_{uid}')
+        post_save.connect(self._on_post_save, sender=model, weak=False,
+                          dispatch_uid=f'audit_snapshot_save_{uid}')
+        self._wrap_refresh_from_db(model)
+
+    def disconnect_model(self, model):
+        self._fields_cache.pop(model, None)
+        uid = model._meta.label_lower
+        post_init.disconnect(sender=model, dispatch_uid=f'audit_snapshot_init_{uid}')
+        post_save.disconnect(sender=model, dispatch_uid=f'audit_snapshot_save_{uid}')
+
+    def snapshot(self, instance):
+        """Guardar los valores actuales como estado de referencia"""
+        fields = self.get_tracked_fields(instance.__class__)
+        if fields is None:
+            return
+        values = instance.__dict__
+        setattr(
+            instance,
+            self.SNAPSHOT_ATTR,
+            tuple(self._copy_value(values.get(attname, DEFERRED)) for _, attname in fields)
+        )
+
+    def refresh_snapshot(self, instance, field_names=None):
+        """Tomar como referencia los campos releídos de la base de datos"""
+        fields = self.get_tracked_fields(instance.__class__)
+        snapshot = getattr(instance, self.SNAPSHOT_ATTR, None)
+        if fields is None:
+            return
+        if snapshot is None or field_names is None:
+            return self.snapshot(instance)
+
+        field_names = set(field_names)
+        values = instance.__dict__
+        setattr(instance, self.SNAPSHOT_ATTR, tuple(
+            self._copy_value(values.get(attname, DEFERRED))
+            if name in field_names or attname in field_names else old_value
+            for (name, attname), old_value in zip(fields, snapshot)
+        ))
+
+    def get_changes(self, instance):
+        """
+        Devuelve {'old_values', 'new_values', 'changed_fields'} o None si no hay
+        cambios (o la instancia no tiene snapshot)
+        """
+        fields = self.get_tracked_fields(instance.__class__)
+        snapshot = getattr(instance, self.SNAPSHOT_ATTR, None)
+        if fields is None or snapshot is None:
+            return None
+
+        old_values = {}
+        new_values = {}
+        changed_fields = []
+        current = instance.__dict__
+
+        for (name, attname), old_value in zip(fields, snapshot):
+            # Campos diferidos no cargados: no hay valor de referencia
+            if old_value is DEFERRED or attname not in current:
+                continue
+            new_value = current[attname]
+            if old_value != new_value:
+                old_values[name] = str(old_value)
+                new_values[name] = str(new_value)
+                changed_fields.append(name)
+
+        if not changed_fields:
+            return None
+
+        return {
+            'old_values': old_values,
+            'new_values': new_values,
+            'changed_fields': changed_fields,
+        }
+
+    def _on_post_init(self, sender, instance, **kwargs):
+        self.snapshot(instance)
+
+    def _on_post_save(self, sender, instance, **kwargs):
+        # El estado guardado pasa a ser la nueva referencia
+        self.snapshot(instance)
+
+    @staticmethod
+    def _copy_value(value):
+        # Un dict/list compartido con la instancia cambiaría junto con ella
+        if isinstance(value, (dict, list, set)):
+            return copy.deepcopy(value)
+        return value
+
+    def _wrap_refresh_from_db(self, model):
+        # refresh_from_db no emite señales: envolverlo una vez por modelo
+        original = model.refresh_from_db
+        if getattr(original, '_audit_snapshot', False):
+            return
+
+        @functools.wraps(original)
+        def refresh_from_db(instance, using=None, fields=None, *args, **kwargs):
+            original(instance, using, fields, *args, **kwargs)
+            self.refresh_snapshot(instance, fields)
+
+        refresh_from_db._audit_snapshot = True
+        model.refresh_from_db = refresh_from_db
+
+    def _resolve_fields(self, model):
+        options = audit_registry.get_options(model)
+        if options is None or not options.diff:
+            return None
+
+        excluded = set(options.exclude)
+        return tuple(
+            (field.name, field.attname)
+            for field in model._meta.concrete_fields
+            if not field.primary_key
+            and field.name not in excluded
+            and (options.fields is None or field.name in options.fields)
+        )
+
+
+change_tracker = ChangeTracker()
@@ -0,0 +1,9 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('export/', views.AuditLogExportView.as_view(), name='audit-export'),
+    path('rules/metrics/', views.SecurityRuleMetricsView.as_view(), name='security-rule-metrics'),
+]
+
+app_name = 'core_audit'
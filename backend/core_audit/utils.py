@@ -1,14 +1,79 @@
 import threading
+import time
 from django.utils import timezone
 from django.db import transaction
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
+from django.db.models import Count
 from .models import AuditLog, SecurityEvent, SystemChange, AuditConfiguration
+from .rollups import AuditRollupManager
 from datetime import timedelta
 import json
 import uuid
 
 _audit_context = threading.local()
 
+class AuditConfigurationCache:
+    """
+    Snapshot de la configuración activa de auditoría compartido por el proceso.
+
+    Cada proceso guarda (versión, configuración) en memoria. La versión vive en
+    el caché de Django, así que un save/delete de AuditConfiguration en
+    cualquier proceso la incrementa y el resto recarga en su siguiente lectura.
+    Una lectura normal cuesta un cache.get de la versión y ninguna query.
+    """
+    VERSION_KEY = 'core_audit:config:version'
+    CONFIG_KEY = 'core_audit:config:{version}'
+    TIMEOUT = None  # Sin expiración: la invalidación es explícita
+    _MISSING = 'missing'  # Marca "no hay configuración activa" en el caché
+    
+    _snapshot = (None, None)  # (versión, configuración)
+    
+    @classmethod
+    def get(cls):
+        """Obtener la configuración activa (o None)"""
+        version = cls._get_version()
+        cached_version, config = cls._snapshot
+        if cached_version == version:
+            return config
+        
+        config = cache.get(cls.CONFIG_KEY.format(version=version))
+        if config is None:
+            config = AuditConfiguration.objects.filter(is_active=True).first()
+            cache.set(
+                cls.CONFIG_KEY.format(version=version),
+                config if config is not None else cls._MISSING,
+                cls.TIMEOUT
+            )
+        elif config == cls._MISSING:
+            config = None
+        
+        cls._snapshot = (version, config)
+        return config
+    
+    @classmethod
+    def invalidate(cls):
+        """Incrementar la versión para que todos los procesos recarguen"""
+        cls._snapshot = (None, None)
+        try:
+            cache.incr(cls.VERSION_KEY)
+        except ValueError:
+            # La clave no existe (caché vacío o expulsada)
+            cache.set(cls.VERSION_KEY, cls._initial_version(), cls.TIMEOUT)
+    
+    @classmethod
+    def _get_version(cls):
+        version = cache.get(cls.VERSION_KEY)
+        if version is None:
+            cache.add(cls.VERSION_KEY, cls._initial_version(), cls.TIMEOUT)
+            version = cache.get(cls.VERSION_KEY)
+        return version
+    
+    @staticmethod
+    def _initial_version():
+        # Basada en el reloj para no reutilizar versiones si la clave se pierde
+        return int(time.time() * 1000)
+
 class AuditManager:
     """
     Clase principal para gestión de auditoría
@@ -17,7 +82,7 @@ class AuditManager:
     @staticmethod
     def get_audit_configuration():
         """Obtener configuración activa de auditoría"""
-        return AuditConfiguration.objects.filter(is_active=True).first()
+        return AuditConfigurationCache.get()
     
     @staticmethod
     def log_security_incident(event_type, user, description, severity='medium', evidence=None):
@@ -70,6 +135,9 @@ class AuditManager:
 class AuditReportGenerator:
     """
     Generador de reportes de auditoría
+
+    Los reportes de AuditLog leen los rollups horarios/diarios (rollups.py);
+    solo el tramo aún no agregado se consulta sobre la tabla cruda.
     """
     
     @staticmethod
@@ -79,15 +147,10 @@ class AuditReportGenerator:
         """
         start_date = timezone.now() - timedelta(days=days)
         
-        summary = AuditLog.objects.filter(
-            timestamp__gte=start_date
-        ).values(
-            'action_category', 'action_type', 'severity', 'is_success'
-        ).annotate(
-            count=Count('id')
-        ).order_by('-count')
-        
-        return list(summary)
+        return AuditRollupManager.aggregate(
+            start_date,
+            group_by=['action_category', 'action_type', 'severity', 'is_success']
+        )
     
     @staticmethod
     def get_user_activity_report(user, days=30):
@@ -96,22 +159,17 @@ class AuditReportGenerator:
         """
         start_date = timezone.now() - timedelta(days=days)
         
-        user_activity = AuditLog.objects.filter(
-            user=user,
-            timestamp__gte=start_date
-        ).values(
-            'action_category', 'action_type'
-        ).annotate(
-            count=Count('id')
-        ).order_by('-count')
+        user_activity = AuditRollupManager.aggregate(
+            start_date,
+            group_by=['action_category', 'action_type'],
+            user=user
+        )
         
         return {
             'user': user.email,
             'period_days': days,
-            'activity': list(user_activity),
-            'total_actions': AuditLog.objects.filter(
-                user=user, timestamp__gte=start_date
-            ).count()
+            'activity': user_activity,
+            'total_actions': sum(row['count'] for row in user_activity)
         }
     
     @staticmethod
@@ -149,23 +207,26 @@ class AuditReportGenerator:
         """
         start_date = timezone.now() - timedelta(days=days)
         
-        failed_logins = AuditLog.objects.filter(
+        failed_logins = AuditRollupManager.aggregate(
+            start_date,
+            group_by=['user__email', 'ip_address'],
             action_type='login_failed',
-            timestamp__gte=start_date,
             is_success=False
-        ).values('user__email', 'ip_address').annotate(
-            count=Count('id')
-        ).filter(count__gte=threshold).order_by('-count')
+        )
         
         return {
             'period_days': days,
             'threshold': threshold,
-            'suspicious_activity': list(failed_logins)
+            'suspicious_activity': [row for row in failed_logins if row['count'] >= threshold]
         }
 
 class DataRetentionManager:
     """
     Gestor de retención y archivado de datos
+
+    En PostgreSQL core_audit_logs está particionada por mes: la retención y el
+    archivado trabajan con particiones completas (ver partitions.py). En otros
+    motores se mantiene el camino por ORM.
     """
     
     @staticmethod
@@ -173,6 +234,8 @@ class DataRetentionManager:
         """
         Limpiar registros antiguos según la configuración de retención
         """
+        from .partitions import AuditLogPartitionManager
+        
         config = AuditManager.get_audit_configuration()
         if not config:
             return {'error': 'No active audit configuration found'}
@@ -182,11 +245,17 @@ class DataRetentionManager:
         # Limpiar logs de auditoría antiguos
         if config.audit_log_retention_days > 0:
             cutoff_date = timezone.now() - timedelta(days=config.audit_log_retention_days)
-            deleted_logs = AuditLog.objects.filter(
-                timestamp__lt=cutoff_date,
-                is_archived=True
-            ).delete()
-            results['audit_logs_deleted'] = deleted_logs[0]
+            if AuditLogPartitionManager.is_partitioned():
+                dropped = AuditLogPartitionManager.drop_partitions_before(cutoff_date)
+                results['audit_logs_deleted'] = sum(dropped.values())
+                results['audit_log_partitions_dropped'] = list(dropped)
+            else:
+                deleted_logs = AuditLog.objects.filter(
+                    timestamp__lt=cutoff_date,
+                    is_archived=True
+                ).delete()
+                results['audit_logs_deleted'] = deleted_logs[0]
+            results['audit_rollups_deleted'] = AuditRollupManager.prune(cutoff_date)
         
         # Limpiar eventos de seguridad antiguos
         if config.security_event_retention_days > 0:
@@ -202,14 +271,24 @@ class DataRetentionManager:
     @staticmethod
     def archive_old_records():
         """
-        Archivar registros antiguos (marcar como archivados)
+        Archivar registros antiguos (particiones completas o, sin particiones,
+        marcar como archivados)
         """
+        from .partitions import AuditLogPartitionManager
+        
         config = AuditManager.get_audit_configuration()
         if not config or not config.enable_auto_archiving:
             return {'error': 'Auto archiving is disabled'}
         
         cutoff_date = timezone.now() - timedelta(days=config.archive_after_days)
         
+        if AuditLogPartitionManager.is_partitioned():
+            archived_partitions = AuditLogPartitionManager.archive_partitions_before(cutoff_date)
+            return {
+                'archived_partitions': archived_partitions,
+                'archive_date': cutoff_date
+            }
+        
         # Archivar logs de auditoría
         archived_logs = AuditLog.objects.filter(
             timestamp__lt=cutoff_date,
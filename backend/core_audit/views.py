@@ -1,3 +1,58 @@
-from django.shortcuts import render
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from .exporters import AuditLogExporter
+from .rules import security_rule_engine
+from .serializers import AuditLogExportSerializer
+from .signals import create_audit_log
 
-# Create your views here.
+
+class AuditLogExportView(APIView):
+    """
+    Exportación de registros de auditoría en streaming (CSV o NDJSON).
+
+    GET /api/audit/export/?export_format=csv&action_category=security&date_from=2025-01-01
+    """
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def get(self, request):
+        serializer = AuditLogExportSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        filters = dict(serializer.validated_data)
+        export_format = filters.pop('export_format')
+        exporter = AuditLogExporter(
+            user=filters.pop('user_id', None),
+            department=filters.pop('department_id', None),
+            **filters
+        )
+
+        create_audit_log(
+            action_type='data_exported',
+            action_category='data_access',
+            description=f'Exportación de auditoría ({export_format})',
+            new_values={
+                key: str(value) for key, value in request.query_params.items()
+            },
+            severity='medium'
+        )
+
+        response = StreamingHttpResponse(
+            exporter.stream(export_format),
+            content_type=AuditLogExporter.CONTENT_TYPES[export_format]
+        )
+        filename = f"audit_logs_{timezone.now():%Y%m%d_%H%M%S}.{export_format}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+class SecurityRuleMetricsView(APIView):
+    """Métricas del motor de reglas de seguridad (del proceso que atiende la request)"""
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def get(self, request):
+        return Response(security_rule_engine.get_metrics())
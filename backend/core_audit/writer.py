@@ -0,0 +1,199 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models.signals import post_save
+from .models import AuditLog
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WRITER_SETTINGS = {
+    'MODE': 'async',
+    'BATCH_SIZE': 200,
+    'FLUSH_INTERVAL': 2.0,
+    'MAX_QUEUE_SIZE': 10000,
+    'ENQUEUE_TIMEOUT': 0.5,
+}
+
+
+def get_writer_settings():
+    """Configuración efectiva del escritor (settings.AUDIT_LOG_WRITER + defaults)"""
+    return {**DEFAULT_WRITER_SETTINGS, **getattr(settings, 'AUDIT_LOG_WRITER', {})}
+
+
+class AuditLogWriter:
+    """
+    Escritor de AuditLog en lotes con cola en memoria.
+
+    create_audit_log encola la instancia (ya con id y timestamp asignados) al
+    confirmarse la transacción en curso (transaction.on_commit: una request
+    revertida no deja logs y las FK ya existen cuando se escribe) y un hilo de
+    fondo la persiste con bulk_create en su propia conexión. Los lotes se escriben cuando se
+    alcanza BATCH_SIZE, cada FLUSH_INTERVAL segundos o al final de la request.
+    La cola es acotada: si está llena, el productor espera ENQUEUE_TIMEOUT y,
+    si sigue llena, vacía la cola en su hilo y escribe después su registro
+    (nunca se descarta). La escritura siempre pasa por el drenador FIFO, así
+    se mantiene el orden de los eventos de cada correlation_id.
+
+    Con MODE='sync' (tests) o write(..., sync=True) el registro se guarda
+    inmediatamente, dentro de la transacción del llamador. Los registros que
+    no se pueden escribir se reportan con logger.error.
+    """
+
+    def __init__(self):
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.RLock()
+        self._start_lock = threading.Lock()
+
+    @property
+    def is_sync(self):
+        return get_writer_settings()['MODE'] == 'sync'
+
+    def write(self, audit_log, config, sync=False):
+        """
+        Registrar un AuditLog. Devuelve la instancia, persistida solo con
+        sync=True o MODE='sync'; si no, se encola al confirmar la transacción
+        """
+        if sync or self.is_sync:
+            self._write_now(audit_log, config)
+            return audit_log
+
+        transaction.on_commit(lambda: self._enqueue(audit_log, config), robust=True)
+        return audit_log
+
+    def _enqueue(self, audit_log, config):
+        options = get_writer_settings()
+        self._ensure_started(options)
+        try:
+            self._queue.put((audit_log, config), timeout=options['ENQUEUE_TIMEOUT'])
+        except queue.Full:
+            # Backpressure agotado: escribir en el hilo actual detrás de lo ya
+            # encolado, sin adelantar a registros anteriores
+            self._drain(tail=(audit_log, config))
+            return
+
+        if self._queue.qsize() >= options['BATCH_SIZE']:
+            self._wakeup.set()
+
+    def flush(self, wait=True):
+        """
+        Forzar la escritura de lo pendiente.
+        wait=False solo despierta al hilo de fondo (fin de request).
+        """
+        if self._queue is None or self._pid != os.getpid():
+            return
+        if wait:
+            self._drain()
+        else:
+            self._wakeup.set()
+
+    def pending_count(self):
+        """Número de registros en cola"""
+        if self._queue is None or self._pid != os.getpid():
+            return 0
+        return self._queue.qsize()
+
+    def _ensure_started(self, options):
+        # Tras un fork (gunicorn/celery) el hilo del padre no existe en el hijo
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=options['MAX_QUEUE_SIZE'])
+                self._flush_lock = threading.RLock()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run,
+                name='audit-log-writer',
+                daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(timeout=get_writer_settings()['FLUSH_INTERVAL'])
+            self._wakeup.clear()
+            try:
+                self._drain()
+            except Exception:
+                logger.exception("Error flushing audit logs")
+            finally:
+                close_old_connections()
+
+    def _drain(self, tail=None):
+        # tail: registro que no cupo en la cola, se escribe después de vaciarla
+        batch_size = get_writer_settings()['BATCH_SIZE']
+        with self._flush_lock:
+            while True:
+                batch = []
+                while len(batch) < batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if not batch:
+                    break
+                self._write_batch(batch)
+            if tail is not None:
+                self._write_batch([tail])
+
+    def _write_batch(self, batch):
+        audit_logs = [audit_log for audit_log, _ in batch]
+        try:
+            with transaction.atomic():
+                AuditLog.objects.bulk_create(audit_logs)
+        except Exception as e:
+            # Un registro inválido no debe tumbar el lote completo
+            logger.warning("Error in audit log bulk write, falling back to row-by-row: %s", e)
+            for audit_log, config in batch:
+                self._write_now(audit_log, config)
+            return
+
+        for audit_log, config in batch:
+            self._after_write(audit_log, config)
+
+    def _write_now(self, audit_log, config):
+        try:
+            # Savepoint: en modo síncrono un fallo no rompe la transacción del llamador
+            with transaction.atomic():
+                audit_log.save(force_insert=True)
+        except Exception as e:
+            logger.error(
+                "Audit log dropped (%s): action_type=%s category=%s correlation_id=%s "
+                "content_type_id=%s object_id=%s timestamp=%s",
+                e, audit_log.action_type, audit_log.action_category, audit_log.correlation_id,
+                audit_log.content_type_id, audit_log.object_id, audit_log.timestamp
+            )
+            return
+        self._after_write(audit_log, config, sent_post_save=True)
+
+    def _after_write(self, audit_log, config, sent_post_save=False):
+        from .signals import check_security_event
+
+        # bulk_create no emite post_save; los receptores (p.ej. notificaciones) lo esperan
+        if not sent_post_save and post_save.has_listeners(AuditLog):
+            try:
+                post_save.send(
+                    sender=AuditLog,
+                    instance=audit_log,
+                    created=True,
+                    update_fields=None,
+                    raw=False,
+                    using=audit_log._state.db
+                )
+            except Exception:
+                logger.exception("Error dispatching audit log post_save")
+
+        check_security_event(audit_log, config)
+
+
+audit_log_writer = AuditLogWriter()
+atexit.register(audit_log_writer.flush)
@@ -52,6 +52,7 @@ class DepartmentAdmin(DraggableMPTTAdmin):
         'location', 'employee_count', 'is_active', 'created_at'
     ]
     list_display_links = ['indented_title']
+    list_select_related = ['manager', 'location', 'headcount']
     list_filter = [
         'is_active', 'location', 'created_at'
     ]
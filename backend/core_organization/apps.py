@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class CoreOrganizationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core_organization'
+
+    def ready(self):
+        import core_organization.signals
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from core_organization.models import Department
+
+
+class Command(BaseCommand):
+    help = 'Recalcula las rutas desnormalizadas de los departamentos (ancestor_ids y path_names)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tree-id', type=int, action='append', dest='tree_ids', help='Solo estos árboles')
+
+    def handle(self, *args, **options):
+        changed = Department.rebuild_paths(options['tree_ids'])
+        self.stdout.write(f'✅ Rutas actualizadas en {changed} departamentos')
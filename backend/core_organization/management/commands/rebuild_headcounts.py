@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from core_organization.models import DepartmentHeadcount
+
+
+class Command(BaseCommand):
+    help = 'Recalcula los conteos materializados por departamento (DepartmentHeadcount)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tree-id', type=int, action='append', dest='tree_ids', help='Solo estos árboles')
+
+    def handle(self, *args, **options):
+        total = DepartmentHeadcount.rebuild(options['tree_ids'])
+        self.stdout.write(f'✅ Conteos recalculados para {total} departamentos')
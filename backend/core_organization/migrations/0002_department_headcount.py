@@ -0,0 +1,75 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def build_headcounts(apps, schema_editor):
+    Department = apps.get_model('core_organization', 'Department')
+    DepartmentHeadcount = apps.get_model('core_organization', 'DepartmentHeadcount')
+    OrganizationalAssignment = apps.get_model('core_organization', 'OrganizationalAssignment')
+    UserRole = apps.get_model('core_permissions', 'UserRole')
+
+    direct_roles = dict(
+        UserRole.objects.filter(department__isnull=False).values('department_id')
+        .annotate(total=models.Count('id')).values_list('department_id', 'total')
+    )
+    direct_assignments = dict(
+        OrganizationalAssignment.objects.filter(is_active=True).values('department_id')
+        .annotate(total=models.Count('id')).values_list('department_id', 'total')
+    )
+    nodes = list(Department.objects.order_by('tree_id', 'lft').values_list('pk', 'tree_id', 'lft', 'rght'))
+    rows = {
+        pk: DepartmentHeadcount(
+            department_id=pk,
+            direct_roles=direct_roles.get(pk, 0),
+            subtree_roles=direct_roles.get(pk, 0),
+            direct_assignments=direct_assignments.get(pk, 0),
+            subtree_assignments=direct_assignments.get(pk, 0),
+        )
+        for pk, _, _, _ in nodes
+    }
+
+    def close(stack):
+        pk, tree_id, _ = stack.pop()
+        if stack and stack[-1][1] == tree_id:
+            parent = rows[stack[-1][0]]
+            parent.subtree_roles += rows[pk].subtree_roles
+            parent.subtree_assignments += rows[pk].subtree_assignments
+
+    stack = []
+    for pk, tree_id, lft, rght in nodes:
+        while stack and (stack[-1][1] != tree_id or stack[-1][2] < lft):
+            close(stack)
+        stack.append((pk, tree_id, rght))
+    while stack:
+        close(stack)
+    DepartmentHeadcount.objects.bulk_create(list(rows.values()), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_organization', '0001_initial'),
+        ('core_permissions', '0007_assignment_expiry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DepartmentHeadcount',
+            fields=[
+                ('department', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='headcount', serialize=False, to='core_organization.department', verbose_name='department')),
+                ('direct_roles', models.IntegerField(default=0, verbose_name='direct role assignments')),
+                ('subtree_roles', models.IntegerField(default=0, verbose_name='subtree role assignments')),
+                ('direct_assignments', models.IntegerField(default=0, verbose_name='direct organizational assignments')),
+                ('subtree_assignments', models.IntegerField(default=0, verbose_name='subtree organizational assignments')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='updated at')),
+            ],
+            options={
+                'verbose_name': 'department headcount',
+                'verbose_name_plural': 'department headcounts',
+                'db_table': 'core_organization_department_headcounts',
+            },
+        ),
+        migrations.RunPython(build_headcounts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:02
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.conf import settings
+from django.db import migrations, models
+
+
+def build_department_paths(apps, schema_editor):
+    Department = apps.get_model('core_organization', 'Department')
+    changed = []
+    stack = []
+    for node in Department.objects.order_by('tree_id', 'lft').only('id', 'name', 'tree_id', 'lft', 'rght').iterator(chunk_size=2000):
+        while stack and (stack[-1].tree_id != node.tree_id or stack[-1].rght < node.lft):
+            stack.pop()
+        if stack:
+            node.ancestor_ids = stack[-1].ancestor_ids + [stack[-1].pk]
+            node.path_names = stack[-1].path_names + [node.name]
+        else:
+            node.ancestor_ids, node.path_names = [], [node.name]
+        changed.append(node)
+        stack.append(node)
+    Department.objects.bulk_update(changed, ['ancestor_ids', 'path_names'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_organization', '0002_department_headcount'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='department',
+            name='ancestor_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), blank=True, default=list, editable=False, size=None, verbose_name='ancestor IDs'),
+        ),
+        migrations.AddField(
+            model_name='department',
+            name='path_names',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=100), blank=True, default=list, editable=False, size=None, verbose_name='path names'),
+        ),
+        migrations.RunPython(build_department_paths, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='department',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['ancestor_ids'], name='core_dept_ancestor_ids_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='department',
+            index=models.Index(fields=['tree_id', 'lft'], name='core_organization_departme53d4'),
+        ),
+    ]
@@ -1,6 +1,9 @@
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
 from mptt.models import MPTTModel, TreeForeignKey
 
 CustomUser = get_user_model()
@@ -97,6 +100,22 @@ class Department(MPTTModel):
     budget_code = models.CharField(_('budget code'), max_length=50, blank=True)
     cost_center = models.CharField(_('cost center'), max_length=50, blank=True)
     
+    # Ruta desnormalizada (se mantiene al crear, mover o renombrar; ver update_subtree_paths)
+    ancestor_ids = ArrayField(
+        models.BigIntegerField(),
+        default=list,
+        blank=True,
+        editable=False,
+        verbose_name=_('ancestor IDs')
+    )
+    path_names = ArrayField(
+        models.CharField(max_length=100),
+        default=list,
+        blank=True,
+        editable=False,
+        verbose_name=_('path names')
+    )
+    
     created_at = models.DateTimeField(_('created at'), auto_now_add=True)
     updated_at = models.DateTimeField(_('updated at'), auto_now=True)
 
@@ -105,6 +124,9 @@ class Department(MPTTModel):
         verbose_name = _('department')
         verbose_name_plural = _('departments')
         ordering = ['tree_id', 'order', 'name']
+        indexes = [
+            GinIndex(fields=['ancestor_ids'], name='core_dept_ancestor_ids_gin'),
+        ]
 
     class MPTTMeta:
         order_insertion_by = ['order', 'name']
@@ -112,32 +134,254 @@ class Department(MPTTModel):
     def __str__(self):
         return self.name
     
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            # Departamento nuevo: la ruta sale de la del padre
+            self.ancestor_ids, self.path_names = self._parent_path(self.parent_id)
+            self.path_names = self.path_names + [self.name]
+        super().save(*args, **kwargs)
+    
     @property
     def full_path(self):
         """
-        Ruta completa del departamento en la jerarquía
+        Ruta completa del departamento en la jerarquía (sin consultas)
         """
+        if self.path_names:
+            return ' / '.join(self.path_names)
         ancestors = self.get_ancestors(include_self=True)
         return ' / '.join([dept.name for dept in ancestors])
     
+    def has_ancestor(self, department_id, include_self=False):
+        """True si department_id es un ancestro (sin consultas)"""
+        return department_id in self.ancestor_ids or (include_self and department_id == self.pk)
+    
+    @staticmethod
+    def subtree_q(department_id, field=''):
+        """Q del subárbol de department_id (incluido) usando el índice GIN de ancestor_ids"""
+        prefix = f'{field}__' if field else ''
+        return models.Q(**{f'{prefix}pk': department_id}) | models.Q(**{f'{prefix}ancestor_ids__contains': [department_id]})
+    
+    @staticmethod
+    def _parent_path(parent_id):
+        if parent_id is None:
+            return [], []
+        ancestor_ids, path_names = Department.objects.filter(pk=parent_id).values_list(
+            'ancestor_ids', 'path_names'
+        ).get()
+        return ancestor_ids + [parent_id], path_names
+    
+    def update_subtree_paths(self):
+        """
+        Recalcular ancestor_ids/path_names del departamento y de su subárbol
+        (tras moverlo o renombrarlo): una lectura ordenada por lft y un
+        bulk_update de las filas que cambian
+        """
+        self.refresh_from_db(fields=['parent', 'tree_id', 'lft', 'rght'])
+        nodes = Department.objects.filter(
+            tree_id=self.tree_id, lft__gte=self.lft, rght__lte=self.rght
+        ).order_by('lft').only('id', 'name', 'tree_id', 'lft', 'rght', 'ancestor_ids', 'path_names')
+        changed = self._assign_paths(nodes, *self._parent_path(self.parent_id))
+        Department.objects.bulk_update(changed, ['ancestor_ids', 'path_names'], batch_size=1000)
+        for node in changed:
+            if node.pk == self.pk:
+                self.ancestor_ids, self.path_names = node.ancestor_ids, node.path_names
+        return len(changed)
+    
+    @classmethod
+    def rebuild_paths(cls, tree_ids=None):
+        """Recalcular las rutas de todos los árboles (o de algunos); devuelve las filas corregidas"""
+        nodes = cls.objects.order_by('tree_id', 'lft').only(
+            'id', 'name', 'tree_id', 'lft', 'rght', 'ancestor_ids', 'path_names'
+        )
+        if tree_ids is not None:
+            nodes = nodes.filter(tree_id__in=list(tree_ids))
+        changed = cls._assign_paths(nodes.iterator(chunk_size=2000))
+        cls.objects.bulk_update(changed, ['ancestor_ids', 'path_names'], batch_size=1000)
+        return len(changed)
+    
+    @staticmethod
+    def _assign_paths(nodes, base_ids=(), base_names=()):
+        """
+        Pasada lineal en orden (tree_id, lft) con una pila de ancestros
+        abiertos; devuelve los nodos cuya ruta cambió
+        """
+        changed = []
+        stack = []
+        for node in nodes:
+            while stack and (stack[-1].tree_id != node.tree_id or stack[-1].rght < node.lft):
+                stack.pop()
+            if stack:
+                parent = stack[-1]
+                ancestor_ids = parent.ancestor_ids + [parent.pk]
+                path_names = parent.path_names + [node.name]
+            else:
+                ancestor_ids = list(base_ids)
+                path_names = list(base_names) + [node.name]
+            if node.ancestor_ids != ancestor_ids or node.path_names != path_names:
+                node.ancestor_ids, node.path_names = ancestor_ids, path_names
+                changed.append(node)
+            stack.append(node)
+        return changed
+    
     @property
     def employee_count(self):
         """
-        Número de empleados en este departamento (incluyendo sub-departamentos)
-        CORREGIDO: Usar lista de IDs en lugar del QuerySet directamente
+        Número de asignaciones de rol en este departamento (incluyendo
+        sub-departamentos), leído del conteo materializado (DepartmentHeadcount)
+        """
+        return self.get_headcount().subtree_roles
+    
+    def get_headcount(self):
+        """Fila de DepartmentHeadcount (vacía si aún no existe; usar select_related('headcount'))"""
+        try:
+            return self.headcount
+        except DepartmentHeadcount.DoesNotExist:
+            return DepartmentHeadcount(department=self)
+
+
+class DepartmentHeadcount(models.Model):
+    """
+    Conteos materializados por departamento: asignaciones de rol (UserRole)
+    y asignaciones organizacionales activas, directas y del subárbol.
+
+    Se mantienen de forma incremental (signals.py): cada alta, baja o cambio
+    de departamento aplica un delta al departamento y, en la misma consulta,
+    a todos sus ancestros (intervalo MPTT). Los movimientos de departamentos
+    recalculan sus árboles y rebuild() reconstruye todo.
+    """
+    department = models.OneToOneField(
+        Department,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='headcount',
+        verbose_name=_('department')
+    )
+    direct_roles = models.IntegerField(_('direct role assignments'), default=0)
+    subtree_roles = models.IntegerField(_('subtree role assignments'), default=0)
+    direct_assignments = models.IntegerField(_('direct organizational assignments'), default=0)
+    subtree_assignments = models.IntegerField(_('subtree organizational assignments'), default=0)
+    updated_at = models.DateTimeField(_('updated at'), auto_now=True)
+
+    COUNTERS = ('roles', 'assignments')
+
+    class Meta:
+        db_table = 'core_organization_department_headcounts'
+        verbose_name = _('department headcount')
+        verbose_name_plural = _('department headcounts')
+
+    def __str__(self):
+        return f"{self.department_id}: {self.subtree_roles} roles, {self.subtree_assignments} assignments"
+    
+    def as_dict(self):
+        return {
+            'direct_roles': self.direct_roles,
+            'subtree_roles': self.subtree_roles,
+            'direct_assignments': self.direct_assignments,
+            'subtree_assignments': self.subtree_assignments,
+        }
+    
+    @classmethod
+    def apply_delta(cls, department_id, roles=0, assignments=0):
+        """
+        Sumar un delta al departamento (directo y subárbol) y al subárbol de
+        todos sus ancestros con un único UPDATE
+        """
+        if not department_id or not (roles or assignments):
+            return
+        target = Department.objects.filter(pk=department_id)
+        ancestors = Department.objects.filter(
+            tree_id=models.Subquery(target.values('tree_id')),
+            lft__lte=models.Subquery(target.values('lft')),
+            rght__gte=models.Subquery(target.values('rght')),
+        ).values('pk')
+        
+        is_target = models.Q(department_id=department_id)
+        cls.objects.filter(department_id__in=ancestors).update(
+            direct_roles=models.F('direct_roles') + models.Case(
+                models.When(is_target, then=models.Value(roles)), default=models.Value(0)
+            ),
+            subtree_roles=models.F('subtree_roles') + roles,
+            direct_assignments=models.F('direct_assignments') + models.Case(
+                models.When(is_target, then=models.Value(assignments)), default=models.Value(0)
+            ),
+            subtree_assignments=models.F('subtree_assignments') + assignments,
+            updated_at=timezone.now(),
+        )
+        cls._counts_changed()
+    
+    @classmethod
+    def apply_deltas(cls, deltas):
+        """deltas: {department_id: {'roles': n, 'assignments': m}}"""
+        for department_id, delta in deltas.items():
+            cls.apply_delta(department_id, delta.get('roles', 0), delta.get('assignments', 0))
+    
+    @classmethod
+    def rebuild(cls, tree_ids=None):
+        """
+        Recalcular los conteos (todos o de algunos árboles): conteos directos
+        agrupados en SQL y acumulación del subárbol en una pasada ordenada
+        por (tree_id, lft)
         """
         from core_permissions.models import UserRole
         
-        try:
-            # 🔥 CORRECCIÓN: Convertir a lista de IDs
-            descendants = self.get_descendants(include_self=True)
-            descendant_ids = [dept.id for dept in descendants]
-            
-            return UserRole.objects.filter(department_id__in=descendant_ids).count()
-        except Exception as e:
-            # En caso de error, retornar 0 y loggear el error
-            print(f"⚠️ Error calculando employee_count para departamento {self.id}: {e}")
-            return 0
+        departments = Department.objects.order_by('tree_id', 'lft')
+        if tree_ids is not None:
+            departments = departments.filter(tree_id__in=list(tree_ids))
+        nodes = list(departments.values_list('pk', 'tree_id', 'lft', 'rght'))
+        department_ids = [node[0] for node in nodes]
+        
+        direct_roles = dict(
+            UserRole.objects.filter(department_id__in=department_ids).values('department_id')
+            .annotate(total=models.Count('id')).values_list('department_id', 'total')
+        )
+        direct_assignments = dict(
+            OrganizationalAssignment.objects.filter(department_id__in=department_ids, is_active=True)
+            .values('department_id').annotate(total=models.Count('id')).values_list('department_id', 'total')
+        )
+        
+        rows = {
+            pk: cls(
+                department_id=pk,
+                direct_roles=direct_roles.get(pk, 0),
+                subtree_roles=direct_roles.get(pk, 0),
+                direct_assignments=direct_assignments.get(pk, 0),
+                subtree_assignments=direct_assignments.get(pk, 0),
+            )
+            for pk, _, _, _ in nodes
+        }
+        # Pila de ancestros abiertos: al cerrar un nodo se suma a su padre
+        stack = []
+        for pk, tree_id, lft, rght in nodes:
+            while stack and (stack[-1][1] != tree_id or stack[-1][2] < lft):
+                cls._close(stack, rows)
+            stack.append((pk, tree_id, rght))
+        while stack:
+            cls._close(stack, rows)
+        
+        cls.objects.bulk_create(
+            list(rows.values()),
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=['department'],
+            update_fields=['direct_roles', 'subtree_roles', 'direct_assignments', 'subtree_assignments', 'updated_at'],
+        )
+        cls._counts_changed()
+        return len(rows)
+    
+    @staticmethod
+    def _counts_changed():
+        # El árbol cacheado incluye employee_count
+        from .tree import department_tree
+        department_tree.invalidate()
+    
+    @staticmethod
+    def _close(stack, rows):
+        pk, tree_id, _ = stack.pop()
+        if stack and stack[-1][1] == tree_id:
+            parent = rows[stack[-1][0]]
+            parent.subtree_roles += rows[pk].subtree_roles
+            parent.subtree_assignments += rows[pk].subtree_assignments
+
 
 class JobPosition(models.Model):
     """
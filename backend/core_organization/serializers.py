@@ -22,7 +22,8 @@ class LocationSerializer(serializers.ModelSerializer):
 class DepartmentSerializer(serializers.ModelSerializer):
     """Serializer para departamentos"""
     full_path = serializers.CharField(read_only=True)
-    employee_count = serializers.SerializerMethodField()  # 🔥 CAMBIAR A METHOD FIELD
+    employee_count = serializers.IntegerField(read_only=True)  # Conteo materializado (select_related('headcount'))
+    headcount = serializers.SerializerMethodField()
     parent_name = serializers.CharField(source='parent.name', read_only=True)
     location_name = serializers.CharField(source='location.name', read_only=True)
     manager_email = serializers.CharField(source='manager.email', read_only=True)
@@ -31,7 +32,7 @@ class DepartmentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Department
         fields = [
-            'id', 'name', 'code', 'description', 'full_path', 'employee_count',
+            'id', 'name', 'code', 'description', 'full_path', 'employee_count', 'headcount',
             'parent', 'parent_name', 'location', 'location_name',
             'manager', 'manager_email', 'email', 'phone',
             'is_active', 'order', 'level', 'children_count',
@@ -40,17 +41,15 @@ class DepartmentSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at', 'level']
     
     def get_children_count(self, obj):
-        return obj.children.count()
+        """Hijos directos (anotado por DepartmentViewSet; una hoja MPTT no consulta)"""
+        count = getattr(obj, 'children_count', None)
+        if count is None:
+            count = 0 if obj.is_leaf_node() else obj.children.count()
+        return count
     
-    def get_employee_count(self, obj):
-        """🔴 MÉTODO LAZY para employee_count"""
-        try:
-            from core_permissions.models import UserRole
-            descendants = obj.get_descendants(include_self=True)
-            descendant_ids = [dept.id for dept in descendants]
-            return UserRole.objects.filter(department_id__in=descendant_ids).count()
-        except Exception:
-            return 0
+    def get_headcount(self, obj):
+        """Conteos directos y del subárbol (DepartmentHeadcount)"""
+        return obj.get_headcount().as_dict()
 
 class DepartmentTreeSerializer(serializers.ModelSerializer):
     """Serializer para árbol de departamentos"""
@@ -67,7 +66,7 @@ class DepartmentTreeSerializer(serializers.ModelSerializer):
     
     def get_children(self, obj):
         """Obtener hijos recursivamente para el árbol"""
-        children = obj.children.filter(is_active=True)
+        children = obj.children.filter(is_active=True).select_related('headcount')
         return DepartmentTreeSerializer(children, many=True).data
 
 
@@ -0,0 +1,99 @@
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+from core_permissions.models import UserRole
+from .models import Department, DepartmentHeadcount, OrganizationalAssignment
+from .tree import department_tree
+
+
+def _move(old_department_id, new_department_id, **counter):
+    """Delta de un objeto que pasa de un departamento a otro (None = no cuenta)"""
+    if old_department_id == new_department_id:
+        return
+    (name, amount), = counter.items()
+    DepartmentHeadcount.apply_delta(old_department_id, **{name: -amount})
+    DepartmentHeadcount.apply_delta(new_department_id, **{name: amount})
+
+
+# Departamentos
+
+@receiver(post_init, sender=Department)
+def remember_loaded_department_position(sender, instance, **kwargs):
+    instance._loaded_parent_id = instance.__dict__.get('parent_id')
+    instance._loaded_tree_id = instance.__dict__.get('tree_id')
+    instance._loaded_name = instance.__dict__.get('name')
+
+
+@receiver(post_save, sender=Department)
+def update_department_derived_data(sender, instance, created, **kwargs):
+    """
+    Departamento nuevo: fila de conteos en cero (la ruta se calcula en save).
+    Movido (también con move_to, que guarda el nodo): recalcular rutas del
+    subárbol y conteos de los árboles afectados. Renombrado: recalcular rutas
+    """
+    department_tree.invalidate()
+    if created:
+        DepartmentHeadcount.objects.get_or_create(department=instance)
+    else:
+        moved = instance.parent_id != getattr(instance, '_loaded_parent_id', None)
+        if moved or instance.name != getattr(instance, '_loaded_name', None):
+            instance.update_subtree_paths()
+        if moved:
+            DepartmentHeadcount.rebuild({instance._loaded_tree_id, instance.tree_id} - {None})
+    instance._loaded_parent_id = instance.parent_id
+    instance._loaded_tree_id = instance.tree_id
+    instance._loaded_name = instance.name
+
+
+@receiver(post_delete, sender=Department)
+def update_headcount_on_department_delete(sender, instance, origin=None, **kwargs):
+    """
+    Subárbol eliminado: el borrado en cascada no garantiza que las
+    asignaciones se eliminen antes que el departamento (FK nullable), así que
+    se recalcula el árbol una vez, al procesar el departamento de origen
+    """
+    department_tree.invalidate()
+    if isinstance(origin, Department) and origin is not instance:
+        return
+    DepartmentHeadcount.rebuild([instance.tree_id])
+
+
+# Asignaciones de rol (todas cuentan)
+
+@receiver(post_init, sender=UserRole)
+def remember_loaded_user_role_department(sender, instance, **kwargs):
+    instance._loaded_department_id = instance.__dict__.get('department_id')
+
+
+@receiver(post_save, sender=UserRole)
+def update_headcount_on_user_role_save(sender, instance, created, **kwargs):
+    old_department_id = None if created else instance._loaded_department_id
+    _move(old_department_id, instance.department_id, roles=1)
+    instance._loaded_department_id = instance.department_id
+
+
+@receiver(post_delete, sender=UserRole)
+def update_headcount_on_user_role_delete(sender, instance, **kwargs):
+    DepartmentHeadcount.apply_delta(instance._loaded_department_id, roles=-1)
+
+
+# Asignaciones organizacionales (solo las activas cuentan)
+
+@receiver(post_init, sender=OrganizationalAssignment)
+def remember_loaded_assignment_department(sender, instance, **kwargs):
+    if instance.__dict__.get('is_active'):
+        instance._loaded_department_id = instance.__dict__.get('department_id')
+    else:
+        instance._loaded_department_id = None
+
+
+@receiver(post_save, sender=OrganizationalAssignment)
+def update_headcount_on_assignment_save(sender, instance, created, **kwargs):
+    old_department_id = None if created else instance._loaded_department_id
+    new_department_id = instance.department_id if instance.is_active else None
+    _move(old_department_id, new_department_id, assignments=1)
+    instance._loaded_department_id = new_department_id
+
+
+@receiver(post_delete, sender=OrganizationalAssignment)
+def update_headcount_on_assignment_delete(sender, instance, **kwargs):
+    DepartmentHeadcount.apply_delta(instance._loaded_department_id, assignments=-1)
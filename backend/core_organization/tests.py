@@ -1,3 +1,190 @@
 from django.test import TestCase
+from rest_framework.test import APIClient
+from core_permissions.models import Role, UserRole
+from core_users.models import CustomUser
+from .models import Department, DepartmentHeadcount, JobPosition, OrganizationalAssignment
+from .tree import department_tree
 
-# Create your tests here.
+
+class DepartmentHeadcountTests(TestCase):
+    """Conteos materializados (DepartmentHeadcount) mantenidos por señales"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.role = Role.objects.create(name='Docente', code='docente')
+        cls.users = [
+            CustomUser.objects.create_user(email=f'user{i}@example.com', password='x') for i in range(4)
+        ]
+
+    def setUp(self):
+        self.root = Department.objects.create(name='Rectoría', code='REC')
+        self.academic = Department.objects.create(name='Académico', code='ACA', parent=self.root)
+        self.math = Department.objects.create(name='Matemáticas', code='MAT', parent=self.academic)
+        self.finance = Department.objects.create(name='Finanzas', code='FIN', parent=self.root)
+        self.position = JobPosition.objects.create(title='Docente', code='DOC', department=self.math)
+
+    def counts(self, department):
+        return DepartmentHeadcount.objects.get(department=department).as_dict()
+
+    def assertMatchesRebuild(self):
+        """Los conteos incrementales coinciden con un recálculo completo"""
+        materialized = {row.department_id: row.as_dict() for row in DepartmentHeadcount.objects.all()}
+        DepartmentHeadcount.rebuild()
+        rebuilt = {row.department_id: row.as_dict() for row in DepartmentHeadcount.objects.all()}
+        self.assertEqual(materialized, rebuilt)
+
+    def test_role_assignment_counts_up_the_tree(self):
+        UserRole.objects.create(user=self.users[0], role=self.role, department=self.math)
+
+        self.assertEqual(self.counts(self.math)['direct_roles'], 1)
+        self.assertEqual(self.counts(self.academic)['subtree_roles'], 1)
+        self.assertEqual(self.counts(self.root)['subtree_roles'], 1)
+        self.assertEqual(self.counts(self.finance)['subtree_roles'], 0)
+        self.assertMatchesRebuild()
+
+    def test_role_assignment_moved_between_departments(self):
+        user_role = UserRole.objects.create(user=self.users[0], role=self.role, department=self.math)
+
+        user_role.department = self.finance
+        user_role.save()
+
+        self.assertEqual(self.counts(self.academic)['subtree_roles'], 0)
+        self.assertEqual(self.counts(self.finance)['direct_roles'], 1)
+        self.assertEqual(self.counts(self.root)['subtree_roles'], 1)
+        self.assertMatchesRebuild()
+
+    def test_only_active_organizational_assignments_count(self):
+        assignment = OrganizationalAssignment.objects.create(
+            user=self.users[1], department=self.math, job_position=self.position
+        )
+        self.assertEqual(self.counts(self.root)['subtree_assignments'], 1)
+
+        assignment.is_active = False
+        assignment.save()
+        self.assertEqual(self.counts(self.root)['subtree_assignments'], 0)
+
+        assignment = OrganizationalAssignment.objects.get(pk=assignment.pk)
+        assignment.is_active = True
+        assignment.department = self.finance
+        assignment.save()
+        self.assertEqual(self.counts(self.finance)['direct_assignments'], 1)
+        self.assertEqual(self.counts(self.math)['direct_assignments'], 0)
+        self.assertMatchesRebuild()
+
+    def test_moving_a_department_moves_its_counts(self):
+        UserRole.objects.create(user=self.users[0], role=self.role, department=self.math)
+        OrganizationalAssignment.objects.create(user=self.users[1], department=self.math, job_position=self.position)
+
+        self.academic.refresh_from_db()
+        self.academic.parent = self.finance
+        self.academic.save()
+
+        self.assertEqual(self.counts(self.finance)['subtree_roles'], 1)
+        self.assertEqual(self.counts(self.finance)['subtree_assignments'], 1)
+        self.assertEqual(self.counts(self.root)['subtree_roles'], 1)
+        self.assertMatchesRebuild()
+
+    def test_deleting_a_subtree_removes_its_counts(self):
+        UserRole.objects.create(user=self.users[0], role=self.role, department=self.math)
+        UserRole.objects.create(user=self.users[2], role=self.role, department=self.finance)
+
+        self.academic.refresh_from_db()
+        self.academic.delete()
+
+        self.assertEqual(self.counts(self.root)['subtree_roles'], 1)
+        self.assertMatchesRebuild()
+
+
+class DepartmentPathTests(TestCase):
+    """Rutas denormalizadas (ancestor_ids, path_names) tras crear, mover y renombrar"""
+
+    def setUp(self):
+        self.root = Department.objects.create(name='Rectoría', code='REC')
+        self.academic = Department.objects.create(name='Académico', code='ACA', parent=self.root)
+        self.math = Department.objects.create(name='Matemáticas', code='MAT', parent=self.academic)
+        self.algebra = Department.objects.create(name='Álgebra', code='ALG', parent=self.math)
+        self.finance = Department.objects.create(name='Finanzas', code='FIN', parent=self.root)
+
+    def assertPathsMatchTree(self):
+        """ancestor_ids/path_names coinciden con los ancestros MPTT y no hay nada que reconstruir"""
+        for department in Department.objects.all():
+            ancestors = list(department.get_ancestors())
+            self.assertEqual(department.ancestor_ids, [ancestor.pk for ancestor in ancestors], department.name)
+            self.assertEqual(
+                department.path_names, [ancestor.name for ancestor in ancestors] + [department.name], department.name
+            )
+        self.assertEqual(Department.rebuild_paths(), 0)
+
+    def test_paths_on_insert(self):
+        self.algebra.refresh_from_db()
+
+        self.assertEqual(self.algebra.ancestor_ids, [self.root.pk, self.academic.pk, self.math.pk])
+        self.assertEqual(self.algebra.full_path, 'Rectoría / Académico / Matemáticas / Álgebra')
+        self.assertPathsMatchTree()
+
+    def test_subtree_paths_after_parent_change(self):
+        self.math.refresh_from_db()
+        self.math.parent = self.finance
+        self.math.save()
+
+        self.algebra.refresh_from_db()
+        self.assertEqual(self.algebra.ancestor_ids, [self.root.pk, self.finance.pk, self.math.pk])
+        self.assertEqual(self.algebra.full_path, 'Rectoría / Finanzas / Matemáticas / Álgebra')
+        self.assertPathsMatchTree()
+
+    def test_subtree_paths_after_move_to(self):
+        self.math.refresh_from_db()
+        self.math.move_to(None)
+
+        self.algebra.refresh_from_db()
+        self.assertEqual(self.algebra.ancestor_ids, [self.math.pk])
+        self.assertEqual(self.algebra.full_path, 'Matemáticas / Álgebra')
+        self.assertPathsMatchTree()
+
+    def test_subtree_paths_after_rename(self):
+        self.academic.refresh_from_db()
+        self.academic.name = 'Docencia'
+        self.academic.save()
+
+        self.algebra.refresh_from_db()
+        self.assertEqual(self.algebra.full_path, 'Rectoría / Docencia / Matemáticas / Álgebra')
+        self.assertPathsMatchTree()
+
+    def test_subtree_q_matches_mptt_descendants(self):
+        self.math.refresh_from_db()
+        self.math.parent = self.finance
+        self.math.save()
+
+        for department in Department.objects.all():
+            expected = set(department.get_descendants(include_self=True).values_list('pk', flat=True))
+            found = set(Department.objects.filter(Department.subtree_q(department.pk)).values_list('pk', flat=True))
+            self.assertEqual(found, expected, department.name)
+
+
+class DepartmentTreeETagTests(TestCase):
+    """If-None-Match del árbol: lista de ETags separada por comas, '*' y coincidencia exacta"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser(email='admin@example.com', password='x')
+        Department.objects.create(name='Rectoría', code='REC')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.etag = department_tree.get_etag()
+
+    def get_tree(self, if_none_match):
+        return self.client.get('/api/organization/departments/tree/', HTTP_IF_NONE_MATCH=if_none_match)
+
+    def test_matching_etag_in_list_returns_not_modified(self):
+        self.assertEqual(self.get_tree(f'"other", {self.etag}').status_code, 304)
+        self.assertEqual(self.get_tree(f'W/{self.etag}').status_code, 304)
+        self.assertEqual(self.get_tree('*').status_code, 304)
+
+    def test_partial_etag_does_not_match(self):
+        # Un ETag que contiene al actual como subcadena no es el mismo ETag
+        response = self.get_tree(f'"x{self.etag[1:-1]}x"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], self.etag)
+        self.assertEqual(self.get_tree(self.etag[1:-1]).status_code, 200)
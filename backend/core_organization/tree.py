@@ -0,0 +1,93 @@
+import time
+from django.core.cache import cache
+from django.db import transaction
+from .models import Department
+
+
+class DepartmentTreeBuilder:
+    """
+    Árbol de departamentos activos como JSON anidado.
+
+    Una sola consulta ordenada por (tree_id, lft) con los conteos
+    materializados (DepartmentHeadcount) y una pasada lineal con una pila de
+    ancestros abiertos: cada nodo cuelga del tope de la pila y su full_path
+    se arma a partir del de su padre. Un departamento inactivo oculta su
+    subárbol, igual que el recorrido recursivo anterior.
+
+    El resultado se cachea por versión; la versión cambia con cualquier
+    cambio de Department o de sus conteos (signals.py) y sirve de ETag.
+    """
+    VERSION_KEY = 'core_organization:department_tree:version'
+    TREE_KEY = 'core_organization:department_tree:{version}'
+    TIMEOUT = 60 * 60
+
+    FIELDS = ('id', 'name', 'code', 'description', 'is_active', 'level', 'tree_id', 'lft', 'rght')
+
+    def get_version(self):
+        version = cache.get(self.VERSION_KEY)
+        if version is None:
+            cache.add(self.VERSION_KEY, time.time_ns(), None)
+            version = cache.get(self.VERSION_KEY)
+        return version
+
+    def get_etag(self, version=None):
+        return f'"department-tree-{version or self.get_version()}"'
+
+    def get_tree(self):
+        """(datos, etag) desde el caché o construidos y cacheados"""
+        version = self.get_version()
+        cache_key = self.TREE_KEY.format(version=version)
+        data = cache.get(cache_key)
+        if data is None:
+            data = self.build()
+            cache.set(cache_key, data, self.TIMEOUT)
+        return data, self.get_etag(version)
+
+    def invalidate(self):
+        """Nueva versión al confirmar la transacción actual"""
+        transaction.on_commit(self._bump_version)
+
+    def build(self):
+        nodes = Department.objects.order_by('tree_id', 'lft').values_list(
+            *self.FIELDS, 'headcount__subtree_roles'
+        )
+
+        roots = []
+        stack = []         # [(tree_id, rght, nodo)]
+        hidden = None      # (tree_id, rght) del subárbol inactivo que se está saltando
+        for pk, name, code, description, is_active, level, tree_id, lft, rght, employee_count in nodes:
+            if hidden is not None:
+                if hidden[0] == tree_id and lft < hidden[1]:
+                    continue
+                hidden = None
+            if not is_active:
+                hidden = (tree_id, rght)
+                continue
+
+            while stack and (stack[-1][0] != tree_id or stack[-1][1] < lft):
+                stack.pop()
+            parent = stack[-1][2] if stack else None
+
+            node = {
+                'id': pk,
+                'name': name,
+                'code': code,
+                'description': description,
+                'full_path': f"{parent['full_path']} / {name}" if parent else name,
+                'employee_count': employee_count or 0,
+                'is_active': is_active,
+                'level': level,
+                'children': [],
+            }
+            (parent['children'] if parent else roots).append(node)
+            stack.append((tree_id, rght, node))
+        return roots
+
+    def _bump_version(self):
+        try:
+            cache.incr(self.VERSION_KEY)
+        except ValueError:
+            cache.set(self.VERSION_KEY, time.time_ns(), None)
+
+
+department_tree = DepartmentTreeBuilder()
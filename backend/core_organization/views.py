@@ -5,9 +5,22 @@ from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.views import APIView
 from django.db.models import Count
 from django.http import JsonResponse
+from django.utils.http import parse_etags
 
+from core_permissions.permissions import (
+    DEFAULT_GRANULAR_ACTIONS, GranularPermissionRequired, ScopedQuerysetMixin
+)
 from .models import Location, Department, JobPosition, WorkSchedule, OrganizationalAssignment
 from .serializers import *
+from .tree import department_tree
+
+def _etag_matches(if_none_match, etag):
+    """Comparación débil de If-None-Match (lista separada por comas o '*') con etag"""
+    candidates = parse_etags(if_none_match)
+    if candidates == ['*']:
+        return True
+    return etag.removeprefix('W/') in {candidate.removeprefix('W/') for candidate in candidates}
+
 
 class LocationViewSet(viewsets.ModelViewSet):
     """ViewSet para gestión de ubicaciones"""
@@ -29,31 +42,30 @@ class LocationViewSet(viewsets.ModelViewSet):
         return Location.objects.prefetch_related('departments').order_by('name')
 
 
-class DepartmentViewSet(viewsets.ModelViewSet):
-    """ViewSet para gestión de departamentos"""
+class DepartmentViewSet(ScopedQuerysetMixin, viewsets.ModelViewSet):
+    """ViewSet para gestión de departamentos (alcance: subárbol de departamentos)"""
     queryset = Department.objects.all()
     serializer_class = DepartmentSerializer
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, GranularPermissionRequired]
+    granular_permission = 'organization.departments'
+    granular_actions = {**DEFAULT_GRANULAR_ACTIONS, 'hierarchy': 'view', 'employees': 'view'}
+    scope_department_field = ''
     filterset_fields = ['is_active', 'location', 'parent', 'level']
     search_fields = ['name', 'code', 'description']
     
-    def get_permissions(self):
-        """Permisos diferentes según la acción"""
-        if self.action in ['list', 'retrieve', 'tree', 'hierarchy']:
-            permission_classes = [IsAuthenticated]
-        else:
-            permission_classes = [IsAuthenticated, IsAdminUser]
-        return [permission() for permission in permission_classes]
-    
     def get_queryset(self):
-        return Department.objects.select_related('parent', 'location', 'manager').order_by('tree_id', 'order', 'name')
+        return Department.objects.select_related('parent', 'location', 'manager', 'headcount').annotate(
+            children_count=Count('children')
+        ).order_by('tree_id', 'order', 'name')
     
     @action(detail=False, methods=['get'])
     def tree(self, request):
-        """Obtener árbol completo de departamentos"""
-        root_departments = Department.objects.filter(parent__isnull=True, is_active=True)
-        serializer = DepartmentTreeSerializer(root_departments, many=True)
-        return Response(serializer.data)
+        """Obtener árbol completo de departamentos (una consulta, cacheado, con ETag)"""
+        data, etag = department_tree.get_tree()
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+        if _etag_matches(request.headers.get('If-None-Match', ''), etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(data, headers=headers)
     
     @action(detail=True, methods=['get'])
     def hierarchy(self, request, pk=None):
@@ -62,10 +74,15 @@ class DepartmentViewSet(viewsets.ModelViewSet):
         
         data = {
             'department': DepartmentSerializer(department).data,
-            'ancestors': DepartmentSerializer(department.get_ancestors(), many=True).data,
-            'descendants': DepartmentTreeSerializer(department.get_descendants(), many=True).data,
+            'ancestors': DepartmentSerializer(
+                department.get_ancestors().select_related('headcount').annotate(children_count=Count('children')),
+                many=True
+            ).data,
+            'descendants': DepartmentTreeSerializer(department.get_descendants().select_related('headcount'), many=True).data,
             'siblings': DepartmentSerializer(
-                Department.objects.filter(parent=department.parent, is_active=True).exclude(pk=department.pk),
+                Department.objects.filter(
+                    parent=department.parent, is_active=True
+                ).exclude(pk=department.pk).select_related('headcount').annotate(children_count=Count('children')),
                 many=True
             ).data,
         }
@@ -78,14 +95,11 @@ class DepartmentViewSet(viewsets.ModelViewSet):
         department = self.get_object()
         
         try:
-            # 🔥 CORRECCIÓN: Convertir a lista de IDs
-            descendants = department.get_descendants(include_self=True)
-            descendant_ids = [dept.id for dept in descendants]
-            
+            # Subárbol por ancestor_ids (índice GIN), sin cargar los descendientes
             assignments = OrganizationalAssignment.objects.filter(
-                department_id__in=descendant_ids, 
+                Department.subtree_q(department.pk, 'department'),
                 is_active=True
-            ).select_related('user', 'job_position')
+            ).select_related('user', 'job_position', 'department')
             
             page = self.paginate_queryset(assignments)
             if page is not None:
@@ -102,22 +116,17 @@ class DepartmentViewSet(viewsets.ModelViewSet):
             )
 
 
-class JobPositionViewSet(viewsets.ModelViewSet):
+class JobPositionViewSet(ScopedQuerysetMixin, viewsets.ModelViewSet):
     """ViewSet para gestión de puestos de trabajo"""
     queryset = JobPosition.objects.all()
     serializer_class = JobPositionSerializer
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, GranularPermissionRequired]
+    granular_permission = 'organization.positions'
+    granular_actions = {**DEFAULT_GRANULAR_ACTIONS, 'employees': 'view'}
+    scope_department_field = 'department'
     filterset_fields = ['is_active', 'department', 'position_type', 'level', 'is_remote']
     search_fields = ['title', 'code', 'description']
     
-    def get_permissions(self):
-        """Permisos diferentes según la acción"""
-        if self.action in ['list', 'retrieve']:
-            permission_classes = [IsAuthenticated]
-        else:
-            permission_classes = [IsAuthenticated, IsAdminUser]
-        return [permission() for permission in permission_classes]
-    
     def get_queryset(self):
         return JobPosition.objects.select_related('department').prefetch_related('employees').order_by('department', 'level', 'title')
     
@@ -148,22 +157,18 @@ class WorkScheduleViewSet(viewsets.ModelViewSet):
         return WorkSchedule.objects.prefetch_related('departments', 'job_positions').order_by('name')
 
 
-class OrganizationalAssignmentViewSet(viewsets.ModelViewSet):
+class OrganizationalAssignmentViewSet(ScopedQuerysetMixin, viewsets.ModelViewSet):
     """ViewSet para gestión de asignaciones organizacionales"""
     queryset = OrganizationalAssignment.objects.all()
     serializer_class = OrganizationalAssignmentSerializer
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, GranularPermissionRequired]  # my_assignment no requiere permiso granular
+    granular_permission = 'organization.assignments'
+    granular_actions = {**DEFAULT_GRANULAR_ACTIONS, 'by_department': 'view'}
+    scope_department_field = 'department'
+    scope_owner_field = 'user'
     filterset_fields = ['is_active', 'department', 'job_position']
     search_fields = ['user__email', 'employee_id', 'job_position__title']
     
-    def get_permissions(self):
-        """Permisos diferentes según la acción"""
-        if self.action in ['list', 'retrieve', 'my_assignment']:
-            permission_classes = [IsAuthenticated]
-        else:
-            permission_classes = [IsAuthenticated, IsAdminUser]
-        return [permission() for permission in permission_classes]
-    
     def get_queryset(self):
         return OrganizationalAssignment.objects.select_related(
             'user', 'department', 'job_position', 'supervisor', 'work_schedule'
@@ -194,12 +199,11 @@ class OrganizationalAssignmentViewSet(viewsets.ModelViewSet):
         
         try:
             department = Department.objects.get(id=department_id)
-            descendants = department.get_descendants(include_self=True)
             
-            assignments = OrganizationalAssignment.objects.filter(
-                department__in=descendants,
+            assignments = self.scope_queryset(self.get_queryset()).filter(
+                Department.subtree_q(department.pk, 'department'),
                 is_active=True
-            ).select_related('user', 'job_position')
+            )
             
             serializer = OrganizationalAssignmentSerializer(assignments, many=True)
             return Response(serializer.data)
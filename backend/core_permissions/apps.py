@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class CorePermissionsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core_permissions'
+
+    def ready(self):
+        import core_permissions.signals
@@ -0,0 +1,142 @@
+import base64
+import threading
+import time
+from django.core.cache import cache
+from .models import GranularPermission
+
+
+class PermissionSlotRegistry:
+    """
+    Mapa permission_code -> bit_index (posición del permiso en los vectores).
+
+    Vive en memoria del proceso y se recarga cuando cambia la versión
+    compartida en el caché (se incrementa al crear, eliminar o recodificar un
+    GranularPermission). La versión forma parte del sello de cada vector:
+    si una posición se reutiliza, los vectores anteriores quedan obsoletos.
+    """
+    VERSION_KEY = 'core_permissions:slots:version'
+    VERSION_CHECK_INTERVAL = 1.0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._slots = None
+        self._version = None
+        self._checked_at = 0.0
+
+    def get_slots(self):
+        self._ensure_current()
+        return self._slots
+
+    def get_version(self):
+        self._ensure_current()
+        return self._version
+
+    def get_slot(self, permission_code):
+        return self.get_slots().get(permission_code)
+
+    def mask(self, permission_codes):
+        """Máscara (int) con los bits de los códigos conocidos"""
+        slots = self.get_slots()
+        bits = 0
+        for code in permission_codes:
+            slot = slots.get(code)
+            if slot is not None:
+                bits |= 1 << slot
+        return bits
+
+    def codes(self, bits):
+        """Códigos de permiso presentes en una máscara"""
+        return frozenset(code for code, slot in self.get_slots().items() if bits >> slot & 1)
+
+    def invalidate(self):
+        """Forzar la recarga del mapa en todos los procesos"""
+        try:
+            cache.incr(self.VERSION_KEY)
+        except ValueError:
+            cache.set(self.VERSION_KEY, time.time_ns(), None)
+        self._checked_at = 0.0
+
+    def _ensure_current(self):
+        now = time.monotonic()
+        if self._slots is not None and now - self._checked_at < self.VERSION_CHECK_INTERVAL:
+            return
+        with self._lock:
+            version = cache.get(self.VERSION_KEY)
+            if version is None:
+                cache.add(self.VERSION_KEY, time.time_ns(), None)
+                version = cache.get(self.VERSION_KEY)
+            if self._slots is None or version != self._version:
+                self._slots = dict(
+                    GranularPermission.objects.filter(bit_index__isnull=False).values_list(
+                        'permission_code', 'bit_index'
+                    )
+                )
+                self._version = version
+            self._checked_at = now
+
+
+permission_slots = PermissionSlotRegistry()
+
+
+class PermissionVector:
+    """
+    Permisos efectivos de un usuario como vector de bits (un int de Python).
+
+    has_any()/has_all() reciben códigos o una máscara ya calculada y se
+    resuelven con una operación AND. encode()/decode() producen un string
+    base64url compacto para claims JWT o respuestas cacheadas; version
+    identifica el estado de permisos con el que se construyó el vector
+    (PermissionCache.is_vector_current lo compara con el actual).
+    """
+    __slots__ = ('bits', 'version')
+
+    def __init__(self, bits=0, version=None):
+        self.bits = bits
+        self.version = version
+
+    def __repr__(self):
+        return f"<PermissionVector {self.bits.bit_count()} permissions v={self.version}>"
+
+    def __contains__(self, permission_code):
+        return self.has(permission_code)
+
+    def has(self, permission_code):
+        slot = permission_slots.get_slot(permission_code)
+        return slot is not None and bool(self.bits >> slot & 1)
+
+    def has_any(self, permissions):
+        mask = self._as_mask(permissions)
+        return bool(self.bits & mask)
+
+    def has_all(self, permissions):
+        mask = self._as_mask(permissions)
+        return self.bits & mask == mask
+
+    def get_codes(self):
+        return permission_slots.codes(self.bits)
+
+    def encode(self):
+        """Bits en base64url (little-endian, sin relleno)"""
+        raw = self.bits.to_bytes((self.bits.bit_length() + 7) // 8, 'little')
+        return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+    @classmethod
+    def decode(cls, value, version=None):
+        raw = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4))
+        return cls(int.from_bytes(raw, 'little'), version)
+
+    def to_claims(self):
+        return {'perm_bits': self.encode(), 'perm_version': self.version}
+
+    @classmethod
+    def from_claims(cls, claims):
+        """Vector embebido en un token (None si el token no lo trae)"""
+        if claims.get('perm_bits') is None:
+            return None
+        return cls.decode(claims['perm_bits'], claims.get('perm_version'))
+
+    @staticmethod
+    def _as_mask(permissions):
+        if isinstance(permissions, int):
+            return permissions
+        return permission_slots.mask(permissions)
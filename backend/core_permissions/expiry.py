@@ -0,0 +1,121 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from core_users.models import CustomUser
+from .models import AssignmentExpiryState, GranularPermission, RolePermission, UserRole
+
+DEFAULT_EXPIRY_SETTINGS = {
+    'INITIAL_LOOKBACK_HOURS': 24,    # Ventana del primer barrido (sin marca de agua)
+    'SYNC_AUTH_PERMISSIONS': True,   # Re-sincronizar user_permissions de los afectados
+}
+
+
+def get_expiry_settings():
+    """Configuración efectiva (settings.PERMISSION_EXPIRY + defaults)"""
+    return {**DEFAULT_EXPIRY_SETTINGS, **getattr(settings, 'PERMISSION_EXPIRY', {})}
+
+
+class AssignmentExpirySweeper:
+    """
+    Barrido de vigencias de UserRole y RolePermission temporales.
+
+    Los límites valid_from/valid_until forman una cola ordenada por tiempo
+    (índices parciales sobre is_temporary). Cada sweep() toma los límites
+    cruzados desde la marca de agua hasta ahora y aplica solo esos cambios:
+    refresca en el índice los roles cuyos permisos temporales empezaron o
+    vencieron, invalida el caché de los usuarios afectados y re-sincroniza
+    sus user_permissions. Nada se evalúa fila por fila en Python.
+    """
+    STATE_NAME = 'assignments'
+
+    @classmethod
+    def sweep(cls, now=None):
+        """
+        Aplicar los límites cruzados. Devuelve {'window_start', 'window_end',
+        'users', 'roles', 'synced_users'}
+        """
+        options = get_expiry_settings()
+        now = now or timezone.now()
+
+        with transaction.atomic():
+            state, _ = AssignmentExpiryState.objects.select_for_update().get_or_create(name=cls.STATE_NAME)
+            start = state.last_swept_at or now - timedelta(hours=options['INITIAL_LOOKBACK_HOURS'])
+            if now <= start:
+                return {'window_start': start, 'window_end': now, 'users': 0, 'roles': 0, 'synced_users': 0}
+
+            user_ids = set(
+                UserRole.objects.boundaries_between(start, now).values_list('user_id', flat=True).distinct()
+            )
+            role_ids = set(
+                RolePermission.objects.boundaries_between(start, now).values_list('role_id', flat=True).distinct()
+            )
+
+            state.last_swept_at = now
+            state.save(update_fields=['last_swept_at', 'updated_at'])
+
+        if role_ids:
+            from .index import role_permission_index
+            from .signals import role_permissions_changed
+
+            # Refresca el índice e invalida los roles, sus descendientes y sus usuarios
+            role_permissions_changed(role_ids)
+            affected_roles = set()
+            for role_id in role_ids:
+                affected_roles |= role_permission_index.get_descendant_ids(role_id)
+            user_ids |= set(
+                UserRole.objects.filter(role_id__in=affected_roles).values_list('user_id', flat=True).distinct()
+            )
+
+        if user_ids:
+            from .utils import PermissionCache
+            PermissionCache.invalidate_users(user_ids)
+
+        synced = 0
+        if user_ids and options['SYNC_AUTH_PERMISSIONS']:
+            synced = cls._sync_auth_permissions(user_ids)
+
+        return {
+            'window_start': start,
+            'window_end': now,
+            'users': len(user_ids),
+            'roles': len(role_ids),
+            'synced_users': synced,
+        }
+
+    @classmethod
+    def upcoming(cls, until=None, limit=100):
+        """Próximos límites de la cola: [(momento, tipo, id)] ordenados por tiempo"""
+        now = timezone.now()
+        until = until or now + timedelta(days=1)
+        boundaries = []
+        for model, kind in ((UserRole, 'user_role'), (RolePermission, 'role_permission')):
+            temporary = model.objects.filter(is_temporary=True)
+            activations = temporary.filter(valid_from__gt=now, valid_from__lte=until).order_by('valid_from')
+            expiries = temporary.filter(valid_until__gte=now, valid_until__lt=until).order_by('valid_until')
+            boundaries += [
+                (moment, f'{kind}_activation', pk)
+                for pk, moment in activations.values_list('pk', 'valid_from')[:limit]
+            ]
+            boundaries += [
+                (moment, f'{kind}_expiry', pk)
+                for pk, moment in expiries.values_list('pk', 'valid_until')[:limit]
+            ]
+        return sorted(boundaries)[:limit]
+
+    @staticmethod
+    def _sync_auth_permissions(user_ids):
+        """Solo los usuarios que ya tienen permisos sincronizados en django.contrib.auth"""
+        from django.contrib.contenttypes.models import ContentType
+        from .utils import PermissionManager
+
+        content_type = ContentType.objects.get_for_model(GranularPermission)
+        synced_users = list(
+            CustomUser.user_permissions.through.objects.filter(
+                customuser_id__in=user_ids,
+                permission__content_type=content_type
+            ).values_list('customuser_id', flat=True).distinct()
+        )
+        if synced_users:
+            PermissionManager.sync_users_permissions(synced_users)
+        return len(synced_users)
@@ -0,0 +1,252 @@
+import sys
+import threading
+import time
+from django.core.cache import cache
+from django.db import connection, transaction
+from .models import Role, RolePermission
+
+_pending = threading.local()
+
+
+def mark_pending_changes():
+    """
+    Registrar que la transacción actual cambió permisos sin confirmar: hasta
+    el commit lee esos cambios con un índice propio y sin caché compartido.
+    Cada savepoint con cambios lleva su propia marca
+    """
+    savepoint_ids = tuple(connection.savepoint_ids)
+    markers = _live_markers()
+    if not markers or markers[-1][0] != savepoint_ids:
+        def marker():
+            pass
+        transaction.on_commit(marker)
+        markers.append((savepoint_ids, marker))
+    _pending.markers = markers
+
+
+def pending_changes_marker():
+    """
+    Marca de la transacción (o savepoint) con cambios sin confirmar, None si
+    no hay. Si se revierte, Django descarta sus callbacks on_commit, y con
+    ellos la marca; al confirmar también desaparece
+    """
+    markers = _live_markers()
+    return markers[-1][1] if markers else None
+
+
+def _live_markers():
+    markers = getattr(_pending, 'markers', None)
+    if not markers:
+        return []
+    registered = {id(entry[1]) for entry in connection.run_on_commit}
+    live = [item for item in markers if id(item[1]) in registered]
+    if len(live) != len(markers):
+        _pending.markers = live
+    return live
+
+
+def has_pending_changes():
+    return pending_changes_marker() is not None
+
+
+class RolePermissionIndex:
+    """
+    Índice aplanado de permisos por rol: role_id -> frozenset de códigos de
+    permiso con la herencia de parent_role ya resuelta.
+
+    Se construye con dos consultas (roles y RolePermission) y después se
+    actualiza de forma incremental: un cambio en los permisos de un rol o en
+    su parent_role solo recalcula ese rol y sus descendientes. Los códigos se
+    internan, así que los frozensets de distintos roles comparten los strings
+    y la verificación de un permiso es un test de pertenencia O(1).
+
+    Solo cuentan los RolePermission vigentes (active_now); el barrido de
+    vigencias (expiry.py) refresca los roles cuyos permisos temporales
+    empiezan o vencen.
+
+    El índice vive en memoria del proceso. Cada cambio incrementa una versión
+    en el caché compartido; los demás procesos la comparan (como mucho cada
+    VERSION_CHECK_INTERVAL segundos) y reconstruyen si quedó desactualizado.
+    Los cambios se aplican al confirmar la transacción; mientras tanto, la
+    transacción que los hizo usa un índice provisional reconstruido con sus
+    filas sin confirmar, que nadie más reutiliza (ver mark_pending_changes).
+    """
+    VERSION_KEY = 'core_permissions:role_index:version'
+    VERSION_CHECK_INTERVAL = 1.0
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._provisional = None
+        self._version = None
+        self._checked_at = 0.0
+        self._direct = {}
+        self._parents = {}
+        self._children = {}
+        self._flat = {}
+
+    def get_codes(self, role_id):
+        """frozenset de códigos del rol (incluye los heredados)"""
+        self._ensure_current()
+        return self._flat.get(role_id, frozenset())
+
+    def has_permission(self, role_id, permission_code):
+        return permission_code in self.get_codes(role_id)
+
+    def get_descendant_ids(self, role_id):
+        """El rol y todos los roles que heredan de él"""
+        self._ensure_current()
+        pending = [role_id]
+        found = set()
+        while pending:
+            current = pending.pop()
+            if current in found:
+                continue
+            found.add(current)
+            pending.extend(self._children.get(current, ()))
+        return found
+
+    def rebuild(self):
+        """Reconstruir el índice completo"""
+        with self._lock:
+            version = self._get_shared_version()
+            parents = dict(Role.objects.values_list('id', 'parent_role_id'))
+            direct = {}
+            for role_id, code in RolePermission.objects.active_now().values_list('role_id', 'permission__permission_code'):
+                direct.setdefault(role_id, set()).add(sys.intern(code))
+
+            self._parents = parents
+            self._direct = {role_id: frozenset(codes) for role_id, codes in direct.items()}
+            self._children = {}
+            for role_id, parent_id in parents.items():
+                if parent_id is not None:
+                    self._children.setdefault(parent_id, set()).add(role_id)
+            self._flat = {}
+            for role_id in parents:
+                self._flatten(role_id, set())
+
+            self._version = version
+            self._provisional = pending_changes_marker()
+            self._checked_at = time.monotonic()
+            self._loaded = True
+
+    def refresh_role_permissions(self, role_id):
+        """Releer los permisos directos de un rol y recalcular sus descendientes"""
+        with self._lock:
+            if not self._is_committed():
+                return self._bump_version()
+            codes = RolePermission.objects.active_now().filter(role_id=role_id).values_list(
+                'permission__permission_code', flat=True
+            )
+            self._direct[role_id] = frozenset(sys.intern(code) for code in codes)
+            self._recompute(role_id)
+            self._bump_version()
+
+    def refresh_role_parent(self, role_id, parent_id):
+        """Actualizar el parent_role de un rol y recalcular su subárbol"""
+        with self._lock:
+            if not self._is_committed():
+                return self._bump_version()
+            old_parent = self._parents.get(role_id)
+            if old_parent is not None:
+                self._children.get(old_parent, set()).discard(role_id)
+            if parent_id is not None:
+                self._children.setdefault(parent_id, set()).add(role_id)
+            self._parents[role_id] = parent_id
+            self._recompute(role_id)
+            self._bump_version()
+
+    def remove_role(self, role_id):
+        with self._lock:
+            if not self._is_committed():
+                return self._bump_version()
+            parent_id = self._parents.pop(role_id, None)
+            if parent_id is not None:
+                self._children.get(parent_id, set()).discard(role_id)
+            self._direct.pop(role_id, None)
+            children = self._children.pop(role_id, set())
+            for child_id in children:
+                self._parents[child_id] = None
+            self._flat.pop(role_id, None)
+            for child_id in children:
+                self._recompute(child_id)
+            self._bump_version()
+
+    def invalidate(self):
+        """Descartar el índice local y forzar la reconstrucción en todos los procesos"""
+        with self._lock:
+            self._loaded = False
+            self._bump_version()
+
+    def _is_committed(self):
+        # Un índice provisional no se actualiza: se reconstruye en el próximo uso
+        if self._provisional is not None:
+            self._loaded = False
+        return self._loaded
+
+    def _recompute(self, role_id):
+        # El rol y todos sus descendientes
+        pending = [role_id]
+        seen = set()
+        while pending:
+            current = pending.pop()
+            if current in seen:
+                continue
+            seen.add(current)
+            self._flat.pop(current, None)
+            pending.extend(self._children.get(current, ()))
+        for current in seen:
+            self._flatten(current, set())
+
+    def _flatten(self, role_id, visiting):
+        if role_id in self._flat:
+            return self._flat[role_id]
+        if role_id in visiting:
+            # Ciclo en parent_role: cortar la herencia
+            return frozenset()
+        visiting.add(role_id)
+
+        codes = self._direct.get(role_id, frozenset())
+        parent_id = self._parents.get(role_id)
+        if parent_id is not None:
+            codes = codes | self._flatten(parent_id, visiting)
+
+        self._flat[role_id] = codes
+        return codes
+
+    def _ensure_current(self):
+        pending = pending_changes_marker()
+        if pending is not None or self._provisional is not None:
+            # Solo la transacción que construyó el índice provisional lo usa
+            if self._loaded and self._provisional is pending:
+                return
+        elif self._loaded:
+            now = time.monotonic()
+            if now - self._checked_at < self.VERSION_CHECK_INTERVAL:
+                return
+            self._checked_at = now
+            if self._get_shared_version() == self._version:
+                return
+        self.rebuild()
+
+    def _get_shared_version(self):
+        version = cache.get(self.VERSION_KEY)
+        if version is None:
+            version = int(time.time() * 1000)
+            cache.add(self.VERSION_KEY, version, None)
+            version = cache.get(self.VERSION_KEY, version)
+        return version
+
+    def _bump_version(self):
+        previous = self._version
+        try:
+            self._version = cache.incr(self.VERSION_KEY)
+        except ValueError:
+            self._version = self._get_shared_version()
+        if previous is None or self._version != previous + 1:
+            # Otro proceso también cambió el índice: reconstruir en el próximo uso
+            self._loaded = False
+        self._checked_at = time.monotonic()
+
+
+role_permission_index = RolePermissionIndex()
@@ -21,6 +21,7 @@ class Command(BaseCommand):
             ('users', 'Usuarios', 'Gestión de usuarios y perfiles'),
             ('reports', 'Reportes', 'Reportes y analytics'),
             ('system', 'Sistema', 'Configuración del sistema'),
+            ('organization', 'Organización', 'Departamentos, puestos y asignaciones'),
         ]
         
         for code, name, desc in modules_data:
@@ -44,10 +45,37 @@ class Command(BaseCommand):
             'schedules': ['view', 'create', 'edit'],
         }
         
-        created_perms = PermissionManager.create_module_permissions(
-            'academic', academic_permissions
+        result = PermissionManager.generate_permissions({'academic': academic_permissions})
+        self.stdout.write(
+            f"✅ Permisos académicos: {result['created']} creados, "
+            f"{result['updated']} actualizados, {result['unchanged']} sin cambios"
+        )
+        
+        # Permisos de las vistas con alcance (GranularPermissionRequired)
+        scoped_permissions = {
+            'organization': {
+                'departments': ['view', 'create', 'edit', 'delete'],
+                'positions': ['view', 'create', 'edit', 'delete'],
+                'assignments': ['view', 'create', 'edit', 'delete'],
+            },
+            'users': {
+                'accounts': ['view', 'create', 'edit', 'delete'],
+                'roles': ['view', 'create', 'edit', 'delete'],
+            },
+            'system': {
+                'permission_modules': ['view', 'create', 'edit', 'delete'],
+                'permissions': ['view', 'create', 'edit', 'delete'],
+                'roles': ['view', 'create', 'edit', 'delete', 'manage'],
+                'role_templates': ['view', 'create', 'edit', 'delete', 'manage'],
+                'permission_sync': ['manage'],
+                'permission_stats': ['view'],
+            },
+        }
+        result = PermissionManager.generate_permissions(scoped_permissions)
+        self.stdout.write(
+            f"✅ Permisos de organización, usuarios y sistema: {result['created']} creados, "
+            f"{result['updated']} actualizados, {result['unchanged']} sin cambios"
         )
-        self.stdout.write(f'✅ {len(created_perms)} permisos académicos creados')
         
         # 3. Crear plantilla universitaria
         template = RoleTemplateManager.create_university_template()
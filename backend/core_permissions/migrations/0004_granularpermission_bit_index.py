@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:43
+
+from django.db import migrations, models
+
+
+def assign_bit_indexes(apps, schema_editor):
+    GranularPermission = apps.get_model('core_permissions', 'GranularPermission')
+    permissions = list(GranularPermission.objects.order_by('id').only('id'))
+    for bit_index, permission in enumerate(permissions):
+        permission.bit_index = bit_index
+    GranularPermission.objects.bulk_update(permissions, ['bit_index'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_permissions', '0003_alter_permissionmodule_icon'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='granularpermission',
+            name='bit_index',
+            field=models.PositiveIntegerField(editable=False, null=True, unique=True, verbose_name='bit index'),
+        ),
+        migrations.RunPython(assign_bit_indexes, migrations.RunPython.noop),
+    ]
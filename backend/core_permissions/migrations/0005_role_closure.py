@@ -0,0 +1,45 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def build_role_closure(apps, schema_editor):
+    Role = apps.get_model('core_permissions', 'Role')
+    RoleClosure = apps.get_model('core_permissions', 'RoleClosure')
+    parents = dict(Role.objects.values_list('id', 'parent_role_id'))
+    links = []
+    for role_id in parents:
+        current, depth, seen = role_id, 0, set()
+        while current is not None and current not in seen:
+            seen.add(current)
+            links.append(RoleClosure(ancestor_id=current, descendant_id=role_id, depth=depth))
+            current, depth = parents.get(current), depth + 1
+    RoleClosure.objects.bulk_create(links, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_permissions', '0004_granularpermission_bit_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoleClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField(verbose_name='depth')),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='core_permissions.role')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='core_permissions.role')),
+            ],
+            options={
+                'verbose_name': 'role closure',
+                'verbose_name_plural': 'role closures',
+                'db_table': 'core_role_closure',
+                'indexes': [models.Index(fields=['descendant', 'depth'], name='core_role_c_descend_07147a_idx')],
+                'unique_together': {('ancestor', 'descendant')},
+            },
+        ),
+        migrations.RunPython(build_role_closure, migrations.RunPython.noop),
+    ]
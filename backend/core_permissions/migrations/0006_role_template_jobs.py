@@ -0,0 +1,43 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_organization', '0001_initial'),
+        ('core_permissions', '0005_role_closure'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoleTemplateJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_ids', models.JSONField(default=list, verbose_name='user ids')),
+                ('chunk_size', models.PositiveIntegerField(default=500, verbose_name='chunk size')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20, verbose_name='status')),
+                ('total_users', models.PositiveIntegerField(default=0, verbose_name='total users')),
+                ('processed_users', models.PositiveIntegerField(default=0, verbose_name='processed users')),
+                ('created_assignments', models.PositiveIntegerField(default=0, verbose_name='created assignments')),
+                ('task_id', models.CharField(blank=True, max_length=255, verbose_name='task id')),
+                ('error_message', models.TextField(blank=True, verbose_name='error message')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created at')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='started at')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='finished at')),
+                ('assigned_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='role_template_jobs', to=settings.AUTH_USER_MODEL)),
+                ('department', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core_organization.department')),
+                ('template', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='core_permissions.roletemplate')),
+            ],
+            options={
+                'verbose_name': 'role template job',
+                'verbose_name_plural': 'role template jobs',
+                'db_table': 'core_role_template_jobs',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_organization', '0001_initial'),
+        ('core_permissions', '0006_role_template_jobs'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssignmentExpiryState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='name')),
+                ('last_swept_at', models.DateTimeField(blank=True, null=True, verbose_name='last swept at')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='updated at')),
+            ],
+            options={
+                'verbose_name': 'assignment expiry state',
+                'verbose_name_plural': 'assignment expiry states',
+                'db_table': 'core_assignment_expiry_state',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='rolepermission',
+            index=models.Index(condition=models.Q(('is_temporary', True)), fields=['valid_until'], name='core_rp_temp_valid_until'),
+        ),
+        migrations.AddIndex(
+            model_name='rolepermission',
+            index=models.Index(condition=models.Q(('is_temporary', True)), fields=['valid_from'], name='core_rp_temp_valid_from'),
+        ),
+        migrations.AddIndex(
+            model_name='userrole',
+            index=models.Index(condition=models.Q(('is_temporary', True)), fields=['valid_from'], name='core_ur_temp_valid_from'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:34
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def remove_duplicate_global_roles(apps, schema_editor):
+    # Conservar la asignación global más antigua de cada (user, role)
+    UserRole = apps.get_model('core_permissions', 'UserRole')
+    duplicates = UserRole.objects.filter(department__isnull=True).values('user_id', 'role_id').annotate(
+        keep_id=models.Min('id'), total=models.Count('id')
+    ).filter(total__gt=1)
+    for row in duplicates:
+        UserRole.objects.filter(
+            user_id=row['user_id'], role_id=row['role_id'], department__isnull=True
+        ).exclude(pk=row['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_organization', '0003_department_paths'),
+        ('core_permissions', '0007_assignment_expiry'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_global_roles, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='userrole',
+            constraint=models.UniqueConstraint(condition=models.Q(('department__isnull', True)), fields=('user', 'role'), name='core_ur_unique_global_role'),
+        ),
+    ]
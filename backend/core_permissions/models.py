@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import connection, models, transaction
 from django.utils.translation import gettext_lazy as _
 from django.core.exceptions import ValidationError
 from django.contrib.auth.models import Permission
@@ -7,6 +7,33 @@ from core_users.models import CustomUser
 from core_organization.models import Department, Location
 
 
+class TemporalAssignmentQuerySet(models.QuerySet):
+    """Vigencia de asignaciones temporales (is_temporary, valid_from, valid_until) en SQL"""
+    
+    def active_q(self, at=None, prefix=''):
+        """Q de vigencia; prefix permite aplicarla a través de una relación ('rolepermission__')"""
+        from django.utils import timezone
+        at = at or timezone.now()
+        return models.Q(**{f'{prefix}is_temporary': False}) | (
+            (models.Q(**{f'{prefix}valid_from__isnull': True}) | models.Q(**{f'{prefix}valid_from__lte': at})) &
+            (models.Q(**{f'{prefix}valid_until__isnull': True}) | models.Q(**{f'{prefix}valid_until__gte': at}))
+        )
+    
+    def active_now(self, at=None):
+        """Asignaciones vigentes (equivale a la property is_active, evaluado en la base de datos)"""
+        return self.filter(self.active_q(at))
+    
+    def inactive_now(self, at=None):
+        return self.exclude(self.active_q(at))
+    
+    def boundaries_between(self, start, end):
+        """Asignaciones temporales que empiezan o vencen en (start, end]"""
+        return self.filter(is_temporary=True).filter(
+            models.Q(valid_from__gt=start, valid_from__lte=end) |
+            models.Q(valid_until__gte=start, valid_until__lt=end)
+        )
+
+
 class PermissionModule(models.Model):
     """
     Módulo principal del sistema (Ej: Académico, Financiero, etc.)
@@ -83,6 +110,15 @@ class GranularPermission(models.Model):
         help_text=_('Formato: module.functionality.action.scope')
     )
     
+    # Posición del permiso en los vectores de bits por usuario (ver bitsets.py)
+    bit_index = models.PositiveIntegerField(
+        _('bit index'),
+        null=True,
+        unique=True,
+        editable=False
+    )
+    BIT_INDEX_LOCK = 'core_permissions.granular_permission.bit_index'
+    
     created_at = models.DateTimeField(_('created at'), auto_now_add=True)
     updated_at = models.DateTimeField(_('updated at'), auto_now=True)
 
@@ -174,8 +210,33 @@ class GranularPermission(models.Model):
                     self.full_clean()  # Validar nuevamente
             else:
                 raise e
-            
-        super().save(*args, **kwargs)
+        
+        if self.bit_index is not None:
+            return super().save(*args, **kwargs)
+        
+        # La posición se reserva bajo el lock hasta el commit del INSERT
+        with transaction.atomic():
+            self.bit_index = GranularPermission.next_bit_index()
+            super().save(*args, **kwargs)
+    
+    @classmethod
+    def lock_bit_indexes(cls):
+        """
+        Serializar la asignación de bit_index (advisory lock de PostgreSQL
+        hasta el fin de la transacción; llamar dentro de transaction.atomic)
+        """
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", [cls.BIT_INDEX_LOCK])
+    
+    @classmethod
+    def next_bit_index(cls):
+        """
+        Siguiente posición libre al final del vector de bits. Toma el lock de
+        asignación: dos procesos (p.ej. seed y migración) no obtienen la misma
+        """
+        cls.lock_bit_indexes()
+        current = cls.objects.aggregate(models.Max('bit_index'))['bit_index__max']
+        return 0 if current is None else current + 1
 
 
 class Role(models.Model):
@@ -235,24 +296,119 @@ class Role(models.Model):
     def __str__(self):
         return f"{self.name} ({self.get_role_type_display()})"
     
+    def clean(self):
+        super().clean()
+        if self.parent_role_id and RoleClosure.would_create_cycle(self.pk, self.parent_role_id):
+            raise ValidationError({'parent_role': _('La herencia de roles no puede formar un ciclo')})
+    
+    def save(self, *args, **kwargs):
+        # Rechazar ciclos antes de escribir (la tabla de cierre se sincroniza en signals.py)
+        if self.parent_role_id and RoleClosure.would_create_cycle(self.pk, self.parent_role_id):
+            raise ValidationError({'parent_role': _('La herencia de roles no puede formar un ciclo')})
+        super().save(*args, **kwargs)
+    
+    def get_all_permission_codes(self):
+        """
+        Códigos de todos los permisos del rol, incluyendo herencia (índice aplanado)
+        """
+        from .index import role_permission_index
+        return role_permission_index.get_codes(self.pk)
+    
     def get_all_permissions(self):
         """
-        Obtiene todos los permisos del rol, incluyendo herencia
+        Obtiene todos los permisos del rol, incluyendo herencia (tabla de cierre)
         """
-        permissions = set(self.permissions.all())
-        
-        # Incluir permisos del rol padre (herencia)
-        if self.parent_role:
-            permissions.update(self.parent_role.get_all_permissions())
-            
-        return permissions
+        return set(RoleClosure.permissions_for_roles([self.pk]))
     
     def has_permission(self, permission_code):
         """
         Verifica si el rol tiene un permiso específico
         """
-        all_permissions = self.get_all_permissions()
-        return any(perm.permission_code == permission_code for perm in all_permissions)
+        return permission_code in self.get_all_permission_codes()
+
+
+class RoleClosure(models.Model):
+    """
+    Tabla de cierre de la herencia de roles (parent_role)
+
+    Una fila por cada par (ancestro, descendiente), incluido el propio rol
+    con depth 0. Permite resolver los permisos efectivos de cualquier
+    conjunto de roles con un solo join y detectar ciclos antes de escribir.
+    """
+    ancestor = models.ForeignKey(Role, on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(Role, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.PositiveIntegerField(_('depth'))
+
+    class Meta:
+        db_table = 'core_role_closure'
+        verbose_name = _('role closure')
+        verbose_name_plural = _('role closures')
+        unique_together = ['ancestor', 'descendant']
+        indexes = [
+            models.Index(fields=['descendant', 'depth']),
+        ]
+
+    def __str__(self):
+        return f"{self.ancestor_id} -> {self.descendant_id} ({self.depth})"
+    
+    @classmethod
+    def would_create_cycle(cls, role_id, parent_id):
+        """True si parent_id es el propio rol o uno de sus descendientes"""
+        if role_id is None:
+            return False
+        return role_id == parent_id or cls.objects.filter(ancestor_id=role_id, descendant_id=parent_id).exists()
+    
+    @classmethod
+    def add_role(cls, role_id, parent_id):
+        """Rol nuevo: su fila propia más una por cada ancestro del padre"""
+        links = [cls(ancestor_id=role_id, descendant_id=role_id, depth=0)]
+        if parent_id:
+            links += [
+                cls(ancestor_id=ancestor_id, descendant_id=role_id, depth=depth + 1)
+                for ancestor_id, depth in cls.objects.filter(descendant_id=parent_id).values_list('ancestor_id', 'depth')
+            ]
+        cls.objects.bulk_create(links, ignore_conflicts=True)
+    
+    @classmethod
+    def move_role(cls, role_id, parent_id):
+        """Mover el subárbol de role_id bajo parent_id (None = raíz)"""
+        if not cls.objects.filter(ancestor_id=role_id, descendant_id=role_id).exists():
+            return cls.add_role(role_id, parent_id)
+        
+        subtree = dict(cls.objects.filter(ancestor_id=role_id).values_list('descendant_id', 'depth'))
+        # Desconectar el subárbol de sus ancestros anteriores
+        cls.objects.filter(descendant_id__in=list(subtree)).exclude(ancestor_id__in=list(subtree)).delete()
+        
+        if parent_id:
+            ancestors = cls.objects.filter(descendant_id=parent_id).values_list('ancestor_id', 'depth')
+            cls.objects.bulk_create([
+                cls(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=ancestor_depth + 1 + depth)
+                for ancestor_id, ancestor_depth in ancestors
+                for descendant_id, depth in subtree.items()
+            ], batch_size=1000, ignore_conflicts=True)
+    
+    @classmethod
+    def rebuild(cls):
+        """Reconstruir la tabla completa desde Role.parent_role (los ciclos se cortan)"""
+        parents = dict(Role.objects.values_list('id', 'parent_role_id'))
+        links = []
+        for role_id in parents:
+            current, depth, seen = role_id, 0, set()
+            while current is not None and current not in seen:
+                seen.add(current)
+                links.append(cls(ancestor_id=current, descendant_id=role_id, depth=depth))
+                current, depth = parents.get(current), depth + 1
+        cls.objects.all().delete()
+        cls.objects.bulk_create(links, batch_size=1000)
+        return len(links)
+    
+    @classmethod
+    def permissions_for_roles(cls, role_ids):
+        """GranularPermission efectivos (con herencia) de un conjunto de roles, un solo join"""
+        return GranularPermission.objects.filter(
+            RolePermission.objects.active_q(prefix='rolepermission__'),
+            rolepermission__role__descendant_links__descendant_id__in=list(role_ids)
+        ).distinct()
 
 
 class RolePermission(models.Model):
@@ -284,12 +440,35 @@ class RolePermission(models.Model):
         null=True,
         related_name='assigned_permissions'
     )
+    
+    objects = TemporalAssignmentQuerySet.as_manager()
 
     class Meta:
         db_table = 'core_role_permissions'
         verbose_name = _('role permission')
         verbose_name_plural = _('role permissions')
         unique_together = ['role', 'permission', 'department_filter']
+        indexes = [
+            # Cola de vencimientos/activaciones (ver expiry.py)
+            models.Index(fields=['valid_until'], condition=models.Q(is_temporary=True), name='core_rp_temp_valid_until'),
+            models.Index(fields=['valid_from'], condition=models.Q(is_temporary=True), name='core_rp_temp_valid_from'),
+        ]
+    
+    @property
+    def is_active(self):
+        """Verifica si el permiso temporal está vigente"""
+        if not self.is_temporary:
+            return True
+        
+        from django.utils import timezone
+        now = timezone.now()
+        
+        if self.valid_from and now < self.valid_from:
+            return False
+        if self.valid_until and now > self.valid_until:
+            return False
+            
+        return True
 
 
 class UserRole(models.Model):
@@ -331,16 +510,42 @@ class UserRole(models.Model):
     )
     notes = models.TextField(_('assignment notes'), blank=True)
     
+    objects = TemporalAssignmentQuerySet.as_manager()
+    
     class Meta:
         db_table = 'core_user_roles'
         verbose_name = _('user role')
         verbose_name_plural = _('user roles')
         unique_together = ['user', 'role', 'department']
+        constraints = [
+            # unique_together no aplica con department NULL (roles globales)
+            models.UniqueConstraint(
+                fields=['user', 'role'],
+                condition=models.Q(department__isnull=True),
+                name='core_ur_unique_global_role'
+            ),
+        ]
         indexes = [
             models.Index(fields=['user', 'role']),
             models.Index(fields=['valid_until']),  # Para limpieza de roles expirados
+            models.Index(fields=['valid_from'], condition=models.Q(is_temporary=True), name='core_ur_temp_valid_from'),
         ]
 
+    @classmethod
+    def reserve_ids(cls, count):
+        """
+        Reservar count ids de la secuencia de la tabla (PostgreSQL) para
+        insertar en lote sabiendo después qué filas se insertaron
+        """
+        if count <= 0:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)",
+                [cls._meta.db_table, cls._meta.pk.column, count]
+            )
+            return [row[0] for row in cursor.fetchall()]
+    
     def __str__(self):
         base = f"{self.user.email} - {self.role.name}"
         if self.department:
@@ -409,18 +614,8 @@ class RoleTemplate(models.Model):
         """
         Aplica todos los roles de la plantilla a un usuario
         """
-        for template_role in self.templaterole_set.all():
-            UserRole.objects.get_or_create(
-                user=user,
-                role=template_role.role,
-                department=department,
-                assigned_by=assigned_by,
-                defaults={
-                    'is_temporary': template_role.is_temporary,
-                    'valid_from': template_role.valid_from,
-                    'valid_until': template_role.valid_until,
-                }
-            )
+        from .utils import RoleTemplateManager
+        return RoleTemplateManager.bulk_apply_template(self, [user.pk], assigned_by, department)
 
 
 class TemplateRole(models.Model):
@@ -444,4 +639,76 @@ class TemplateRole(models.Model):
         verbose_name = _('template role')
         verbose_name_plural = _('template roles')
         ordering = ['template', 'order']
-        unique_together = ['template', 'role']
\ No newline at end of file
+        unique_together = ['template', 'role']
+
+
+class RoleTemplateJob(models.Model):
+    """
+    Aplicación masiva de una plantilla de roles ejecutada en segundo plano
+
+    Los usuarios se procesan en lotes de chunk_size; processed_users avanza en
+    la misma transacción que cada lote, así que un job fallido o interrumpido
+    se reanuda desde el último lote confirmado.
+    """
+    STATUS_CHOICES = [
+        ('pending', _('Pending')),
+        ('running', _('Running')),
+        ('completed', _('Completed')),
+        ('failed', _('Failed')),
+    ]
+    
+    template = models.ForeignKey(RoleTemplate, on_delete=models.CASCADE, related_name='jobs')
+    department = models.ForeignKey(Department, on_delete=models.SET_NULL, null=True, blank=True)
+    assigned_by = models.ForeignKey(
+        CustomUser,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='role_template_jobs'
+    )
+    user_ids = models.JSONField(_('user ids'), default=list)
+    chunk_size = models.PositiveIntegerField(_('chunk size'), default=500)
+    
+    status = models.CharField(_('status'), max_length=20, choices=STATUS_CHOICES, default='pending')
+    total_users = models.PositiveIntegerField(_('total users'), default=0)
+    processed_users = models.PositiveIntegerField(_('processed users'), default=0)
+    created_assignments = models.PositiveIntegerField(_('created assignments'), default=0)
+    task_id = models.CharField(_('task id'), max_length=255, blank=True)
+    error_message = models.TextField(_('error message'), blank=True)
+    
+    created_at = models.DateTimeField(_('created at'), auto_now_add=True)
+    started_at = models.DateTimeField(_('started at'), null=True, blank=True)
+    finished_at = models.DateTimeField(_('finished at'), null=True, blank=True)
+
+    class Meta:
+        db_table = 'core_role_template_jobs'
+        verbose_name = _('role template job')
+        verbose_name_plural = _('role template jobs')
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.template} - {self.processed_users}/{self.total_users} ({self.status})"
+    
+    @property
+    def progress(self):
+        if not self.total_users:
+            return 100.0
+        return round(self.processed_users * 100 / self.total_users, 2)
+
+
+class AssignmentExpiryState(models.Model):
+    """
+    Marca de agua del barrido de vigencias: los límites valid_from/valid_until
+    anteriores a last_swept_at ya se aplicaron a índices y cachés
+    """
+    name = models.CharField(_('name'), max_length=50, unique=True)
+    last_swept_at = models.DateTimeField(_('last swept at'), null=True, blank=True)
+    updated_at = models.DateTimeField(_('updated at'), auto_now=True)
+
+    class Meta:
+        db_table = 'core_assignment_expiry_state'
+        verbose_name = _('assignment expiry state')
+        verbose_name_plural = _('assignment expiry states')
+
+    def __str__(self):
+        return f"{self.name}: {self.last_swept_at}"
+
@@ -0,0 +1,207 @@
+from django.core.exceptions import ObjectDoesNotExist
+from rest_framework import permissions
+from rest_framework.exceptions import PermissionDenied
+from .scopes import DepartmentScopeEngine
+
+# Acción de DRF -> acción de GranularPermission
+DEFAULT_GRANULAR_ACTIONS = {
+    'list': 'view',
+    'retrieve': 'view',
+    'create': 'create',
+    'update': 'edit',
+    'partial_update': 'edit',
+    'destroy': 'delete',
+}
+
+
+def get_scope_engine(request):
+    """
+    DepartmentScopeEngine del usuario de la petición (uno por petición, así
+    las cláusulas se resuelven una sola vez). Staff y superusuarios no tienen
+    restricción de alcance
+    """
+    engine = getattr(request, '_scope_engine', None)
+    if engine is None or engine.user_id != request.user.pk:
+        user = request.user
+        engine = DepartmentScopeEngine(user, unrestricted=user.is_staff or user.is_superuser)
+        request._scope_engine = engine
+    return engine
+
+
+def get_required_permission(view):
+    """
+    Permiso granular que exige la petición actual de la vista
+    ('módulo.funcionalidad.acción') o None si no lo requiere.
+
+    granular_actions se consulta por 'acción:método' (p.ej. 'profile:put'),
+    luego por acción de ViewSet y, en un APIView, por método ('get', 'post')
+    """
+    base = getattr(view, 'granular_permission', None)
+    if not base:
+        return None
+    actions = getattr(view, 'granular_actions', DEFAULT_GRANULAR_ACTIONS)
+    action = getattr(view, 'action', None)
+    request = getattr(view, 'request', None)
+    method = request.method.lower() if request is not None else None
+    keys = (f'{action}:{method}', action) if action else (method,)
+    for key in keys:
+        if key in actions:
+            return f"{base}.{actions[key]}"
+    return None
+
+
+def _resolve(obj, path):
+    """
+    Seguir una ruta 'a__b' sobre una instancia ('' = el propio objeto). Una
+    relación inexistente (p.ej. OneToOne inversa sin fila) resuelve a None
+    """
+    for attr in path.split('__') if path else ():
+        if obj is None:
+            return None
+        try:
+            obj = getattr(obj, attr)
+        except ObjectDoesNotExist:
+            return None
+    return obj
+
+
+def _resolve_pk(obj, path):
+    """pk del objeto al final de la ruta (usa el campo *_id si evita una consulta)"""
+    if obj is not None and '__' not in path and hasattr(obj, f'{path}_id'):
+        return getattr(obj, f'{path}_id')
+    value = _resolve(obj, path)
+    return getattr(value, 'pk', value)
+
+
+def _resolve_department(view, obj):
+    """Departamento del objeto según scope_department_field (None = objeto sin departamento)"""
+    field = getattr(view, 'scope_department_field', 'department')
+    return None if field is None else _resolve(obj, field)
+
+
+class GranularPermissionRequired(permissions.BasePermission):
+    """
+    Exige el GranularPermission de la acción actual.
+
+    La vista declara granular_permission = 'módulo.funcionalidad' y,
+    opcionalmente, granular_actions (acción de DRF -> acción del permiso;
+    las acciones que no aparecen no se verifican aquí). has_permission pide
+    el permiso en cualquier alcance; has_object_permission comprueba además
+    que el objeto esté dentro del alcance (departamento del objeto según
+    scope_department_field, dueño según scope_owner_field).
+
+    Las vistas de objetos globales (roles, módulos, utilidades) declaran
+    scope_department_field = None: solo cuenta el permiso sin restricción de
+    departamento, tanto para la vista como para cada objeto.
+    """
+    message = 'No tiene permiso para realizar esta acción.'
+
+    def has_permission(self, request, view):
+        permission = get_required_permission(view)
+        if permission is None:
+            return True
+        if not request.user or not request.user.is_authenticated:
+            return False
+        engine = get_scope_engine(request)
+        if getattr(view, 'scope_department_field', 'department') is None:
+            return engine.can(permission)
+        return engine.has_permission(permission)
+
+    def has_object_permission(self, request, view, obj):
+        permission = get_required_permission(view)
+        if permission is None:
+            return True
+        department = _resolve_department(view, obj)
+        owner_field = getattr(view, 'scope_owner_field', None)
+        owner_id = _resolve_pk(obj, owner_field) if owner_field else None
+        return get_scope_engine(request).can(permission, department, owner_id)
+
+
+class ScopedQuerysetMixin:
+    """
+    Mixin para ViewSets: restringe los querysets de list/retrieve/update/
+    destroy (filter_queryset, así respeta el get_queryset de cada vista) al
+    alcance efectivo del usuario para el permiso de la acción actual, como un
+    único WHERE sobre los intervalos MPTT del departamento (tree_id/lft/rght)
+    y el dueño. Las acciones propias usan scope_queryset().
+
+        class JobPositionViewSet(ScopedQuerysetMixin, viewsets.ModelViewSet):
+            permission_classes = [IsAuthenticated, GranularPermissionRequired]
+            granular_permission = 'organization.positions'
+            scope_department_field = 'department'
+
+    scope_department_field es la ruta al Department ('' si el modelo es
+    Department) y scope_owner_field la ruta al usuario dueño (None = el
+    alcance 'own' no concede objetos). Al crear o actualizar se valida que
+    el departamento/dueño de destino también esté dentro del alcance.
+    """
+    granular_permission = None
+    granular_actions = DEFAULT_GRANULAR_ACTIONS
+    scope_department_field = 'department'
+    scope_owner_field = None
+
+    def filter_queryset(self, queryset):
+        return self.scope_queryset(super().filter_queryset(queryset))
+
+    def scope_queryset(self, queryset):
+        """Aplicar el alcance del permiso de la acción actual a un queryset"""
+        permission = get_required_permission(self)
+        if permission is None:
+            return queryset
+        return get_scope_engine(self.request).filter_queryset(
+            queryset, permission, self.scope_department_field, self.scope_owner_field
+        )
+
+    def perform_create(self, serializer):
+        self.check_scope_target(serializer)
+        super().perform_create(serializer)
+
+    def perform_update(self, serializer):
+        self.check_scope_target(serializer)
+        super().perform_update(serializer)
+
+    def get_scope_target(self, serializer):
+        """
+        (departamento, owner_id) que tendrá el objeto tras guardar. Para
+        Department el objetivo es el nuevo padre (o el propio departamento si
+        no se mueve)
+        """
+        data = serializer.validated_data
+        instance = serializer.instance
+        field = self.scope_department_field
+
+        if not field:
+            department = data.get('parent') if instance is None or 'parent' in data else instance
+        else:
+            department = self._resolve_target(data, instance, field)
+
+        owner_id = None
+        owner_field = self.scope_owner_field
+        if owner_field:
+            owner = self._resolve_target(data, instance, owner_field)
+            owner_id = getattr(owner, 'pk', owner)
+        return department, owner_id
+
+    @staticmethod
+    def _resolve_target(data, instance, path):
+        """
+        Valor de la ruta tras guardar: si el primer tramo viene en los datos
+        validados se sigue desde ahí, si no desde la instancia actual (None al crear)
+        """
+        first, _, rest = path.partition('__')
+        if first in data:
+            return _resolve(data[first], rest)
+        if not rest:
+            return _resolve_pk(instance, first) if instance is not None else None
+        return _resolve(instance, path)
+
+    def check_scope_target(self, serializer):
+        if get_required_permission(self) is None:
+            return
+        self.check_scope(*self.get_scope_target(serializer))
+
+    def check_scope(self, department, owner_id=None):
+        """PermissionDenied si el departamento/dueño está fuera del alcance de la acción actual"""
+        permission = get_required_permission(self)
+        if permission is not None and not get_scope_engine(self.request).can(permission, department, owner_id):
+            raise PermissionDenied('El destino está fuera del alcance de sus permisos.')
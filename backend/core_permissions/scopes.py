@@ -0,0 +1,241 @@
+from django.db import models
+from core_organization.models import Department, OrganizationalAssignment
+
+
+def get_department_interval(department):
+    """(tree_id, lft, rght) de un Department o de su id (None si no existe)"""
+    if department is None:
+        return None
+    if isinstance(department, Department):
+        return (department.tree_id, department.lft, department.rght)
+    return Department.objects.filter(pk=department).values_list('tree_id', 'lft', 'rght').first()
+
+
+def interval_contains(outer, inner):
+    """True si inner está dentro del subárbol outer (o es el mismo nodo)"""
+    return outer[0] == inner[0] and outer[1] <= inner[1] and inner[2] <= outer[2]
+
+
+def intersect_intervals(intervals):
+    """
+    Intersección de subárboles MPTT: dos subárboles están anidados o son
+    disjuntos, así que el resultado es el más profundo o None si no se tocan
+    """
+    result = None
+    for interval in intervals:
+        if result is None or interval_contains(result, interval):
+            result = interval
+        elif not interval_contains(interval, result):
+            return None
+    return result
+
+
+def subtree_q(interval, field='department'):
+    """Q de los objetos cuyo departamento está en el subárbol de interval"""
+    prefix = f'{field}__' if field else ''
+    tree_id, lft, rght = interval
+    return models.Q(**{f'{prefix}tree_id': tree_id, f'{prefix}lft__gte': lft, f'{prefix}rght__lte': rght})
+
+
+def ancestors_q(interval, field='department'):
+    """Q de las filas cuyo departamento es interval o uno de sus ancestros (o no tiene departamento)"""
+    tree_id, lft, rght = interval
+    return models.Q(**{f'{field}__isnull': True}) | models.Q(
+        **{f'{field}__tree_id': tree_id, f'{field}__lft__lte': lft, f'{field}__rght__gte': rght}
+    )
+
+
+class ScopeClause:
+    """
+    Una región donde el usuario puede ejecutar la acción: un subárbol de
+    departamentos (interval=None = cualquier departamento) y, para el alcance
+    'own', la condición de ser el dueño del objeto
+    """
+    __slots__ = ('interval', 'own')
+
+    def __init__(self, interval=None, own=False):
+        self.interval = interval
+        self.own = own
+
+    def __repr__(self):
+        return f"<ScopeClause interval={self.interval} own={self.own}>"
+
+    def covers(self, other):
+        """True si esta cláusula permite todo lo que permite other"""
+        if self.own and not other.own:
+            return False
+        if self.interval is None:
+            return True
+        return other.interval is not None and interval_contains(self.interval, other.interval)
+
+    def allows(self, user_id, interval, owner_id):
+        if self.own and owner_id != user_id:
+            return False
+        if self.interval is None:
+            return True
+        return interval is not None and interval_contains(self.interval, interval)
+
+
+class DepartmentScopeEngine:
+    """
+    Evaluación del alcance de los permisos sobre los intervalos MPTT de
+    Department (tree_id, lft, rght).
+
+    Un permiso 'módulo.funcionalidad.acción' se concede con cualquiera de sus
+    alcances; cada RolePermission vigente que llega al usuario (herencia por
+    RoleClosure incluida) se traduce a una ScopeClause:
+
+        all         el subárbol de UserRole.department / department_filter
+                    (ninguno = cualquier departamento)
+        department  el subárbol del departamento del usuario para ese rol
+                    (UserRole.department o su OrganizationalAssignment)
+        own         como 'all', pero solo objetos cuyo dueño es el usuario
+        custom      solo el subárbol de department_filter (obligatorio)
+
+    can() resuelve "¿puede U ejecutar P sobre un objeto del departamento D?"
+    como tests de contención de intervalos, y filter_queryset() convierte las
+    mismas cláusulas en un Q para que los listados filtren en SQL. Las
+    concesiones (scope, UserRole.department, department_filter) salen de
+    PermissionCache.get_user_scope_grants; las cláusulas se calculan una vez
+    por (usuario, permiso) y se reutilizan durante la vida del motor
+    (normalmente una petición). Los superusuarios no tienen restricción.
+    """
+    SCOPES = ('all', 'department', 'own', 'custom')
+
+    def __init__(self, user, unrestricted=None):
+        self.user = user
+        self.user_id = getattr(user, 'pk', user)
+        if unrestricted is None:
+            unrestricted = bool(getattr(user, 'is_superuser', False))
+        self.unrestricted = unrestricted
+        self._clauses = {}
+        self._home_interval = False
+        self._intervals = {}
+
+    @staticmethod
+    def split_permission(permission):
+        """'m.f.a' o 'm.f.a.scope' -> ('m.f.a', scope o None)"""
+        parts = permission.split('.')
+        if len(parts) == 4 and parts[3] in DepartmentScopeEngine.SCOPES:
+            return '.'.join(parts[:3]), parts[3]
+        return permission, None
+
+    def is_unrestricted(self):
+        return self.unrestricted
+
+    def get_clauses(self, permission):
+        """ScopeClauses (ya compactadas) con las que el usuario tiene el permiso"""
+        if permission not in self._clauses:
+            self._clauses[permission] = self._build_clauses(permission)
+        return self._clauses[permission]
+
+    def has_permission(self, permission):
+        """El usuario tiene el permiso en algún alcance"""
+        return self.is_unrestricted() or bool(self.get_clauses(permission))
+
+    def can(self, permission, department=None, owner_id=None):
+        """
+        ¿Puede el usuario ejecutar permission sobre un objeto del departamento
+        department (instancia o id; incluye descendientes) con dueño owner_id?
+        """
+        if self.is_unrestricted():
+            return True
+        clauses = self.get_clauses(permission)
+        if not clauses:
+            return False
+        interval = self._interval(department)
+        return any(clause.allows(self.user_id, interval, owner_id) for clause in clauses)
+
+    def get_q(self, permission, department_field='department', owner_field=None):
+        """
+        Q equivalente a can() para un queryset: department_field es la ruta al
+        Department del modelo ('' si el queryset es de Department) y
+        owner_field la del dueño (sin él, el alcance 'own' no concede nada).
+        Devuelve None si no hay restricción.
+        """
+        if self.is_unrestricted():
+            return None
+        q = models.Q(pk__in=[])
+        for clause in self.get_clauses(permission):
+            if clause.own and not owner_field:
+                continue
+            if clause.interval is None and not clause.own:
+                return None
+            clause_q = models.Q()
+            if clause.interval is not None:
+                clause_q &= subtree_q(clause.interval, department_field)
+            if clause.own:
+                clause_q &= models.Q(**{owner_field: self.user_id})
+            q |= clause_q
+        return q
+
+    def filter_queryset(self, queryset, permission, department_field='department', owner_field=None):
+        """Restringir queryset a los objetos sobre los que el usuario puede ejecutar permission"""
+        q = self.get_q(permission, department_field, owner_field)
+        return queryset if q is None else queryset.filter(q)
+
+    def _build_clauses(self, permission):
+        from .utils import PermissionCache
+
+        specs = PermissionCache.get_user_scope_grants(self.user_id, permission)
+        self._load_intervals({
+            department_id for spec in specs for department_id in spec[1:] if department_id
+        })
+
+        clauses = []
+        for scope, department_id, filter_id in specs:
+            clause = self._clause(scope, department_id, filter_id)
+            if clause is not None:
+                clauses.append(clause)
+        return self._compact(clauses)
+
+    def _clause(self, scope, department_id, filter_id):
+        if scope == 'custom' and not filter_id:
+            return None
+        role_interval = self._intervals.get(department_id) if department_id else None
+        filter_interval = self._intervals.get(filter_id) if filter_id else None
+        if (department_id and role_interval is None) or (filter_id and filter_interval is None):
+            return None
+        if scope == 'department' and role_interval is None:
+            role_interval = self._get_home_interval()
+            if role_interval is None:
+                return None
+
+        anchors = [interval for interval in (role_interval, filter_interval) if interval is not None]
+        if not anchors:
+            return ScopeClause(None, own=scope == 'own')
+        interval = intersect_intervals(anchors)
+        if interval is None:
+            return None
+        return ScopeClause(interval, own=scope == 'own')
+
+    @staticmethod
+    def _compact(clauses):
+        # Descartar cláusulas cubiertas por otras (subárboles anidados)
+        result = []
+        for clause in sorted(clauses, key=lambda clause: (clause.own, clause.interval is not None, clause.interval or ())):
+            if not any(kept.covers(clause) for kept in result):
+                result.append(clause)
+        return tuple(result)
+
+    def _get_home_interval(self):
+        if self._home_interval is False:
+            self._home_interval = OrganizationalAssignment.objects.filter(
+                user_id=self.user_id, is_active=True
+            ).values_list('department__tree_id', 'department__lft', 'department__rght').first()
+        return self._home_interval
+
+    def _load_intervals(self, department_ids):
+        missing = [department_id for department_id in department_ids if department_id not in self._intervals]
+        if missing:
+            for pk, tree_id, lft, rght in Department.objects.filter(pk__in=missing).values_list(
+                'pk', 'tree_id', 'lft', 'rght'
+            ):
+                self._intervals[pk] = (tree_id, lft, rght)
+
+    def _interval(self, department):
+        if department is None or isinstance(department, Department):
+            return get_department_interval(department)
+        if department not in self._intervals:
+            self._load_intervals([department])
+        return self._intervals.get(department)
@@ -1,7 +1,9 @@
 from rest_framework import serializers
+from django.conf import settings
 from .models import (
     PermissionModule, GranularPermission, Role, 
-    UserRole, RoleTemplate, RolePermission, TemplateRole
+    UserRole, RoleTemplate, RoleClosure, RolePermission, TemplateRole,
+    RoleTemplateJob
 )
 
 # ✅ IMPORTAR SERIALIZERS DE LOS MÓDULOS CORRECTOS
@@ -74,6 +76,7 @@ class RolePermissionSerializer(serializers.ModelSerializer):
 class RoleSerializer(serializers.ModelSerializer):
     """Serializer para roles"""
     permissions_count = serializers.SerializerMethodField()
+    effective_permissions_count = serializers.SerializerMethodField()
     users_count = serializers.SerializerMethodField()
     parent_role_name = serializers.CharField(source='parent_role.name', read_only=True)
     role_type_display = serializers.CharField(source='get_role_type_display', read_only=True)
@@ -84,7 +87,8 @@ class RoleSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'name', 'code', 'description', 'role_type', 'role_type_display',
             'is_active', 'is_super_admin', 'auto_assign_to_new_users',
-            'parent_role', 'parent_role_name', 'permissions_count', 'users_count',
+            'parent_role', 'parent_role_name', 'permissions_count',
+            'effective_permissions_count', 'users_count',
             'permissions', 'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at']
@@ -92,9 +96,22 @@ class RoleSerializer(serializers.ModelSerializer):
     def get_permissions_count(self, obj):
         return obj.permissions.count()
     
+    def get_effective_permissions_count(self, obj):
+        """Permisos propios más heredados (anotado por RoleViewSet o un join sobre RoleClosure)"""
+        count = getattr(obj, 'effective_permissions_count', None)
+        if count is None:
+            count = RoleClosure.permissions_for_roles([obj.pk]).count()
+        return count
+    
     def get_users_count(self, obj):
         return obj.user_assignments.count()
     
+    def validate_parent_role(self, value):
+        """Rechazar herencias circulares"""
+        if value and self.instance and RoleClosure.would_create_cycle(self.instance.pk, value.pk):
+            raise serializers.ValidationError("La herencia de roles no puede formar un ciclo")
+        return value
+    
     def validate_code(self, value):
         """Validar que el código del rol sea único"""
         if Role.objects.filter(code=value).exclude(pk=self.instance.pk if self.instance else None).exists():
@@ -166,6 +183,14 @@ class AssignPermissionsToRoleSerializer(serializers.Serializer):
     )
 
 
+class RevokePermissionsFromRoleSerializer(serializers.Serializer):
+    """Serializer para revocar múltiples permisos de un rol"""
+    permission_codes = serializers.ListField(
+        child=serializers.CharField(max_length=100),
+        help_text="Lista de códigos de permisos a revocar"
+    )
+
+
 class AssignRoleToUserSerializer(serializers.Serializer):
     """Serializer para asignar un rol a un usuario"""
     user_id = serializers.PrimaryKeyRelatedField(
@@ -204,4 +229,73 @@ class CheckPermissionSerializer(serializers.Serializer):
         queryset=DepartmentSerializer.Meta.model.objects.all(),  # ✅ REFERENCIA CORRECTA
         required=False, 
         allow_null=True
-    )
\ No newline at end of file
+    )
+
+class BatchCheckPermissionSerializer(serializers.Serializer):
+    """Serializer para verificar muchos usuarios × muchos permisos"""
+    user_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False
+    )
+    permission_codes = serializers.ListField(
+        child=serializers.CharField(max_length=100),
+        allow_empty=False
+    )
+    department_id = serializers.PrimaryKeyRelatedField(
+        queryset=DepartmentSerializer.Meta.model.objects.all(),
+        required=False, 
+        allow_null=True
+    )
+    
+    def validate(self, attrs):
+        attrs['user_ids'] = list(dict.fromkeys(attrs['user_ids']))
+        attrs['permission_codes'] = list(dict.fromkeys(attrs['permission_codes']))
+        
+        max_size = getattr(settings, 'PERMISSION_BATCH_CHECK_MAX_SIZE', 5000)
+        size = len(attrs['user_ids']) * len(attrs['permission_codes'])
+        if size > max_size:
+            raise serializers.ValidationError(
+                f"El lote tiene {size} verificaciones (usuarios × permisos); el máximo es {max_size}"
+            )
+        
+        existing = set(
+            CustomUserSerializer.Meta.model.objects.filter(
+                id__in=attrs['user_ids']
+            ).values_list('id', flat=True)
+        )
+        missing = [user_id for user_id in attrs['user_ids'] if user_id not in existing]
+        if missing:
+            raise serializers.ValidationError({'user_ids': f"Usuarios no encontrados: {missing}"})
+        
+        return attrs
+
+
+class ApplyTemplateToUsersSerializer(serializers.Serializer):
+    """Serializer para aplicar una plantilla a muchos usuarios en segundo plano"""
+    user_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False
+    )
+    department_id = serializers.PrimaryKeyRelatedField(
+        queryset=DepartmentSerializer.Meta.model.objects.all(),
+        required=False, 
+        allow_null=True
+    )
+    chunk_size = serializers.IntegerField(required=False, min_value=1, max_value=5000, default=500)
+
+
+class RoleTemplateJobSerializer(serializers.ModelSerializer):
+    """Serializer para el estado de una aplicación masiva de plantilla"""
+    template_name = serializers.CharField(source='template.name', read_only=True)
+    progress = serializers.FloatField(read_only=True)
+    
+    class Meta:
+        model = RoleTemplateJob
+        fields = [
+            'id', 'template', 'template_name', 'department', 'status',
+            'total_users', 'processed_users', 'created_assignments', 'progress',
+            'chunk_size', 'task_id', 'error_message',
+            'created_at', 'started_at', 'finished_at'
+        ]
+        read_only_fields = fields
+
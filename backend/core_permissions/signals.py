@@ -0,0 +1,143 @@
+import threading
+from contextlib import contextmanager
+from django.db import connection, transaction
+from django.db.models.signals import post_init, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+from .models import Role, RoleClosure, RolePermission, GranularPermission, UserRole
+from .index import mark_pending_changes, role_permission_index
+from .bitsets import permission_slots
+from .utils import PermissionCache
+
+_bulk_state = threading.local()
+
+
+def _on_change(change):
+    """
+    Aplicar un cambio de índice/caché al confirmar la transacción: si se
+    revierte no queda nada en el índice ni en el caché compartido. Hasta
+    entonces la transacción lee sus propios cambios (índice provisional, sin
+    caché)
+    """
+    if connection.in_atomic_block:
+        mark_pending_changes()
+        transaction.on_commit(change)
+    else:
+        change()
+
+
+def role_permissions_changed(role_ids):
+    """Refrescar el índice e invalidar caché tras cambiar permisos directos de roles"""
+    def change():
+        for role_id in role_ids:
+            role_permission_index.refresh_role_permissions(role_id)
+            PermissionCache.invalidate_role_cache(role_id)
+    _on_change(change)
+
+
+@contextmanager
+def role_permission_signals_suppressed():
+    """
+    Omitir el refresco por fila de los receptores de RolePermission (borrados
+    en lote): quien lo usa llama una vez a role_permissions_changed
+    """
+    previous = getattr(_bulk_state, 'suppressed', False)
+    _bulk_state.suppressed = True
+    try:
+        yield
+    finally:
+        _bulk_state.suppressed = previous
+
+
+def _invalidate_all():
+    def change():
+        role_permission_index.invalidate()
+        PermissionCache.invalidate_user_cache()
+    _on_change(change)
+
+
+@receiver(post_save, sender=UserRole)
+@receiver(post_delete, sender=UserRole)
+def invalidate_user_on_user_role_change(sender, instance, **kwargs):
+    """Rol asignado, modificado o quitado: solo cambia ese usuario"""
+    user_id = instance.user_id
+    _on_change(lambda: PermissionCache.invalidate_user_cache(user_id))
+
+
+@receiver(post_save, sender=RolePermission)
+@receiver(post_delete, sender=RolePermission)
+def update_index_on_role_permission_change(sender, instance, **kwargs):
+    """Permisos directos de un rol modificados"""
+    if getattr(_bulk_state, 'suppressed', False):
+        return
+    role_permissions_changed([instance.role_id])
+
+
+@receiver(m2m_changed, sender=Role.permissions.through)
+def update_index_on_role_permissions_m2m(sender, instance, action, reverse, pk_set, **kwargs):
+    """role.permissions.add/remove/clear (no emiten post_save de RolePermission)"""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        role_permissions_changed([instance.pk])
+    elif action == 'post_clear':
+        # permission.roles.clear(): no se sabe qué roles cambiaron
+        _invalidate_all()
+    else:
+        role_permissions_changed(list(pk_set or ()))
+
+
+@receiver(post_init, sender=Role)
+def remember_loaded_parent_role(sender, instance, **kwargs):
+    instance._loaded_parent_role_id = instance.__dict__.get('parent_role_id')
+
+
+@receiver(post_save, sender=Role)
+def update_index_on_role_parent_change(sender, instance, created, **kwargs):
+    """Cambio de herencia (parent_role) o rol nuevo"""
+    if created or instance.parent_role_id != getattr(instance, '_loaded_parent_role_id', None):
+        role_id, parent_id = instance.pk, instance.parent_role_id
+        if created:
+            RoleClosure.add_role(role_id, parent_id)
+        else:
+            RoleClosure.move_role(role_id, parent_id)
+        
+        def change():
+            role_permission_index.refresh_role_parent(role_id, parent_id)
+            PermissionCache.invalidate_role_cache(role_id)
+        _on_change(change)
+    instance._loaded_parent_role_id = instance.parent_role_id
+
+
+@receiver(pre_delete, sender=Role)
+def remember_child_roles(sender, instance, **kwargs):
+    # parent_role es SET_NULL: los hijos pasan a ser raíces sin emitir post_save
+    instance._child_role_ids = list(instance.child_roles.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Role)
+def update_index_on_role_delete(sender, instance, **kwargs):
+    # Sus UserRole se eliminan en cascada (cada uno invalida su usuario)
+    role_id = instance.pk
+    child_ids = getattr(instance, '_child_role_ids', None)
+    if child_ids:
+        # Los hijos eliminados en el mismo delete() ya no existen
+        for child_id in Role.objects.filter(pk__in=child_ids).values_list('pk', flat=True):
+            RoleClosure.move_role(child_id, None)
+    descendant_ids = role_permission_index.get_descendant_ids(role_id) - {role_id}
+    
+    def change():
+        role_permission_index.remove_role(role_id)
+        PermissionCache.invalidate_role_cache(role_id)
+        for descendant_id in descendant_ids:
+            PermissionCache.invalidate_role_cache(descendant_id)
+    _on_change(change)
+
+
+@receiver(post_save, sender=GranularPermission)
+@receiver(post_delete, sender=GranularPermission)
+def update_index_on_permission_change(sender, instance, created=False, **kwargs):
+    """Un código de permiso cambiado o eliminado puede afectar a muchos roles"""
+    _on_change(permission_slots.invalidate)
+    if created:
+        return
+    _invalidate_all()
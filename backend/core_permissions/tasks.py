@@ -0,0 +1,90 @@
+import logging
+from celery import shared_task
+
+logger = logging.getLogger(__name__)
+
+@shared_task
+def sync_all_user_permissions(chunk_size=500, department_id=None, user_ids=None):
+    """
+    Re-sincroniza user_permissions de todos los usuarios activos (o de user_ids)
+    en lotes de chunk_size, p.ej. tras cambiar los permisos de un rol
+    """
+    try:
+        from core_users.models import CustomUser
+        from core_organization.models import Department
+        from .utils import PermissionManager
+        
+        department = Department.objects.get(pk=department_id) if department_id else None
+        users = CustomUser.objects.filter(is_active=True)
+        if user_ids is not None:
+            users = users.filter(pk__in=user_ids)
+        
+        totals = {'users': 0, 'auth_permissions_created': 0, 'added': 0, 'removed': 0}
+        last_pk = 0
+        while True:
+            # Paginación por clave: cada lote es una consulta por rango de pk
+            chunk = list(
+                users.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:chunk_size]
+            )
+            if not chunk:
+                break
+            result = PermissionManager.sync_users_permissions(chunk, department)
+            for key in totals:
+                totals[key] += result[key]
+            last_pk = chunk[-1]
+        
+        logger.info(f"Permisos de usuarios sincronizados: {totals}")
+        return f"Sincronizados {totals['users']} usuarios (+{totals['added']} / -{totals['removed']})"
+        
+    except Exception as e:
+        logger.error(f"Error sincronizando permisos de usuarios: {str(e)}")
+        return f"Error: {str(e)}"
+
+@shared_task(bind=True)
+def apply_role_template_job(self, job_id):
+    """Aplica una plantilla de roles a un lote grande de usuarios (reanudable)"""
+    try:
+        from .models import RoleTemplateJob
+        from .utils import RoleTemplateManager
+        
+        job = RoleTemplateJob.objects.select_related('template', 'department', 'assigned_by').get(pk=job_id)
+        if job.status == 'completed':
+            return f"Job {job_id} ya completado"
+        
+        def report_progress(processed, total, created):
+            if self.request.is_eager:
+                return
+            self.update_state(state='PROGRESS', meta={
+                'job_id': job_id,
+                'processed_users': processed,
+                'total_users': total,
+                'created_assignments': created,
+            })
+        
+        job = RoleTemplateManager.run_template_job(job, report_progress)
+        logger.info(f"Plantilla {job.template.name} aplicada: {job.created_assignments} asignaciones")
+        return f"Procesados {job.processed_users} usuarios, {job.created_assignments} asignaciones creadas"
+        
+    except Exception as e:
+        from django.utils import timezone
+        from .models import RoleTemplateJob
+        
+        RoleTemplateJob.objects.filter(pk=job_id).update(
+            status='failed', error_message=str(e), finished_at=timezone.now()
+        )
+        logger.error(f"Error aplicando plantilla de roles (job {job_id}): {str(e)}")
+        return f"Error: {str(e)}"
+
+@shared_task
+def sweep_assignment_expiry():
+    """Aplica los vencimientos/activaciones de roles y permisos temporales"""
+    try:
+        from .expiry import AssignmentExpirySweeper
+        
+        result = AssignmentExpirySweeper.sweep()
+        logger.info(f"Barrido de vigencias de permisos: {result}")
+        return f"Usuarios afectados: {result['users']} - Roles refrescados: {result['roles']}"
+        
+    except Exception as e:
+        logger.error(f"Error en el barrido de vigencias de permisos: {str(e)}")
+        return f"Error: {str(e)}"
@@ -1,3 +1,285 @@
+from datetime import timedelta
+from unittest import mock
+from django.db import IntegrityError, connection, transaction
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from core_organization.models import Department, DepartmentHeadcount
+from core_users.models import CustomUser
+from .expiry import AssignmentExpirySweeper
+from .index import role_permission_index
+from .models import GranularPermission, PermissionModule, Role, RolePermission, RoleTemplate, TemplateRole, UserRole
+from .utils import PermissionCache, PermissionManager, RoleTemplateManager
 
-# Create your tests here.
+
+class GranularPermissionViewsTests(TestCase):
+    """Permisos granulares y alcance en las vistas (GranularPermissionRequired)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        PermissionModule.objects.create(code='users', name='Usuarios')
+        PermissionModule.objects.create(code='system', name='Sistema')
+        PermissionManager.generate_permissions({
+            'users': {'accounts': ['view'], 'roles': ['view']},
+            'system': {'roles': ['view']},
+        })
+
+        cls.department = Department.objects.create(name='Académico', code='ACA')
+        cls.other_department = Department.objects.create(name='Finanzas', code='FIN')
+
+        cls.viewer = CustomUser.objects.create_user(email='viewer@example.com', password='x')
+        cls.target = CustomUser.objects.create_user(email='target@example.com', password='x')
+        cls.outsider = CustomUser.objects.create_user(email='outsider@example.com', password='x')
+
+        cls.role = Role.objects.create(name='Lector', code='lector')
+        PermissionManager.bulk_assign_permissions_to_role(
+            cls.role, ['users.accounts.view.all', 'users.roles.view.all']
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+    def test_retrieve_user_without_organizational_assignment(self):
+        UserRole.objects.create(user=self.viewer, role=self.role)
+
+        response = self.client.get(f'/api/users/users/{self.target.pk}/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['email'], self.target.email)
+
+    def test_user_permissions_requires_roles_view(self):
+        response = self.client.get(
+            '/api/permissions/user-roles/user_permissions/', {'user_id': self.target.pk}
+        )
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_user_permissions_limited_to_scope(self):
+        UserRole.objects.create(user=self.viewer, role=self.role, department=self.department)
+        UserRole.objects.create(user=self.target, role=self.role, department=self.department)
+        UserRole.objects.create(user=self.outsider, role=self.role, department=self.other_department)
+
+        in_scope = self.client.get(
+            '/api/permissions/user-roles/user_permissions/', {'user_id': self.target.pk}
+        )
+        out_of_scope = self.client.get(
+            '/api/permissions/user-roles/user_permissions/', {'user_id': self.outsider.pk}
+        )
+
+        self.assertEqual(in_scope.status_code, 200)
+        self.assertEqual(out_of_scope.status_code, 403)
+
+    def test_check_permissions_batch_skips_users_out_of_scope(self):
+        UserRole.objects.create(user=self.viewer, role=self.role, department=self.department)
+        UserRole.objects.create(user=self.target, role=self.role, department=self.department)
+        UserRole.objects.create(user=self.outsider, role=self.role, department=self.other_department)
+
+        response = self.client.post('/api/permissions/user-roles/check_permissions_batch/', {
+            'user_ids': [self.target.pk, self.outsider.pk],
+            'permission_codes': ['users.roles.view.all'],
+        }, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['user_id'] for result in response.data['results']], [self.target.pk])
+        self.assertEqual(response.data['out_of_scope'], [self.outsider.pk])
+
+    def test_global_views_require_unrestricted_grant(self):
+        system_role = Role.objects.create(name='Sistema', code='sistema')
+        PermissionManager.bulk_assign_permissions_to_role(system_role, ['system.roles.view.all'])
+        assignment = UserRole.objects.create(user=self.viewer, role=system_role, department=self.department)
+
+        self.assertEqual(self.client.get('/api/permissions/roles/').status_code, 403)
+
+        assignment.department = None
+        assignment.save()
+
+        self.assertEqual(self.client.get('/api/permissions/roles/').status_code, 200)
+
+
+class AssignmentExpirySweeperTests(TestCase):
+    """Ventanas del barrido de vigencias: cada límite se aplica una sola vez"""
+
+    @classmethod
+    def setUpTestData(cls):
+        PermissionModule.objects.create(code='academic', name='Académico')
+        PermissionManager.generate_permissions({'academic': {'grades': ['view']}})
+        cls.role = Role.objects.create(name='Docente', code='docente')
+        cls.user = CustomUser.objects.create_user(email='docente@example.com', password='x')
+
+    def setUp(self):
+        self.start = timezone.now().replace(microsecond=0)
+        AssignmentExpirySweeper.sweep(now=self.start)
+
+    def at(self, minutes):
+        return self.start + timedelta(minutes=minutes)
+
+    def test_expiry_is_applied_after_valid_until(self):
+        UserRole.objects.create(user=self.user, role=self.role, is_temporary=True, valid_until=self.at(10))
+
+        # En valid_until la asignación sigue vigente: la aplica el barrido siguiente
+        self.assertEqual(AssignmentExpirySweeper.sweep(now=self.at(10))['users'], 0)
+        self.assertEqual(AssignmentExpirySweeper.sweep(now=self.at(20))['users'], 1)
+        self.assertEqual(AssignmentExpirySweeper.sweep(now=self.at(30))['users'], 0)
+
+    def test_activation_is_applied_at_valid_from(self):
+        UserRole.objects.create(user=self.user, role=self.role, is_temporary=True, valid_from=self.at(10))
+
+        self.assertEqual(AssignmentExpirySweeper.sweep(now=self.at(5))['users'], 0)
+        self.assertEqual(AssignmentExpirySweeper.sweep(now=self.at(10))['users'], 1)
+        self.assertEqual(AssignmentExpirySweeper.sweep(now=self.at(20))['users'], 0)
+
+    def test_boundary_before_watermark_is_not_applied_again(self):
+        UserRole.objects.create(user=self.user, role=self.role, is_temporary=True, valid_until=self.at(-5))
+
+        self.assertEqual(AssignmentExpirySweeper.sweep(now=self.at(10))['users'], 0)
+
+    def test_sweep_at_or_before_watermark_does_nothing(self):
+        UserRole.objects.create(user=self.user, role=self.role, is_temporary=True, valid_from=self.at(10))
+        AssignmentExpirySweeper.sweep(now=self.at(20))
+
+        result = AssignmentExpirySweeper.sweep(now=self.at(15))
+
+        self.assertEqual((result['users'], result['roles']), (0, 0))
+
+    def test_role_permission_expiry_invalidates_role_users(self):
+        UserRole.objects.create(user=self.user, role=self.role)
+        RolePermission.objects.create(
+            role=self.role,
+            permission=GranularPermission.objects.get(permission_code='academic.grades.view.all'),
+            is_temporary=True,
+            valid_until=self.at(10)
+        )
+        version = PermissionCache.get_user_version(self.user.pk)
+
+        result = AssignmentExpirySweeper.sweep(now=self.at(20))
+
+        self.assertEqual((result['roles'], result['users']), (1, 1))
+        self.assertNotEqual(PermissionCache.get_user_version(self.user.pk), version)
+
+
+class PermissionChangeTransactionTests(TestCase):
+    """El índice y el caché compartido solo reflejan cambios confirmados"""
+
+    @classmethod
+    def setUpTestData(cls):
+        PermissionModule.objects.create(code='academic', name='Académico')
+        PermissionManager.generate_permissions({'academic': {'grades': ['view']}})
+        cls.permission = GranularPermission.objects.get(permission_code='academic.grades.view.all')
+        cls.role = Role.objects.create(name='Docente', code='docente')
+        cls.user = CustomUser.objects.create_user(email='docente@example.com', password='x')
+        UserRole.objects.create(user=cls.user, role=cls.role)
+
+    def test_rolled_back_grant_is_not_kept(self):
+        version = PermissionCache.get_user_version(self.user.pk)
+
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            RolePermission.objects.create(role=self.role, permission=self.permission)
+            # La propia transacción ve su cambio
+            self.assertIn(self.permission.permission_code, PermissionCache.get_user_permission_codes(self.user.pk))
+            raise RuntimeError
+
+        self.assertNotIn(self.permission.permission_code, role_permission_index.get_codes(self.role.pk))
+        self.assertNotIn(self.permission.permission_code, PermissionCache.get_user_permission_codes(self.user.pk))
+        self.assertEqual(PermissionCache.get_user_version(self.user.pk), version)
+
+    def test_grant_is_applied_on_commit(self):
+        version = PermissionCache.get_user_version(self.user.pk)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            RolePermission.objects.create(role=self.role, permission=self.permission)
+        self.assertEqual(PermissionCache.get_user_version(self.user.pk), version)
+
+        for callback in callbacks:
+            callback()
+
+        self.assertNotEqual(PermissionCache.get_user_version(self.user.pk), version)
+        self.assertIn(self.permission.permission_code, PermissionCache.get_user_permission_codes(self.user.pk))
+
+
+class BulkApplyTemplateTests(TestCase):
+    """Asignación masiva de plantillas: solo cuentan las filas insertadas"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.department = Department.objects.create(name='Académico', code='ACA')
+        cls.role = Role.objects.create(name='Docente', code='docente')
+        cls.template = RoleTemplate.objects.create(name='Docentes', template_type='university')
+        TemplateRole.objects.create(template=cls.template, role=cls.role)
+        cls.users = [
+            CustomUser.objects.create_user(email=f'docente{i}@example.com', password='x') for i in range(3)
+        ]
+
+    def test_conflicting_rows_are_not_counted(self):
+        user_ids = [user.pk for user in self.users]
+        reserve_ids = UserRole.reserve_ids
+
+        def reserve_after_concurrent_insert(count):
+            # Otra transacción asigna el rol a un usuario entre la lectura y el INSERT
+            UserRole.objects.create(user=self.users[0], role=self.role, department=self.department)
+            return reserve_ids(count)
+
+        with mock.patch.object(UserRole, 'reserve_ids', side_effect=reserve_after_concurrent_insert):
+            result = RoleTemplateManager.bulk_apply_template(self.template, user_ids, department=self.department)
+
+        self.assertEqual(result, {'created': 2, 'existing': 1})
+        self.assertEqual(UserRole.objects.filter(department=self.department).count(), 3)
+        self.assertEqual(DepartmentHeadcount.objects.get(department=self.department).direct_roles, 3)
+
+    def test_reapplying_creates_nothing(self):
+        user_ids = [user.pk for user in self.users]
+        RoleTemplateManager.bulk_apply_template(self.template, user_ids, department=self.department)
+
+        result = RoleTemplateManager.bulk_apply_template(self.template, user_ids, department=self.department)
+
+        self.assertEqual(result, {'created': 0, 'existing': 3})
+        self.assertEqual(DepartmentHeadcount.objects.get(department=self.department).direct_roles, 3)
+
+    def test_global_role_is_unique_per_user(self):
+        UserRole.objects.create(user=self.users[0], role=self.role)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            UserRole.objects.create(user=self.users[0], role=self.role)
+
+        result = RoleTemplateManager.bulk_apply_template(self.template, [self.users[0].pk, self.users[1].pk])
+        self.assertEqual(result['created'], 1)
+        self.assertEqual(UserRole.objects.filter(role=self.role, department__isnull=True).count(), 2)
+
+
+class BitIndexAllocationTests(TestCase):
+    """bit_index se asigna bajo un lock de transacción y sin repetir posiciones"""
+
+    @classmethod
+    def setUpTestData(cls):
+        PermissionModule.objects.create(code='academic', name='Académico')
+
+    def test_allocation_holds_lock_until_commit(self):
+        PermissionManager.generate_permissions({'academic': {'grades': ['view']}})
+
+        # Otra conexión no puede tomar el lock mientras la transacción siga abierta
+        other = connection.get_new_connection(connection.get_connection_params())
+        try:
+            with other.cursor() as cursor:
+                cursor.execute(
+                    "SELECT pg_try_advisory_lock(hashtext(%s))", [GranularPermission.BIT_INDEX_LOCK]
+                )
+                self.assertFalse(cursor.fetchone()[0])
+        finally:
+            other.close()
+
+    def test_generated_and_saved_permissions_get_distinct_indexes(self):
+        PermissionManager.generate_permissions({'academic': {'grades': ['view', 'edit']}})
+        GranularPermission.objects.create(
+            module=PermissionModule.objects.get(code='academic'), functionality='Notas',
+            functionality_code='notes', action='view', scope='all'
+        )
+
+        indexes = list(GranularPermission.objects.values_list('bit_index', flat=True))
+        self.assertEqual(sorted(indexes), list(range(len(indexes))))
+
+    def test_invalid_entries_are_logged(self):
+        with self.assertLogs('core_permissions.utils', 'WARNING') as logs:
+            result = PermissionManager.generate_permissions({'academic': {'Bad-Code': ['view']}})
+
+        self.assertEqual(len(result['errors']), 1)
+        self.assertIn('academic.Bad-Code', logs.output[0])
@@ -19,6 +19,7 @@ urlpatterns = [
     
     # URLs para acciones específicas
     path('check-permission/', views.UserRoleViewSet.as_view({'post': 'check_permission'}), name='check-permission'),
+    path('check-permissions-batch/', views.UserRoleViewSet.as_view({'post': 'check_permissions_batch'}), name='check-permissions-batch'),
     path('user-permissions/', views.UserRoleViewSet.as_view({'get': 'user_permissions'}), name='user-permissions'),
     path('assign-role/', views.UserRoleViewSet.as_view({'post': 'assign_role'}), name='assign-role'),
 ]
@@ -1,20 +1,34 @@
-from django.core.exceptions import ValidationError
+import logging
+import re
+import threading
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
 from django.db import transaction, models  # 🔥 IMPORTAR models
 from django.utils import timezone
+from datetime import timedelta
 from django.contrib.contenttypes.models import ContentType  # 🔥 IMPORTAR ContentType
 from django.contrib.auth.models import Permission as AuthPermission
 from core_users.models import CustomUser
-from core_organization.models import Department, Location  # ✅ MODELOS REALES
+from core_organization.models import Department, DepartmentHeadcount, Location  # ✅ MODELOS REALES
 from .models import (
-    GranularPermission, Role, UserRole, RoleTemplate, 
-    PermissionModule, TemplateRole
+    GranularPermission, Role, RoleClosure, RolePermission, UserRole, RoleTemplate, 
+    PermissionModule, TemplateRole, RoleTemplateJob
 )
 
+logger = logging.getLogger(__name__)
+
+
 class PermissionManager:
     """
     Utilidades para gestión masiva de permisos
     """
     
+    DEFAULT_SCOPES = ['all', 'department', 'own']
+    DANGEROUS_ACTIONS = ['delete', 'approve', 'reject']
+    FUNCTIONALITY_CODE_RE = re.compile(r'^[a-z][a-z0-9_]*$')
+    
     @classmethod
     def create_module_permissions(cls, module_code, functionalities_actions):
         """
@@ -26,87 +40,226 @@ class PermissionManager:
                 'functionality_code': ['view', 'create', 'edit', ...],
                 ...
             }
+        
+        Returns:
+            list: Permisos del módulo creados, actualizados o ya existentes
         """
-        try:
-            module = PermissionModule.objects.get(code=module_code)
-        except PermissionModule.DoesNotExist:
-            raise ValueError(f"Módulo '{module_code}' no existe")
+        return cls.generate_permissions({module_code: functionalities_actions})['permissions']
+    
+    @classmethod
+    def generate_permissions(cls, catalog, scopes=None, batch_size=1000):
+        """
+        Genera (upsert) los permisos de un catálogo completo en pocas sentencias
         
-        created_permissions = []
+        Valida y calcula códigos y nombres en memoria, lee los permisos
+        existentes con una sola consulta y escribe solo los nuevos o
+        modificados con bulk_create(update_conflicts=True) sobre permission_code.
         
-        with transaction.atomic():
+        Args:
+            catalog (dict): {module_code: {functionality_code: [actions]}}
+            scopes (list): Alcances a generar (por defecto all, department, own)
+        
+        Returns:
+            dict: created, updated, unchanged, errors y permissions
+        """
+        scopes = scopes or cls.DEFAULT_SCOPES
+        modules = {module.code: module for module in PermissionModule.objects.filter(code__in=catalog)}
+        missing_modules = [code for code in catalog if code not in modules]
+        if missing_modules:
+            raise ValueError(f"Módulo '{missing_modules[0]}' no existe")
+        
+        action_labels = dict(GranularPermission.ACTION_CHOICES)
+        scope_labels = dict(GranularPermission.SCOPE_CHOICES)
+        desired = {}
+        errors = []
+        
+        for module_code, functionalities_actions in catalog.items():
+            module = modules[module_code]
             for func_code, actions in functionalities_actions.items():
+                if not cls.FUNCTIONALITY_CODE_RE.match(func_code):
+                    errors.append({'permission': f"{module_code}.{func_code}", 'error': 'functionality_code inválido'})
+                    continue
                 functionality = func_code.replace('_', ' ').title()
                 
                 for action in actions:
-                    for scope in ['all', 'department', 'own']:
-                        try:
-                            # 🔥 CREAR INSTANCIA PRIMERO Y LUEGO GUARDAR
-                            permission = GranularPermission(
-                                module=module,
-                                functionality=functionality,
-                                functionality_code=func_code,
-                                action=action,
-                                scope=scope
-                            )
-                            
-                            # 🔥 FORZAR LA GENERACIÓN DEL NOMBRE Y CÓDIGO
-                            if not permission.name:
-                                permission.name = f"{module.name} - {functionality} - {dict(permission.ACTION_CHOICES)[action]} - {dict(permission.SCOPE_CHOICES)[scope]}"
-                            
-                            if not permission.permission_code:
-                                permission.permission_code = f"{module.code}.{func_code}.{action}.{scope}"
-                            
-                            # 🔥 MARCAR ACCIONES PELIGROSAS AUTOMÁTICAMENTE
-                            if action in ['delete', 'approve', 'reject']:
-                                permission.is_dangerous = True
-                            
-                            permission.save()
-                            created_permissions.append(permission)
-                            created_permissions.append(permission)
-
-                        except ValidationError as e:
-                            print(f"Error creando permiso {func_code}.{action}.{scope}: {e}")
-
-                        except Exception as e:
-                            print(f"❌ Error inesperado con {func_code}.{action}.{scope}: {e}")
+                    for scope in scopes:
+                        code = f"{module.code}.{func_code}.{action}.{scope}"
+                        if action not in action_labels or scope not in scope_labels:
+                            errors.append({'permission': code, 'error': 'Acción o alcance no válido'})
+                            continue
+                        desired[code] = GranularPermission(
+                            module=module,
+                            functionality=functionality,
+                            functionality_code=func_code,
+                            action=action,
+                            scope=scope,
+                            name=f"{module.name} - {functionality} - {action_labels[action]} - {scope_labels[scope]}",
+                            is_dangerous=action in cls.DANGEROUS_ACTIONS,
+                            permission_code=code
+                        )
+        
+        compared_fields = ['module_id', 'functionality', 'functionality_code', 'action', 'scope', 'name', 'is_dangerous']
+        created, updated, unchanged = [], [], []
+        to_write = []
+        
+        with transaction.atomic():
+            # Con el lock tomado, los existentes incluyen lo que otro proceso
+            # acaba de confirmar y las posiciones nuevas no se repiten
+            next_bit_index = GranularPermission.next_bit_index()
+            existing = {
+                row['permission_code']: row
+                for row in GranularPermission.objects.filter(
+                    permission_code__in=list(desired)
+                ).values('permission_code', 'bit_index', *compared_fields)
+            }
+            
+            for code, permission in desired.items():
+                current = existing.get(code)
+                if current is None:
+                    permission.bit_index = next_bit_index
+                    next_bit_index += 1
+                    created.append(code)
+                elif any(str(getattr(permission, field)) != str(current[field]) for field in compared_fields):
+                    permission.bit_index = current['bit_index']
+                    updated.append(code)
+                else:
+                    unchanged.append(code)
+                    continue
+                to_write.append(permission)
+            
+            GranularPermission.objects.bulk_create(
+                to_write,
+                batch_size=batch_size,
+                update_conflicts=True,
+                unique_fields=['permission_code'],
+                update_fields=['module', 'functionality', 'functionality_code', 'action', 'scope',
+                               'name', 'is_dangerous', 'updated_at']
+            )
+            
+            if created:
+                from .bitsets import permission_slots
+                transaction.on_commit(permission_slots.invalidate)
         
-        return created_permissions
+        for error in errors:
+            logger.warning("Error creando permiso %s: %s", error['permission'], error['error'])
+        
+        return {
+            'created': len(created),
+            'updated': len(updated),
+            'unchanged': len(unchanged),
+            'errors': errors,
+            'permissions': list(GranularPermission.objects.filter(permission_code__in=list(desired)))
+        }
     
     @classmethod
     def bulk_assign_permissions_to_role(cls, role, permission_codes, assigned_by=None):
         """
         Asigna múltiples permisos a un rol
         
+        Calcula la diferencia contra los RolePermission existentes e inserta
+        los faltantes con un solo bulk_create. Genera un único registro de
+        auditoría y una única invalidación de índice/caché por llamada.
+        
         Args:
             role: Instancia de Role
             permission_codes (list): Lista de códigos de permisos
             assigned_by: Usuario que realiza la asignación
         """
-        permissions = GranularPermission.objects.filter(
-            permission_code__in=permission_codes
+        requested = list(dict.fromkeys(permission_codes))
+        permission_ids = dict(
+            GranularPermission.objects.filter(
+                permission_code__in=requested
+            ).values_list('permission_code', 'id')
         )
         
-        assigned = []
-        failed = []
-        
         with transaction.atomic():
-            for permission in permissions:
-                try:
-                    role.permissions.add(permission)
-                    assigned.append(permission.permission_code)
-                except Exception as e:
-                    failed.append({
-                        'permission': permission.permission_code,
-                        'error': str(e)
-                    })
+            # Serializar asignaciones concurrentes al mismo rol
+            Role.objects.select_for_update().filter(pk=role.pk).first()
+            
+            existing = set(
+                RolePermission.objects.filter(
+                    role=role,
+                    department_filter__isnull=True,
+                    permission_id__in=permission_ids.values()
+                ).values_list('permission_id', flat=True)
+            )
+            assigned = [code for code in requested if code in permission_ids and permission_ids[code] not in existing]
+            
+            RolePermission.objects.bulk_create(
+                [
+                    RolePermission(role=role, permission_id=permission_ids[code], assigned_by=assigned_by)
+                    for code in assigned
+                ],
+                batch_size=1000,
+                ignore_conflicts=True
+            )
+            
+            if assigned:
+                cls._role_permissions_bulk_changed(role, 'permission_assigned', assigned, assigned_by)
         
         return {
             'assigned': assigned,
-            'failed': failed,
+            'already_assigned': [code for code in requested if code in permission_ids and permission_ids[code] in existing],
+            'not_found': [code for code in requested if code not in permission_ids],
+            'failed': [],
             'total_assigned': len(assigned)
         }
     
+    @classmethod
+    def bulk_revoke_permissions_from_role(cls, role, permission_codes, revoked_by=None):
+        """
+        Revoca múltiples permisos de un rol con un único QuerySet.delete()
+        
+        Args:
+            role: Instancia de Role
+            permission_codes (list): Lista de códigos de permisos
+            revoked_by: Usuario que realiza la revocación
+        """
+        from core_audit.signals import model_audit_suppressed
+        from .signals import role_permission_signals_suppressed
+        
+        requested = list(dict.fromkeys(permission_codes))
+        
+        with transaction.atomic():
+            role_permissions = RolePermission.objects.filter(
+                role=role,
+                permission__permission_code__in=requested
+            )
+            revoked = list(
+                role_permissions.values_list('permission__permission_code', flat=True).distinct()
+            )
+            
+            if revoked:
+                # La auditoría y la invalidación se emiten una vez, no por fila
+                with role_permission_signals_suppressed(), model_audit_suppressed():
+                    role_permissions.delete()
+                cls._role_permissions_bulk_changed(role, 'permission_revoked', revoked, revoked_by)
+        
+        return {
+            'revoked': revoked,
+            'not_assigned': [code for code in requested if code not in revoked],
+            'total_revoked': len(revoked)
+        }
+    
+    @staticmethod
+    def _role_permissions_bulk_changed(role, action_type, permission_codes, user=None):
+        """Una invalidación de índice/caché y un registro de auditoría agregado"""
+        from core_audit.signals import create_audit_log
+        from .signals import role_permissions_changed
+        
+        role_permissions_changed([role.pk])
+        
+        verb = 'assigned to' if action_type == 'permission_assigned' else 'revoked from'
+        create_audit_log(
+            action_type=action_type,
+            action_category='permission_management',
+            description=f"{len(permission_codes)} permissions {verb} role {role.name}"
+                        + (f" by {user.email}" if user else ''),
+            new_values={'permission_codes': permission_codes, 'count': len(permission_codes)},
+            content_object=role,
+            severity='medium'
+        )
+    
     @classmethod
     def sync_user_permissions(cls, user, department=None):
         """
@@ -116,44 +269,103 @@ class PermissionManager:
             user: Instancia de CustomUser
             department: Departamento para filtros (opcional)
         """
-        user_roles = UserRole.objects.filter(
-            user=user
-        ).select_related('role')
-        
-        if department:
-            user_roles = user_roles.filter(
-                models.Q(department=department) | models.Q(department__isnull=True)
-            )
-        
-        all_permissions = set()
+        result = cls.sync_users_permissions([user.pk], department)
+        return {
+            'total_permissions': result['total_permissions'],
+            'auth_permissions': result['total_permissions'],
+            'added': result['added'],
+            'removed': result['removed']
+        }
+    
+    @classmethod
+    def sync_users_permissions(cls, user_ids, department=None):
+        """
+        Sincroniza en bloque los permisos efectivos de varios usuarios con
+        user.user_permissions (Permission de django.contrib.auth)
         
-        for user_role in user_roles:
-            if user_role.is_active:  # 🔥 USAR LA PROPERTY is_active
-                role_permissions = user_role.role.get_all_permissions()
-                all_permissions.update(role_permissions)
+        Crea los Permission faltantes con un solo bulk_create y aplica la
+        diferencia de la tabla M2M de todos los usuarios a la vez. Solo se
+        tocan los Permission de GranularPermission; los permisos de Django
+        asignados a mano se conservan.
         
-        # Convertir a formato para el sistema de permisos de Django
-        auth_permissions = []
-        content_type = ContentType.objects.get_for_model(GranularPermission)  # 🔥 DEFINIR content_type
+        Args:
+            user_ids (list): IDs de CustomUser
+            department: Departamento para filtros (opcional)
+        """
+        user_ids = list(dict.fromkeys(user_ids))
+        user_codes = PermissionCache.get_many_user_permission_codes(
+            user_ids, department.id if department else None
+        )
+        all_codes = set().union(*user_codes.values()) if user_codes else set()
+        content_type = ContentType.objects.get_for_model(GranularPermission)
         
-        for perm in all_permissions:
-            # Crear o obtener el permiso de Django
-            auth_perm, created = AuthPermission.objects.get_or_create(
-                codename=perm.permission_code,
-                content_type=content_type,  # 🔥 USAR content_type definido
-                defaults={
-                    'name': perm.name,
-                }
+        with transaction.atomic():
+            auth_ids, created = cls._ensure_auth_permissions(all_codes, content_type)
+            
+            through = CustomUser.user_permissions.through
+            desired = {
+                (user_id, auth_ids[code])
+                for user_id, codes in user_codes.items()
+                for code in codes
+            }
+            current = {
+                (user_id, permission_id): pk
+                for pk, user_id, permission_id in through.objects.filter(
+                    customuser_id__in=user_ids,
+                    permission__content_type=content_type
+                ).values_list('pk', 'customuser_id', 'permission_id')
+            }
+            
+            to_add = desired - current.keys()
+            to_remove = [pk for pair, pk in current.items() if pair not in desired]
+            
+            through.objects.bulk_create(
+                [through(customuser_id=user_id, permission_id=permission_id) for user_id, permission_id in to_add],
+                batch_size=1000,
+                ignore_conflicts=True
             )
-            auth_permissions.append(auth_perm)
-        
-        # Asignar permisos al usuario
-        user.user_permissions.set(auth_permissions)
+            if to_remove:
+                through.objects.filter(pk__in=to_remove).delete()
         
         return {
-            'total_permissions': len(all_permissions),
-            'auth_permissions': len(auth_permissions)
+            'users': len(user_ids),
+            'total_permissions': len(desired),
+            'auth_permissions_created': created,
+            'added': len(to_add),
+            'removed': len(to_remove)
         }
+    
+    @staticmethod
+    def _ensure_auth_permissions(codes, content_type):
+        """{permission_code: Permission.id}, creando los faltantes en bloque"""
+        auth_ids = dict(
+            AuthPermission.objects.filter(
+                content_type=content_type, codename__in=codes
+            ).values_list('codename', 'id')
+        )
+        missing = codes - auth_ids.keys()
+        if not missing:
+            return auth_ids, 0
+        
+        names = dict(
+            GranularPermission.objects.filter(
+                permission_code__in=missing
+            ).values_list('permission_code', 'name')
+        )
+        AuthPermission.objects.bulk_create(
+            [
+                AuthPermission(codename=code, content_type=content_type, name=names.get(code, code)[:255])
+                for code in missing
+            ],
+            batch_size=1000,
+            ignore_conflicts=True
+        )
+        auth_ids.update(
+            AuthPermission.objects.filter(
+                content_type=content_type, codename__in=missing
+            ).values_list('codename', 'id')
+        )
+        return auth_ids, len(missing)
 
 
 class RoleTemplateManager:
@@ -201,111 +413,537 @@ class RoleTemplateManager:
         """
         Aplica una plantilla a múltiples usuarios
         """
-        results = {
-            'success': [],
+        users = list(users)
+        cls.bulk_apply_template(template, [user.pk for user in users], assigned_by, department)
+        return {
+            'success': [user.email for user in users],
             'failed': []
         }
+    
+    @classmethod
+    def bulk_apply_template(cls, template, user_ids, assigned_by=None, department=None, template_roles=None):
+        """
+        Asigna los roles de la plantilla a un conjunto de usuarios
+        
+        Lee los roles de la plantilla una vez (o usa template_roles ya
+        cargados), calcula los UserRole faltantes de todo el conjunto con una
+        consulta y los inserta con bulk_create(ignore_conflicts=True). Las
+        asignaciones existentes no se modifican. Las filas llevan ids
+        reservados de la secuencia: las que otra transacción insertó antes se
+        omiten y no cuentan en created ni en DepartmentHeadcount.
+        
+        Returns:
+            dict: created (filas nuevas) y existing (ya asignadas)
+        """
+        if template_roles is None:
+            template_roles = list(template.templaterole_set.all())
+        user_ids = list(dict.fromkeys(user_ids))
+        if not template_roles or not user_ids:
+            return {'created': 0, 'existing': 0}
+        
+        role_ids = [template_role.role_id for template_role in template_roles]
+        department_id = department.pk if department else None
+        now = timezone.now()
+        
+        with transaction.atomic():
+            existing = set(
+                UserRole.objects.filter(
+                    user_id__in=user_ids,
+                    role_id__in=role_ids,
+                    department_id=department_id
+                ).values_list('user_id', 'role_id')
+            )
+            
+            new_assignments = []
+            for template_role in template_roles:
+                is_temporary = template_role.is_temporary and bool(template_role.valid_days)
+                valid_until = now + timedelta(days=template_role.valid_days) if is_temporary else None
+                for user_id in user_ids:
+                    if (user_id, template_role.role_id) in existing:
+                        continue
+                    new_assignments.append(UserRole(
+                        user_id=user_id,
+                        role_id=template_role.role_id,
+                        department_id=department_id,
+                        is_temporary=is_temporary,
+                        valid_from=now if is_temporary else None,
+                        valid_until=valid_until,
+                        assigned_by=assigned_by,
+                        notes=f"Plantilla: {template.name}"
+                    ))
+            
+            for assignment, pk in zip(new_assignments, UserRole.reserve_ids(len(new_assignments))):
+                assignment.pk = pk
+            UserRole.objects.bulk_create(new_assignments, batch_size=1000, ignore_conflicts=True)
+            
+            # Filas realmente insertadas (los conflictos se omiten sin error)
+            inserted_users = list(UserRole.objects.filter(
+                pk__in=[assignment.pk for assignment in new_assignments]
+            ).values_list('user_id', flat=True)) if new_assignments else []
+            created = len(inserted_users)
+            
+            # bulk_create no emite post_save: actualizar el conteo materializado
+            DepartmentHeadcount.apply_delta(department_id, roles=created)
+            
+            if created:
+                from core_audit.signals import create_audit_log
+                
+                affected_users = set(inserted_users)
+                transaction.on_commit(lambda: PermissionCache.invalidate_users(affected_users))
+                create_audit_log(
+                    action_type='user_role_assigned',
+                    action_category='permission_management',
+                    description=f"Template {template.name} applied: {created} roles assigned to {len(affected_users)} users",
+                    new_values={'template_id': template.pk, 'users': len(affected_users), 'assignments': created},
+                    content_object=template,
+                    severity='medium'
+                )
+        
+        return {'created': created, 'existing': len(new_assignments) - created + len(existing)}
+    
+    @classmethod
+    def start_template_job(cls, template, user_ids, assigned_by=None, department=None, chunk_size=500):
+        """Crear un RoleTemplateJob y encolar su ejecución en Celery"""
+        user_ids = list(dict.fromkeys(user_ids))
+        job = RoleTemplateJob.objects.create(
+            template=template,
+            department=department,
+            assigned_by=assigned_by,
+            user_ids=user_ids,
+            chunk_size=chunk_size,
+            total_users=len(user_ids)
+        )
+        cls.enqueue_template_job(job)
+        return job
+    
+    @staticmethod
+    def enqueue_template_job(job):
+        """Encolar (o reanudar) un job tras confirmar la transacción"""
+        from .tasks import apply_role_template_job
+        
+        def enqueue():
+            task = apply_role_template_job.delay(job.pk)
+            RoleTemplateJob.objects.filter(pk=job.pk).update(task_id=task.id)
+        transaction.on_commit(enqueue)
+    
+    @classmethod
+    def run_template_job(cls, job, progress_callback=None):
+        """
+        Procesar los lotes pendientes de un job. Cada lote y el avance de
+        processed_users se confirman juntos, por lo que es reanudable.
+        """
+        template_roles = list(job.template.templaterole_set.all())
+        RoleTemplateJob.objects.filter(pk=job.pk).update(
+            status='running', started_at=job.started_at or timezone.now(), error_message=''
+        )
+        
+        processed = job.processed_users
+        created = job.created_assignments
+        while processed < job.total_users:
+            chunk = job.user_ids[processed:processed + job.chunk_size]
+            with transaction.atomic():
+                result = cls.bulk_apply_template(
+                    job.template, chunk, job.assigned_by, job.department, template_roles
+                )
+                processed += len(chunk)
+                created += result['created']
+                RoleTemplateJob.objects.filter(pk=job.pk).update(
+                    processed_users=processed, created_assignments=created
+                )
+            if progress_callback:
+                progress_callback(processed, job.total_users, created)
         
-        for user in users:
-            try:
-                template.apply_to_user(user, assigned_by, department)
-                results['success'].append(user.email)
-            except Exception as e:
-                results['failed'].append({
-                    'user': user.email,
-                    'error': str(e)
-                })
-        
-        return results
+        RoleTemplateJob.objects.filter(pk=job.pk).update(status='completed', finished_at=timezone.now())
+        job.refresh_from_db()
+        return job
 
 
 class PermissionCache:
     """
-    Sistema de caché para permisos frecuentes
+    Caché de permisos compartido entre procesos (API de caché de Django)
+
+    Las entradas (códigos de permiso por usuario/departamento y por rol)
+    expiran a los PERMISSION_CACHE_TIMEOUT segundos y sus claves llevan
+    versión: invalidar un usuario o un rol solo cambia su versión (y la de
+    los usuarios con ese rol), nunca hay que buscar ni borrar claves. Las
+    señales de core_permissions invalidan al guardar/eliminar UserRole,
+    RolePermission y Role.
+
+    Usa el caché settings.PERMISSION_CACHE_ALIAS ('default' si no existe);
+    solo es compartido entre procesos si ese alias es Redis (CACHE_REDIS_URL).
+    Si el backend falla (p.ej. Redis caído) se usa un LocMemCache del proceso
+    y el backend se reintenta tras PERMISSION_CACHE_RETRY_BACKOFF segundos
+    (duplicándose en cada fallo, hasta 300).
     """
-    _user_permissions_cache = {}
-    _role_permissions_cache = {}
+    GLOBAL_VERSION_KEY = 'core_permissions:version'
+    USER_VERSION_KEY = 'core_permissions:user:{user_id}:version'
+    ROLE_VERSION_KEY = 'core_permissions:role:{role_id}:version'
+    USER_KEY = 'core_permissions:user:{user_id}:{version}:dept:{department_id}'
+    ROLE_KEY = 'core_permissions:role:{role_id}:{version}'
+    SCOPE_KEY = 'core_permissions:user:{user_id}:{version}:scopes:{permission}'
+    
+    MAX_RETRY_BACKOFF = 300
+    
+    _fallback_cache = None
+    _retry_at = 0.0
+    _backoff = 0.0
+    _stats = {'hits': 0, 'misses': 0}
+    _stats_lock = threading.Lock()
     
     @classmethod
-    def get_user_permissions(cls, user_id, department_id=None):
+    def get_cache(cls):
+        if cls._fallback_cache is not None and time.monotonic() < cls._retry_at:
+            return cls._fallback_cache
+        alias = getattr(settings, 'PERMISSION_CACHE_ALIAS', 'default')
+        return caches[alias if alias in settings.CACHES else 'default']
+    
+    @classmethod
+    def get_timeout(cls):
+        return getattr(settings, 'PERMISSION_CACHE_TIMEOUT', 300)
+    
+    @classmethod
+    def get_user_permission_codes(cls, user_id, department_id=None):
         """
-        Obtiene permisos de usuario desde caché o base de datos
+        Obtiene los códigos de permiso del usuario (frozenset) desde caché o base de datos
         """
-        cache_key = f"user_{user_id}_dept_{department_id}"
+        if cls._has_pending_changes():
+            return cls._load_user_permission_codes([user_id], department_id)[user_id]
+        
+        cache_key = cls.USER_KEY.format(
+            user_id=user_id,
+            version=cls.get_user_version(user_id),
+            department_id=department_id
+        )
         
-        if cache_key in cls._user_permissions_cache:
-            return cls._user_permissions_cache[cache_key]
+        codes = cls._cache_call('get', cache_key)
+        if codes is not None:
+            cls._count('hits')
+            return frozenset(codes)
+        cls._count('misses')
         
         # Obtener de base de datos
-        user_roles = UserRole.objects.filter(
-            user_id=user_id
-        ).select_related('role', 'department')
+        codes = cls._load_user_permission_codes([user_id], department_id)[user_id]
+        cls._cache_call('set', cache_key, tuple(codes), cls.get_timeout())
+        
+        return codes
+    
+    @classmethod
+    def get_many_user_permission_codes(cls, user_ids, department_id=None):
+        """
+        Códigos de permiso de varios usuarios en una sola pasada:
+        {user_id: frozenset}. Versiones y entradas se leen con get_many y los
+        usuarios sin caché se resuelven con una única consulta de UserRole.
+        """
+        user_ids = list(dict.fromkeys(user_ids))
+        if cls._has_pending_changes():
+            return cls._load_user_permission_codes(user_ids, department_id)
+        
+        version_keys = {user_id: cls.USER_VERSION_KEY.format(user_id=user_id) for user_id in user_ids}
+        versions = cls._get_versions([cls.GLOBAL_VERSION_KEY, *version_keys.values()])
+        cache_keys = {
+            user_id: cls.USER_KEY.format(
+                user_id=user_id,
+                version=f"{versions[cls.GLOBAL_VERSION_KEY]}.{versions[version_keys[user_id]]}",
+                department_id=department_id
+            )
+            for user_id in user_ids
+        }
+        
+        cached = cls._cache_call('get_many', list(cache_keys.values())) or {}
+        result = {}
+        missing = []
+        for user_id, cache_key in cache_keys.items():
+            if cache_key in cached:
+                result[user_id] = frozenset(cached[cache_key])
+            else:
+                missing.append(user_id)
+        cls._count('hits', len(result))
+        cls._count('misses', len(missing))
+        
+        if missing:
+            loaded = cls._load_user_permission_codes(missing, department_id)
+            cls._cache_call('set_many', {
+                cache_keys[user_id]: tuple(codes) for user_id, codes in loaded.items()
+            }, cls.get_timeout())
+            result.update(loaded)
+        
+        return result
+    
+    @classmethod
+    def _load_user_permission_codes(cls, user_ids, department_id=None):
+        """
+        Resolver desde la base de datos (roles activos + índice aplanado de
+        roles). Con department_id cuentan los roles globales y los asignados
+        al departamento o a uno de sus ancestros (intervalos MPTT)
+        """
+        from .index import role_permission_index
+        from .scopes import ancestors_q, get_department_interval
+        
+        user_roles = UserRole.objects.active_now().filter(user_id__in=user_ids)
         
         if department_id:
+            interval = get_department_interval(department_id)
             user_roles = user_roles.filter(
-                models.Q(department_id=department_id) | models.Q(department__isnull=True)
+                ancestors_q(interval) if interval else models.Q(department__isnull=True)
             )
         
-        permissions = set()
-        for user_role in user_roles:
-            if user_role.is_active:  # 🔥 USAR LA PROPERTY is_active
-                role_perms = cls.get_role_permissions(user_role.role_id)
-                permissions.update(role_perms)
+        codes = {user_id: set() for user_id in user_ids}
+        for user_id, role_id in user_roles.values_list('user_id', 'role_id'):
+            codes[user_id].update(role_permission_index.get_codes(role_id))
+        
+        return {user_id: frozenset(user_codes) for user_id, user_codes in codes.items()}
+    
+    @classmethod
+    def get_user_scope_grants(cls, user_id, permission):
+        """
+        Concesiones del permiso 'módulo.funcionalidad.acción' (o de un código
+        completo) para el usuario: tupla de (scope, UserRole.department_id,
+        RolePermission.department_filter_id), con herencia de roles y
+        vigencias resueltas. Ver scopes.DepartmentScopeEngine
+        """
+        if cls._has_pending_changes():
+            return cls._load_user_scope_grants(user_id, permission)
         
-        # Guardar en caché por 5 minutos
-        cls._user_permissions_cache[cache_key] = permissions
+        cache_key = cls.SCOPE_KEY.format(
+            user_id=user_id,
+            version=cls.get_user_version(user_id),
+            permission=permission
+        )
+        grants = cls._cache_call('get', cache_key)
+        if grants is not None:
+            cls._count('hits')
+            return grants
+        cls._count('misses')
         
-        return permissions
+        grants = cls._load_user_scope_grants(user_id, permission)
+        cls._cache_call('set', cache_key, grants, cls.get_timeout())
+        return grants
     
     @classmethod
-    def get_role_permissions(cls, role_id):
+    def _load_user_scope_grants(cls, user_id, permission):
+        from .scopes import DepartmentScopeEngine
+        
+        grants = ()
+        base, only_scope = DepartmentScopeEngine.split_permission(permission)
+        parts = base.split('.')
+        user_roles = list(
+            UserRole.objects.active_now().filter(user_id=user_id).values_list('role_id', 'department_id')
+        ) if len(parts) == 3 else []
+        
+        if user_roles:
+            module_code, functionality_code, action = parts
+            departments_by_role = {}
+            for role_id, department_id in user_roles:
+                departments_by_role.setdefault(role_id, []).append(department_id)
+            
+            # Permisos del rol y de sus ancestros (RoleClosure) para esa acción
+            role_permissions = RolePermission.objects.active_now().filter(
+                role__descendant_links__descendant_id__in=list(departments_by_role),
+                permission__module__code=module_code,
+                permission__functionality_code=functionality_code,
+                permission__action=action,
+            )
+            if only_scope:
+                role_permissions = role_permissions.filter(permission__scope=only_scope)
+            
+            grants = tuple(sorted({
+                (scope, department_id, filter_id)
+                for role_id, scope, filter_id in role_permissions.values_list(
+                    'role__descendant_links__descendant_id', 'permission__scope', 'department_filter_id'
+                )
+                for department_id in departments_by_role[role_id]
+            }, key=str))
+        
+        return grants
+    
+    @classmethod
+    def get_user_version(cls, user_id):
+        """Versión actual de los permisos del usuario ('global.usuario')"""
+        user_version_key = cls.USER_VERSION_KEY.format(user_id=user_id)
+        versions = cls._get_versions([cls.GLOBAL_VERSION_KEY, user_version_key])
+        return f"{versions[cls.GLOBAL_VERSION_KEY]}.{versions[user_version_key]}"
+    
+    @classmethod
+    def get_user_permission_vector(cls, user_id, department_id=None):
         """
-        Obtiene permisos de rol desde caché o base de datos
+        Permisos efectivos del usuario como PermissionVector (roles, herencia,
+        departamento y vigencia de roles temporales ya resueltos)
         """
-        if role_id in cls._role_permissions_cache:
-            return cls._role_permissions_cache[role_id]
+        from .bitsets import PermissionVector, permission_slots
         
-        # Obtener de base de datos
-        try:
-            role = Role.objects.get(id=role_id)
-            permissions = role.get_all_permissions()
-            cls._role_permissions_cache[role_id] = permissions
-            return permissions
-        except Role.DoesNotExist:
+        codes = cls.get_user_permission_codes(user_id, department_id)
+        return PermissionVector(
+            permission_slots.mask(codes),
+            cls._vector_version(user_id, department_id)
+        )
+    
+    @classmethod
+    def is_vector_current(cls, vector, user_id, department_id=None):
+        """False si el vector (p.ej. el de un JWT) se construyó con permisos ya cambiados"""
+        return vector is not None and vector.version == cls._vector_version(user_id, department_id)
+    
+    @classmethod
+    def _vector_version(cls, user_id, department_id):
+        from .bitsets import permission_slots
+        return f"{permission_slots.get_version()}.{cls.get_user_version(user_id)}.{department_id or 0}"
+    
+    @classmethod
+    def get_user_permissions(cls, user_id, department_id=None):
+        """
+        Obtiene permisos de usuario (instancias de GranularPermission)
+        """
+        codes = cls.get_user_permission_codes(user_id, department_id)
+        if not codes:
             return set()
+        return set(GranularPermission.objects.filter(permission_code__in=codes))
+    
+    @classmethod
+    def get_role_permission_codes(cls, role_id):
+        """
+        Obtiene los códigos de permiso del rol, incluyendo herencia (frozenset)
+        """
+        from .index import role_permission_index
+        
+        if cls._has_pending_changes():
+            return role_permission_index.get_codes(role_id)
+        
+        role_version_key = cls.ROLE_VERSION_KEY.format(role_id=role_id)
+        versions = cls._get_versions([cls.GLOBAL_VERSION_KEY, role_version_key])
+        cache_key = cls.ROLE_KEY.format(
+            role_id=role_id,
+            version=f"{versions[cls.GLOBAL_VERSION_KEY]}.{versions[role_version_key]}"
+        )
+        
+        codes = cls._cache_call('get', cache_key)
+        if codes is not None:
+            cls._count('hits')
+            return frozenset(codes)
+        cls._count('misses')
+        
+        codes = role_permission_index.get_codes(role_id)
+        cls._cache_call('set', cache_key, tuple(codes), cls.get_timeout())
+        return codes
+    
+    @classmethod
+    def get_role_permissions(cls, role_id):
+        """
+        Obtiene permisos de rol con herencia (instancias de GranularPermission),
+        un solo join sobre la tabla de cierre
+        """
+        return set(RoleClosure.permissions_for_roles([role_id]))
     
     @classmethod
     def invalidate_user_cache(cls, user_id=None, department_id=None):
         """
-        Invalida caché de permisos de usuario
+        Invalida caché de permisos de usuario (todos sus departamentos).
+        Sin user_id invalida todo el caché de permisos.
         """
-        if user_id and department_id:
-            cache_key = f"user_{user_id}_dept_{department_id}"
-            cls._user_permissions_cache.pop(cache_key, None)
-        elif user_id:
-            # Invalidar todos los cachés de este usuario
-            keys_to_remove = [k for k in cls._user_permissions_cache.keys() if k.startswith(f"user_{user_id}_")]
-            for key in keys_to_remove:
-                cls._user_permissions_cache.pop(key, None)
+        if user_id:
+            cls.invalidate_users([user_id])
         else:
-            # Invalidar todo el caché
-            cls._user_permissions_cache.clear()
-            cls._role_permissions_cache.clear()
+            cls._bump_versions([cls.GLOBAL_VERSION_KEY])
+    
+    @classmethod
+    def invalidate_users(cls, user_ids):
+        """Invalida varios usuarios con una sola escritura al caché"""
+        cls._bump_versions([cls.USER_VERSION_KEY.format(user_id=user_id) for user_id in set(user_ids)])
     
     @classmethod
     def invalidate_role_cache(cls, role_id=None):
         """
-        Invalida caché de permisos de rol
+        Invalida caché de un rol, de los roles que heredan de él y de los
+        usuarios que los tienen asignados. Sin role_id invalida todo.
         """
-        if role_id:
-            cls._role_permissions_cache.pop(role_id, None)
-        else:
-            cls._role_permissions_cache.clear()
+        from .index import role_permission_index
+        
+        if not role_id:
+            role_permission_index.invalidate()
+            cls._bump_versions([cls.GLOBAL_VERSION_KEY])
+            return
+        
+        role_ids = role_permission_index.get_descendant_ids(role_id)
+        cls._bump_versions([cls.ROLE_VERSION_KEY.format(role_id=rid) for rid in role_ids])
+        cls.invalidate_users(
+            UserRole.objects.filter(role_id__in=role_ids).values_list('user_id', flat=True).distinct()
+        )
     
     @classmethod
     def user_has_permission(cls, user_id, permission_code, department_id=None):
         """
         Verifica rápidamente si un usuario tiene un permiso específico
         """
-        user_permissions = cls.get_user_permissions(user_id, department_id)
-        return any(perm.permission_code == permission_code for perm in user_permissions)
\ No newline at end of file
+        return permission_code in cls.get_user_permission_codes(user_id, department_id)
+    
+    @classmethod
+    def get_stats(cls):
+        """Contadores de aciertos/fallos del caché en este proceso"""
+        with cls._stats_lock:
+            hits, misses = cls._stats['hits'], cls._stats['misses']
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / total, 4) if total else None,
+            'backend': 'locmem-fallback' if cls.get_cache() is cls._fallback_cache else type(cls.get_cache()).__name__,
+        }
+    
+    @classmethod
+    def reset_stats(cls):
+        with cls._stats_lock:
+            cls._stats = {'hits': 0, 'misses': 0}
+    
+    @classmethod
+    def _count(cls, counter, amount=1):
+        with cls._stats_lock:
+            cls._stats[counter] += amount
+    
+    @staticmethod
+    def _has_pending_changes():
+        # Cambios de permisos sin confirmar en esta transacción: resolver sin
+        # caché para no publicar (ni leer) entradas de un estado que puede revertirse
+        from .index import has_pending_changes
+        return has_pending_changes()
+    
+    @classmethod
+    def _get_versions(cls, keys):
+        versions = cls._cache_call('get_many', keys) or {}
+        missing = [key for key in keys if key not in versions]
+        if missing:
+            initial = cls._new_version()
+            for key in missing:
+                cls._cache_call('add', key, initial, None)
+            versions.update(cls._cache_call('get_many', missing) or {key: initial for key in missing})
+        return versions
+    
+    @classmethod
+    def _bump_versions(cls, keys):
+        if keys:
+            version = cls._new_version()
+            cls._cache_call('set_many', {key: version for key in keys}, None)
+    
+    @staticmethod
+    def _new_version():
+        # Basada en el reloj: no se reutilizan versiones aunque la clave se pierda
+        return time.time_ns()
+    
+    @classmethod
+    def _cache_call(cls, method, *args):
+        cache = cls.get_cache()
+        if cache is cls._fallback_cache:
+            return getattr(cache, method)(*args)
+        try:
+            result = getattr(cache, method)(*args)
+        except Exception as e:
+            if cls._fallback_cache is None:
+                cls._fallback_cache = LocMemCache('core-permissions-fallback', {})
+            cls._backoff = min(
+                max(cls._backoff * 2, getattr(settings, 'PERMISSION_CACHE_RETRY_BACKOFF', 5)),
+                cls.MAX_RETRY_BACKOFF
+            )
+            cls._retry_at = time.monotonic() + cls._backoff
+            logger.warning(
+                "Permission cache backend error, using local memory cache for %ss: %s", cls._backoff, e
+            )
+            return getattr(cls._fallback_cache, method)(*args)
+        cls._backoff = 0.0
+        return result
@@ -1,31 +1,30 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated,IsAdminUser, AllowAny
+from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.exceptions import PermissionDenied
 from django.db import transaction
+from django.db.models import Count
 from django.utils import timezone
 from datetime import timedelta
 from core_organization.models import Department
 from .models import (
-    PermissionModule, GranularPermission, Role, 
-    UserRole, RoleTemplate
+    PermissionModule, GranularPermission, Role, RolePermission,
+    UserRole, RoleTemplate, RoleTemplateJob
+)
+from .permissions import (
+    DEFAULT_GRANULAR_ACTIONS, GranularPermissionRequired, ScopedQuerysetMixin, get_scope_engine
 )
 from .serializers import *
-from .utils import PermissionManager, PermissionCache
+from .utils import PermissionManager, PermissionCache, RoleTemplateManager
 
 class PermissionModuleViewSet(viewsets.ModelViewSet):
     """ViewSet para gestión de módulos de permisos"""
     queryset = PermissionModule.objects.all()
     serializer_class = PermissionModuleSerializer
-    permission_classes = [IsAuthenticated]
-
-    def get_permissions(self):
-        """Permisos diferentes según la acción"""
-        if self.action in ['list', 'retrieve']:
-            permission_classes = [IsAuthenticated]  # 🔥 Lectura para todos
-        else:
-            permission_classes = [IsAuthenticated, IsAdminUser]  # 🔥 Escritura solo admin
-        return [permission() for permission in permission_classes]
+    permission_classes = [IsAuthenticated, GranularPermissionRequired]
+    granular_permission = 'system.permission_modules'
+    scope_department_field = None
     
     def get_queryset(self):
         """Filtrar módulos activos por defecto"""
@@ -39,15 +38,10 @@ class GranularPermissionViewSet(viewsets.ModelViewSet):
     """ViewSet para gestión de permisos granulares"""
     queryset = GranularPermission.objects.all()
     serializer_class = GranularPermissionSerializer
-    permission_classes = [IsAuthenticated]
-    
-    def get_permissions(self):
-        """Permisos diferentes según la acción"""
-        if self.action in ['list', 'retrieve', 'by_module']:
-            permission_classes = [IsAuthenticated]  # 🔥 Lectura para todos
-        else:
-            permission_classes = [IsAuthenticated, IsAdminUser]  # 🔥 Escritura solo admin
-        return [permission() for permission in permission_classes]
+    permission_classes = [IsAuthenticated, GranularPermissionRequired]
+    granular_permission = 'system.permissions'
+    granular_actions = {**DEFAULT_GRANULAR_ACTIONS, 'by_module': 'view'}
+    scope_department_field = None
     
     def get_queryset(self):
         """Optimizar queries con select_related"""
@@ -73,13 +67,28 @@ class RoleViewSet(viewsets.ModelViewSet):
     """ViewSet para gestión de roles"""
     queryset = Role.objects.all()
     serializer_class = RoleSerializer
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, GranularPermissionRequired]
+    granular_permission = 'system.roles'
+    granular_actions = {
+        **DEFAULT_GRANULAR_ACTIONS,
+        'assign_permissions': 'manage',
+        'revoke_permissions': 'manage',
+        'users': 'view',
+    }
+    scope_department_field = None
     filterset_fields = ['role_type', 'is_active', 'is_system_role']
     search_fields = ['name', 'code', 'description']
     
     def get_queryset(self):
         """Optimizar queries con prefetch_related"""
-        return Role.objects.prefetch_related('permissions', 'user_assignments').order_by('role_type', 'name')
+        # Mismo criterio que RoleClosure.permissions_for_roles: solo RolePermission vigentes
+        return Role.objects.prefetch_related('permissions', 'user_assignments').annotate(
+            effective_permissions_count=Count(
+                'ancestor_links__ancestor__rolepermission__permission',
+                filter=RolePermission.objects.active_q(prefix='ancestor_links__ancestor__rolepermission__'),
+                distinct=True
+            )
+        ).order_by('role_type', 'name')
     
     @action(detail=True, methods=['post'])
     def assign_permissions(self, request, pk=None):
@@ -103,6 +112,25 @@ class RoleViewSet(viewsets.ModelViewSet):
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
+    @action(detail=True, methods=['post'])
+    def revoke_permissions(self, request, pk=None):
+        """Revocar múltiples permisos de un rol (system.roles.manage)"""
+        role = self.get_object()
+        serializer = RevokePermissionsFromRoleSerializer(data=request.data)
+        
+        if serializer.is_valid():
+            result = PermissionManager.bulk_revoke_permissions_from_role(
+                role, serializer.validated_data['permission_codes'], request.user
+            )
+            
+            return Response({
+                'success': True,
+                'role': RoleSerializer(role).data,
+                'revocation_result': result
+            })
+        
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
     @action(detail=True, methods=['get'])
     def users(self, request, pk=None):
         """Obtener usuarios que tienen este rol"""
@@ -118,18 +146,53 @@ class RoleViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
-class UserRoleViewSet(viewsets.ModelViewSet):
+class UserRoleViewSet(ScopedQuerysetMixin, viewsets.ModelViewSet):
     """ViewSet para gestión de asignación de roles a usuarios"""
     queryset = UserRole.objects.all()
     serializer_class = UserRoleSerializer
-    permission_classes = [IsAuthenticated]
-    filterset_fields = ['user', 'role', 'department', 'is_temporary', 'is_active']
+    permission_classes = [IsAuthenticated, GranularPermissionRequired]
+    granular_permission = 'users.roles'
+    granular_actions = {
+        **DEFAULT_GRANULAR_ACTIONS,
+        'assign_role': 'create',
+        'user_permissions': 'view',
+        'check_permission': 'view',
+        'check_permissions_batch': 'view',
+    }
+    scope_department_field = 'department'
+    scope_owner_field = 'user'
+    filterset_fields = ['user', 'role', 'department', 'is_temporary']
     
     def get_queryset(self):
-        """Optimizar queries con select_related"""
-        return UserRole.objects.select_related(
+        """Optimizar queries con select_related (?is_active=true|false filtra la vigencia en SQL)"""
+        queryset = UserRole.objects.select_related(
             'user', 'role', 'department', 'assigned_by'
         ).order_by('-assigned_at')
+        
+        is_active = self.request.query_params.get('is_active')
+        if is_active is not None:
+            if is_active.lower() in ('true', '1'):
+                queryset = queryset.active_now()
+            else:
+                queryset = queryset.inactive_now()
+        return queryset
+    
+    def scope_user_ids(self, user_ids):
+        """
+        user_ids cuyas asignaciones de rol están dentro del alcance de la
+        acción actual (scope_queryset sobre UserRole), en el orden recibido
+        """
+        user_ids = list(user_ids)
+        if get_scope_engine(self.request).is_unrestricted():
+            return user_ids
+        visible = set(self.scope_queryset(
+            UserRole.objects.filter(user_id__in=user_ids)
+        ).values_list('user_id', flat=True))
+        return [user_id for user_id in user_ids if user_id in visible]
+    
+    def check_user_in_scope(self, user):
+        if not self.scope_user_ids([user.pk]):
+            raise PermissionDenied('El usuario está fuera del alcance de sus permisos.')
     
     @action(detail=False, methods=['post'])
     def assign_role(self, request):
@@ -141,6 +204,7 @@ class UserRoleViewSet(viewsets.ModelViewSet):
                 user = serializer.validated_data['user_id']
                 role = serializer.validated_data['role_id']
                 department = serializer.validated_data.get('department_id')
+                self.check_scope(department, user.pk)
                 is_temporary = serializer.validated_data['is_temporary']
                 valid_days = serializer.validated_data.get('valid_days')
                 notes = serializer.validated_data.get('notes', '')
@@ -192,6 +256,7 @@ class UserRoleViewSet(viewsets.ModelViewSet):
         if serializer.is_valid():
             user = serializer.validated_data['user_id']
             department = serializer.validated_data.get('department_id')
+            self.check_user_in_scope(user)
             
             permissions = PermissionCache.get_user_permissions(user.id, department.id if department else None)
             
@@ -214,6 +279,7 @@ class UserRoleViewSet(viewsets.ModelViewSet):
             user = serializer.validated_data['user_id']
             permission_code = serializer.validated_data['permission_code']
             department = serializer.validated_data.get('department_id')
+            self.check_user_in_scope(user)
             
             has_permission = PermissionCache.user_has_permission(
                 user.id, 
@@ -229,13 +295,58 @@ class UserRoleViewSet(viewsets.ModelViewSet):
             })
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    @action(detail=False, methods=['post'])
+    def check_permissions_batch(self, request):
+        """
+        Verificar muchos usuarios × muchos permisos en una sola pasada (los
+        usuarios fuera del alcance se omiten y se listan en out_of_scope)
+        """
+        serializer = BatchCheckPermissionSerializer(data=request.data)
+        
+        if serializer.is_valid():
+            requested_ids = serializer.validated_data['user_ids']
+            user_ids = self.scope_user_ids(requested_ids)
+            in_scope = set(user_ids)
+            permission_codes = serializer.validated_data['permission_codes']
+            department = serializer.validated_data.get('department_id')
+            
+            user_codes = PermissionCache.get_many_user_permission_codes(
+                user_ids,
+                department.id if department else None
+            )
+            
+            return Response({
+                'permission_codes': permission_codes,
+                'department': DepartmentSerializer(department).data if department else None,
+                'results': [
+                    {
+                        'user_id': user_id,
+                        'permissions': {code: code in user_codes[user_id] for code in permission_codes}
+                    }
+                    for user_id in user_ids
+                ],
+                'out_of_scope': [user_id for user_id in requested_ids if user_id not in in_scope],
+                'total_checks': len(user_ids) * len(permission_codes)
+            })
+        
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
 class RoleTemplateViewSet(viewsets.ModelViewSet):
     """ViewSet para gestión de plantillas de roles"""
     queryset = RoleTemplate.objects.all()
     serializer_class = RoleTemplateSerializer
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, GranularPermissionRequired]
+    granular_permission = 'system.role_templates'
+    granular_actions = {
+        **DEFAULT_GRANULAR_ACTIONS,
+        'apply_to_user': 'manage',
+        'apply_to_users': 'manage',
+        'job:get': 'view',
+        'job:post': 'manage',
+    }
+    scope_department_field = None
     filterset_fields = ['template_type', 'is_active']
     search_fields = ['name', 'description']
     
@@ -290,11 +401,53 @@ class RoleTemplateViewSet(viewsets.ModelViewSet):
             )
 
 
-class DepartmentViewSet(viewsets.ModelViewSet):
-    """ViewSet para gestión de departamentos (temporal)"""
+    @action(detail=True, methods=['post'])
+    def apply_to_users(self, request, pk=None):
+        """Aplicar plantilla a muchos usuarios (job de Celery por lotes)"""
+        template = self.get_object()
+        serializer = ApplyTemplateToUsersSerializer(data=request.data)
+        
+        if serializer.is_valid():
+            job = RoleTemplateManager.start_template_job(
+                template,
+                serializer.validated_data['user_ids'],
+                assigned_by=request.user,
+                department=serializer.validated_data.get('department_id'),
+                chunk_size=serializer.validated_data['chunk_size']
+            )
+            return Response(RoleTemplateJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+        
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    @action(detail=True, methods=['get', 'post'], url_path=r'jobs/(?P<job_id>\d+)')
+    def job(self, request, pk=None, job_id=None):
+        """Progreso de una aplicación masiva (GET) o reanudarla si falló (POST)"""
+        template = self.get_object()
+        job = template.jobs.filter(pk=job_id).first()
+        if job is None:
+            return Response({'error': 'Job no encontrado'}, status=status.HTTP_404_NOT_FOUND)
+        
+        if request.method == 'POST':
+            if job.status != 'failed':
+                return Response(
+                    {'error': 'Solo se pueden reanudar jobs fallidos'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            RoleTemplateJob.objects.filter(pk=job.pk).update(status='pending', error_message='')
+            RoleTemplateManager.enqueue_template_job(job)
+            job.refresh_from_db()
+            return Response(RoleTemplateJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+        
+        return Response(RoleTemplateJobSerializer(job).data)
+
+
+class DepartmentViewSet(ScopedQuerysetMixin, viewsets.ModelViewSet):
+    """ViewSet para gestión de departamentos (temporal; mismos permisos que core_organization)"""
     queryset = Department.objects.all()
     serializer_class = DepartmentSerializer
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, GranularPermissionRequired]
+    granular_permission = 'organization.departments'
+    scope_department_field = ''
     search_fields = ['name', 'code']
 
 
@@ -303,10 +456,32 @@ from rest_framework.views import APIView
 
 class PermissionUtilitiesView(APIView):
     """Vista para utilidades del sistema de permisos"""
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, GranularPermissionRequired]
+    granular_permission = 'system.permission_sync'
+    granular_actions = {'post': 'manage'}
+    scope_department_field = None
     
     def post(self, request):
-        """Sincronizar permisos de un usuario"""
+        """
+        Sincronizar permisos de un usuario (o de todos con all_users=true, en
+        segundo plano; solo administradores)
+        """
+        if request.data.get('all_users'):
+            from .tasks import sync_all_user_permissions
+            
+            if not request.user.is_staff:
+                return Response(
+                    {'error': 'Solo un administrador puede sincronizar todos los usuarios'},
+                    status=status.HTTP_403_FORBIDDEN
+                )
+            
+            task = sync_all_user_permissions.delay(department_id=request.data.get('department_id'))
+            return Response({
+                'success': True,
+                'message': 'Sincronización de todos los usuarios programada',
+                'task_id': task.id
+            }, status=status.HTTP_202_ACCEPTED)
+        
         serializer = UserPermissionsSerializer(data=request.data)
         
         if serializer.is_valid():
@@ -329,7 +504,10 @@ class PermissionUtilitiesView(APIView):
 
 class SystemPermissionsView(APIView):
     """Vista para operaciones del sistema de permisos"""
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, GranularPermissionRequired]
+    granular_permission = 'system.permission_stats'
+    granular_actions = {'get': 'view'}
+    scope_department_field = None
     
     def get(self, request):
         """Obtener estadísticas del sistema de permisos"""
@@ -342,6 +520,7 @@ class SystemPermissionsView(APIView):
             'active_roles': Role.objects.filter(is_active=True).count(),
             'system_roles': Role.objects.filter(role_type='system').count(),
             'temporary_assignments': UserRole.objects.filter(is_temporary=True).count(),
+            'permission_cache': PermissionCache.get_stats(),
         }
         
         return Response(stats)
\ No newline at end of file
@@ -1,27 +1,29 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.permissions import IsAuthenticated
 from django.db import transaction
 
+from core_permissions.permissions import GranularPermissionRequired, ScopedQuerysetMixin
 from .models import CustomUser, UserProfile
 from .serializers import (
     CustomUserSerializer, CustomUserCreateSerializer,
     CustomUserUpdateSerializer, UserProfileSerializer
 )
 
-class CustomUserViewSet(viewsets.ModelViewSet):
-    """ViewSet para gestión de usuarios"""
+class CustomUserViewSet(ScopedQuerysetMixin, viewsets.ModelViewSet):
+    """ViewSet para gestión de usuarios (alcance: departamento de su asignación organizacional)"""
     queryset = CustomUser.objects.all()
+    granular_permission = 'users.accounts'
+    scope_department_field = 'organizational_assignment__department'
+    scope_owner_field = 'pk'
     
     def get_permissions(self):
         """Permisos diferentes según la acción"""
         if self.action == 'me':
             permission_classes = [IsAuthenticated]  # 🔥 CUALQUIER usuario autenticado
-        elif self.action in ['create', 'update', 'partial_update', 'destroy', 'list']:
-            permission_classes = [IsAuthenticated, IsAdminUser]  # 🔥 Solo admin
         else:
-            permission_classes = [IsAuthenticated]
+            permission_classes = [IsAuthenticated, GranularPermissionRequired]  # 🔥 Según permisos granulares
         
         return [permission() for permission in permission_classes]
     
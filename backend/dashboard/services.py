@@ -1,5 +1,6 @@
 import logging
 from django.db import transaction
+from core_permissions.utils import PermissionCache
 from .models import DashboardWidget, UserDashboard, UserWidget, DashboardPreset
 
 logger = logging.getLogger(__name__)
@@ -31,9 +32,10 @@ class DashboardService:
                 cls._apply_preset_to_dashboard(dashboard, preset)
             else:
                 # Widgets por defecto si no hay preset
-                default_widgets = DashboardWidget.objects.filter(is_active=True)[:4]
+                default_widgets = DashboardWidget.objects.filter(is_active=True).prefetch_related('required_permissions')[:4]
+                vector = PermissionCache.get_user_permission_vector(user.id)
                 for i, widget in enumerate(default_widgets):
-                    if cls._user_can_access_widget(user, widget):
+                    if cls._user_can_access_widget(user, widget, vector):
                         UserWidget.objects.create(
                             user_dashboard=dashboard,
                             widget=widget,
@@ -50,7 +52,7 @@ class DashboardService:
         # Usar tu sistema de roles personalizado
         try:
             if hasattr(user, 'user_roles') and user.user_roles.exists():
-                user_roles = user.user_roles.filter(is_active=True).select_related('role')
+                user_roles = user.user_roles.active_now().select_related('role')
                 for user_role in user_roles:
                     preset = DashboardPreset.objects.filter(
                         required_role=user_role.role
@@ -85,11 +87,12 @@ class DashboardService:
     def get_available_widgets(cls, user):
         """Obtiene widgets disponibles para un usuario - RETORNA QUERYSET CORRECTO"""
         try:
-            all_widgets = DashboardWidget.objects.filter(is_active=True)
+            all_widgets = DashboardWidget.objects.filter(is_active=True).prefetch_related('required_permissions')
             available_widget_ids = []
+            vector = PermissionCache.get_user_permission_vector(user.id)
             
             for widget in all_widgets:
-                if cls._user_can_access_widget(user, widget):
+                if cls._user_can_access_widget(user, widget, vector):
                     available_widget_ids.append(widget.id)
             
             # ✅ CORRECCIÓN DEFINITIVA: Retornar QuerySet real
@@ -103,27 +106,27 @@ class DashboardService:
             return DashboardWidget.objects.none()
     
     @classmethod
-    def _user_can_access_widget(cls, user, widget):
-        """Verifica si un usuario puede acceder a un widget usando tu sistema de permisos"""
-        if not widget.required_permissions.exists():
+    def _user_can_access_widget(cls, user, widget, vector=None):
+        """
+        Verifica si un usuario puede acceder a un widget usando tu sistema de permisos
+
+        Basta con AL MENOS UNO de los permisos requeridos. vector permite
+        reutilizar el PermissionVector del usuario al revisar muchos widgets.
+        """
+        required_slots = [
+            permission.bit_index for permission in widget.required_permissions.all()
+        ]
+        if not required_slots:
             return True
         
-        # ✅ CORREGIDO: Usar tu sistema de permisos granulares
         try:
-            # Obtener todos los permisos del usuario a través de sus roles
-            user_permissions = set()
-            
-            if hasattr(user, 'user_roles'):
-                for user_role in user.user_roles.filter(is_active=True):
-                    role_permissions = user_role.role.get_all_permissions()
-                    user_permissions.update(role_permissions)
-            
-            # Verificar si el usuario tiene todos los permisos requeridos
-            required_permissions = set(widget.required_permissions.all())
-            
-            # Para el widget, el usuario necesita tener AL MENOS UNO de los permisos requeridos
-            # (no necesariamente todos, a menos que quieras cambiar la lógica)
-            return bool(user_permissions & required_permissions)
+            if vector is None:
+                vector = PermissionCache.get_user_permission_vector(user.id)
+            mask = 0
+            for slot in required_slots:
+                if slot is not None:
+                    mask |= 1 << slot
+            return vector.has_any(mask)
             
         except Exception as e:
             logger.error(f"Error verificando permisos para widget {widget.code}: {str(e)}")